@@ -0,0 +1,78 @@
+import logging
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+from app.services.admission_service import AdmissionController, AdmissionRejectedError
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Phần multipart ngoài nội dung file (boundary, header từng phần, các trường form)
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadAdmissionMiddleware:
+    """Từ chối upload trước khi nhận body
+
+    FastAPI đọc hết body multipart trước khi gọi endpoint (và dependency), nên các
+    kiểm tra rẻ phải chạy ở tầng ASGI:
+    - Content-Length vượt MAX_FILE_SIZE: 413 ngay, không đọc body
+    - Hệ thống đã hết ngân sách trang: 429 kèm Retry-After, không đọc body
+    - Body không có Content-Length (chunked): dừng nhận khi vượt giới hạn (413)
+    Số trang thật vẫn được kiểm tra bằng admit() sau khi đọc file.
+    """
+
+    def __init__(self, app, path: str, admission: AdmissionController, max_body_size: int = None):
+        self.app = app
+        self.path = path
+        self.admission = admission
+        self.max_body_size = max_body_size or settings.MAX_FILE_SIZE + MULTIPART_OVERHEAD
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] != self.path:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = None
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                try:
+                    content_length = int(value)
+                except ValueError:
+                    pass
+                break
+
+        if content_length is not None and content_length > self.max_body_size:
+            logger.warning("Từ chối upload %d bytes: vượt giới hạn %d bytes", content_length, self.max_body_size)
+            response = JSONResponse(status_code=413, content={
+                "detail": f"Kích thước request {content_length} vượt quá giới hạn {self.max_body_size}"
+            })
+            await response(scope, receive, send)
+            return
+
+        try:
+            self.admission.check_capacity()
+        except AdmissionRejectedError as e:
+            response = JSONResponse(status_code=429, content={"detail": str(e)},
+                                    headers={"Retry-After": str(e.retry_after)})
+            await response(scope, receive, send)
+            return
+
+        await self.app(scope, self._limited_receive(receive), send)
+
+    def _limited_receive(self, receive):
+        """receive dừng với 413 khi body vượt giới hạn (FastAPI chuyển tiếp HTTPException khi parse body)"""
+        received = 0
+
+        async def limited():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    raise HTTPException(status_code=413,
+                                        detail=f"Kích thước request vượt quá giới hạn {self.max_body_size}")
+            return message
+
+        return limited
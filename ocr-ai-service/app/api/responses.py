@@ -0,0 +1,229 @@
+import gzip
+import hashlib
+import json
+import logging
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, Dict, List, Optional, Type, Union, get_args, get_origin
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+
+from app.models.schemas import DocumentSummary, ProcessingStatus
+from config.settings import settings
+
+# orjson nhanh hơn json chuẩn nhiều lần, fallback json nếu chưa cài
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# MessagePack là tùy chọn (Accept: application/msgpack)
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+# Brotli là tùy chọn, fallback gzip
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Kết quả ở các trạng thái này không thay đổi nữa (trừ khi reprocess, khi đó updated_at đổi)
+IMMUTABLE_STATUSES = {ProcessingStatus.COMPLETED, ProcessingStatus.FAILED}
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+
+def _default(value: Any) -> Any:
+    """Chuyển các kiểu không được hỗ trợ sẵn (pydantic model, datetime...)"""
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return jsonable_encoder(value)
+
+
+def dumps_json(content: Any) -> bytes:
+    """Serialize JSON bằng orjson (fallback json chuẩn)"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dumps_msgpack(content: Any) -> bytes:
+    """Serialize MessagePack (datetime dạng chuỗi ISO như JSON)"""
+    return msgpack.packb(content, default=_default, datetime=False)
+
+
+class FastJSONResponse(JSONResponse):
+    """Response class mặc định của app, serialize bằng orjson"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps_json(content)
+
+
+def _unwrap_model(annotation: Any):
+    """Trả về (model con, có phải list) của một annotation, hoặc (None, False)"""
+    is_list = False
+    for _ in range(3):
+        origin = get_origin(annotation)
+        if origin in (list, List):
+            is_list = True
+            annotation = get_args(annotation)[0]
+        elif origin is Union:
+            args = [arg for arg in get_args(annotation) if arg is not type(None)]
+            annotation = args[0] if len(args) == 1 else annotation
+        else:
+            break
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation, is_list
+    return None, is_list
+
+
+def parse_fields(fields: Optional[str], model: Type[BaseModel]) -> Optional[Dict[str, Any]]:
+    """Chuyển tham số fields=a,b.c thành include spec của pydantic
+
+    Hỗ trợ đường dẫn lồng nhau (kể cả qua list, vd. ocr_results.text).
+    Ném ValueError nếu trường không tồn tại.
+    """
+    if not fields:
+        return None
+    include: Dict[str, Any] = {}
+    for path in fields.split(","):
+        parts = [part.strip() for part in path.split(".") if part.strip()]
+        node, current = include, model
+        for i, part in enumerate(parts):
+            if current is None or part not in current.model_fields:
+                raise ValueError(f"Trường không hợp lệ: {'.'.join(parts[:i + 1])}")
+            if i == len(parts) - 1:
+                node[part] = True
+                break
+            if node.get(part) is True:
+                break  # Đã lấy toàn bộ trường cha
+            current, is_list = _unwrap_model(current.model_fields[part].annotation)
+            node = node.setdefault(part, {})
+            if is_list:
+                node = node.setdefault("__all__", {})
+    return include or None
+
+
+def compute_etag(summary: DocumentSummary, variant: str = "") -> Optional[str]:
+    """ETag cho kết quả bất biến, tính từ summary nên không cần đọc payload
+
+    variant phân biệt các biểu diễn khác nhau (projection, phân trang).
+    """
+    if summary.status not in IMMUTABLE_STATUSES:
+        return None
+    key = f"{summary.document_id}:{summary.updated_at.timestamp()!r}:{summary.status.value}:{variant}"
+    return f'W/"{hashlib.sha1(key.encode("utf-8")).hexdigest()}"'
+
+
+def etag_matches(request: Request, etag: Optional[str]) -> bool:
+    """Kiểm tra If-None-Match (so sánh yếu)"""
+    if etag is None:
+        return False
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
+
+
+def _accepted_encodings(request: Request) -> Dict[str, float]:
+    encodings = {}
+    for item in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = item.strip().partition(";")
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        encodings[name.strip().lower()] = quality
+    return encodings
+
+
+def select_encoding(request: Request) -> Optional[str]:
+    """Chọn encoding nén theo Accept-Encoding (ưu tiên br, sau đó gzip)"""
+    encodings = _accepted_encodings(request)
+    if BROTLI_AVAILABLE and encodings.get("br", 0) > 0:
+        return "br"
+    if encodings.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=settings.RESPONSE_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=settings.RESPONSE_GZIP_LEVEL)
+
+
+def server_timing_header(timings: Optional[Dict[str, float]]) -> Optional[str]:
+    """Chuyển timings (giây) sang header Server-Timing (dur tính bằng ms)"""
+    if not timings:
+        return None
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
+
+
+def wants_msgpack(request: Request) -> bool:
+    """Client yêu cầu MessagePack qua header Accept"""
+    if not MSGPACK_AVAILABLE:
+        return False
+    accept = request.headers.get("accept", "")
+    return any(media_type in accept for media_type in MSGPACK_MEDIA_TYPES)
+
+
+def negotiated_response(request: Request, content: Any, etag: Optional[str] = None,
+                        status_code: int = 200, extra_headers: Optional[Dict[str, str]] = None) -> Response:
+    """Serialize theo Accept (JSON/MessagePack), nén theo Accept-Encoding và gắn ETag
+
+    content có thể là pydantic model, dict hoặc list chứa model.
+    """
+    if isinstance(content, BaseModel):
+        content = content.model_dump()
+
+    if wants_msgpack(request):
+        body, media_type = dumps_msgpack(content), MSGPACK_MEDIA_TYPES[0]
+    else:
+        body, media_type = dumps_json(content), "application/json"
+
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if etag:
+        headers["ETag"] = etag
+    if extra_headers:
+        headers.update(extra_headers)
+
+    if len(body) >= settings.RESPONSE_COMPRESSION_MIN_SIZE:
+        encoding = select_encoding(request)
+        if encoding:
+            body = compress_body(body, encoding)
+            headers["Content-Encoding"] = encoding
+
+    return Response(content=body, status_code=status_code, media_type=media_type, headers=headers)
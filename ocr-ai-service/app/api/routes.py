@@ -1,5 +1,6 @@
-from fastapi import APIRouter, File, UploadFile, HTTPException, Depends, Query, Form
+from fastapi import APIRouter, File, UploadFile, HTTPException, Depends, Query, Form, Request, Path
 from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from typing import Optional, List
 import logging
 from datetime import datetime
@@ -7,9 +8,17 @@ from datetime import datetime
 from app.models.schemas import (
     DocumentProcessingRequest, DocumentProcessingResponse, 
     DocumentListResponse, ErrorResponse, HealthResponse,
-    ConfigurationResponse, DocumentType, FieldType, ProcessingStatus
+    ConfigurationResponse, DocumentType, FieldType, ProcessingStatus, PriorityClass,
+    DocumentSummary
 )
 from app.services.document_service import DocumentService
+from app.services.admission_service import AdmissionController, AdmissionRejectedError
+from app.services.profiling_service import RequestProfiler, ProfilingDeniedError
+from app.services.tracing_service import tracer, InMemorySpanExporter
+from app.services.metrics_service import QUEUE_PAGES, BUSY_WORKERS, ADMISSION_PAGES
+from app.api.responses import (
+    compute_etag, etag_matches, negotiated_response, not_modified, parse_fields, server_timing_header
+)
 from config.settings import settings
 
 logger = logging.getLogger(__name__)
@@ -20,10 +29,38 @@ router = APIRouter()
 # Khởi tạo document service
 document_service = DocumentService()
 
+# Khởi tạo admission controller (giới hạn số trang đang chờ/xử lý)
+admission_controller = AdmissionController()
+
+# Profiling theo yêu cầu (tắt nếu không cấu hình PROFILING_TOKEN)
+request_profiler = RequestProfiler()
+
+# Gauge đọc trạng thái scheduler/admission lúc scrape /metrics
+QUEUE_PAGES.set_callback(lambda: {
+    (priority,): pages for priority, pages in document_service.scheduler.get_status()["queued_pages"].items()
+})
+BUSY_WORKERS.set_callback(lambda: {(): document_service.scheduler.busy_workers})
+ADMISSION_PAGES.set_callback(lambda: {
+    ("queued",): admission_controller.queued_pages,
+    ("in_flight",): admission_controller.in_flight_pages
+})
+
 def get_document_service():
     """Dependency để lấy document service"""
     return document_service
 
+def get_admission_controller():
+    """Dependency để lấy admission controller"""
+    return admission_controller
+
+def get_client_id(request: Request) -> str:
+    """Xác định client cho fair share (API key/header, fallback địa chỉ IP)"""
+    for header in settings.CLIENT_ID_HEADERS.split(","):
+        value = request.headers.get(header.strip())
+        if value:
+            return value
+    return request.client.host if request.client else "anonymous"
+
 @router.get("/health", response_model=HealthResponse, tags=["System"])
 async def health_check():
     """Kiểm tra sức khỏe của service"""
@@ -42,7 +79,7 @@ async def health_check():
             services=services_status
         )
     except Exception as e:
-        logger.error(f"Health check failed: {str(e)}")
+        logger.error("Health check failed: %s", e)
         return HealthResponse(
             status="unhealthy",
             version=settings.VERSION,
@@ -50,6 +87,20 @@ async def health_check():
             services={"error": str(e)}
         )
 
+@router.get("/load", tags=["System"])
+async def get_load(
+    admission: AdmissionController = Depends(get_admission_controller)
+):
+    """
+    Lấy tải hiện tại của node (dùng cho load balancer)
+    
+    Trả về 503 khi node đã hết ngân sách trang để load balancer chuyển request sang node khác.
+    """
+    load = admission.get_load()
+    load["scheduler"] = document_service.scheduler.get_status()
+    status_code = 503 if load["saturated"] else 200
+    return JSONResponse(status_code=status_code, content=load)
+
 @router.get("/config", response_model=ConfigurationResponse, tags=["System"])
 async def get_configuration():
     """Lấy cấu hình hệ thống"""
@@ -63,12 +114,17 @@ async def get_configuration():
 
 @router.post("/documents/process", response_model=DocumentProcessingResponse, tags=["Document Processing"])
 async def process_document(
+    http_request: Request,
     file: UploadFile = File(..., description="File PDF cần xử lý"),
     document_type: Optional[DocumentType] = Form(None, description="Loại tài liệu (tự động nhận diện nếu không chỉ định)"),
     custom_fields: Optional[str] = Form(None, description="Danh sách trường tùy chỉnh (cách nhau bởi dấu phẩy)"),
     ocr_language: Optional[str] = Form("vie+eng", description="Ngôn ngữ OCR"),
     ai_model: Optional[str] = Form(None, description="Model AI sử dụng"),
-    service: DocumentService = Depends(get_document_service)
+    priority: Optional[PriorityClass] = Form(None, description="Lớp ưu tiên (INTERACTIVE|BULK, tự động theo số trang nếu không chỉ định)"),
+    profile: Optional[str] = Query(None, description="Token profiling (tương đương header X-Profile-Token)"),
+    client_id: str = Depends(get_client_id),
+    service: DocumentService = Depends(get_document_service),
+    admission: AdmissionController = Depends(get_admission_controller)
 ):
     """
     Xử lý tài liệu PDF với OCR và AI
@@ -78,16 +134,43 @@ async def process_document(
     - **custom_fields**: Danh sách trường tùy chỉnh
     - **ocr_language**: Ngôn ngữ OCR (mặc định: vie+eng)
     - **ai_model**: Model AI sử dụng
+    - **priority**: Lớp ưu tiên (INTERACTIVE cho tài liệu ít trang, BULK cho xử lý hàng loạt)
+    
+    Client được xác định qua header X-API-Key/X-Client-ID để chia sẻ công bằng worker.
     
     Trả về kết quả xử lý bao gồm:
     - Kết quả OCR cho từng trang
     - Dữ liệu được trích xuất bởi AI
     - Confidence score và thời gian xử lý
+    
+    Trả về 429 kèm header Retry-After khi số trang đang chờ/xử lý vượt ngân sách.
+    
+    Gửi token profiling (header X-Profile-Token hoặc query profile) để chạy request
+    dưới profiler; header X-Profile-Id của response là tên file trong PROFILING_DIR.
     """
+    # Kiểm tra token profiling trước khi nhận việc
+    profile_token = http_request.headers.get("x-profile-token") or profile
+    if profile_token is not None:
+        try:
+            request_profiler.authorize(profile_token)
+        except ProfilingDeniedError as e:
+            raise HTTPException(status_code=403, detail=str(e))
+    
+    # Đọc nội dung file
+    file_content = await file.read()
+    
+    # Admission control theo số trang
+    page_count = await run_in_threadpool(service.estimate_page_count, file_content)
+    try:
+        ticket = admission.admit(page_count)
+    except AdmissionRejectedError as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    
     try:
-        # Đọc nội dung file
-        file_content = await file.read()
-        
         # Xử lý custom_fields
         custom_fields_list = None
         if custom_fields:
@@ -98,59 +181,110 @@ async def process_document(
             document_type=document_type,
             custom_fields=custom_fields_list,
             ocr_language=ocr_language,
-            ai_model=ai_model
+            ai_model=ai_model,
+            priority=priority,
+            client_id=client_id
         )
         
-        # Xử lý tài liệu
-        result = service.process_document(file_content, file.filename, request)
+        # Xử lý tài liệu trong threadpool để không chặn event loop
+        headers = {}
+        if profile_token is not None and request_profiler.try_acquire():
+            result, profile_id = await run_in_threadpool(
+                request_profiler.run, service.process_document, file_content, file.filename, request, ticket,
+                thread_ids=service.scheduler.thread_ids
+            )
+            headers["X-Profile-Id"] = profile_id
+        else:
+            result = await run_in_threadpool(service.process_document, file_content, file.filename, request, ticket)
+            if profile_token is not None:
+                headers["X-Profile-Status"] = "rate_limited"
         
-        return result
+        server_timing = server_timing_header(result.timings)
+        if server_timing:
+            headers["Server-Timing"] = server_timing
+        return negotiated_response(http_request, result, extra_headers=headers)
         
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logger.error(f"Lỗi xử lý tài liệu: {str(e)}")
+        logger.error("Lỗi xử lý tài liệu: %s", e)
         raise HTTPException(status_code=500, detail=f"Lỗi xử lý tài liệu: {str(e)}")
+    finally:
+        ticket.release()
 
+# Endpoint đọc store (SQLite, giải nén, serialize đều là thao tác đồng bộ) khai báo def
+# để FastAPI chạy trong threadpool thay vì chặn event loop
 @router.get("/documents/{document_id}", response_model=DocumentProcessingResponse, tags=["Document Management"])
-async def get_document(
+def get_document(
     document_id: str,
+    request: Request,
+    fields: Optional[str] = Query(None, description="Chỉ trả về các trường này (vd. status,ai_extraction.fields)"),
     service: DocumentService = Depends(get_document_service)
 ):
     """
     Lấy thông tin tài liệu đã xử lý
     
     - **document_id**: ID của tài liệu
+    - **fields**: Danh sách trường cần lấy, cách nhau bởi dấu phẩy, hỗ trợ đường dẫn lồng nhau
+      (vd. `status,ai_extraction.fields`). Nếu chỉ chọn các trường tóm tắt thì không cần đọc kết quả OCR.
+    
+    Kết quả đã hoàn thành có ETag; gửi If-None-Match để nhận 304 khi không thay đổi.
     """
+    try:
+        include = parse_fields(fields, DocumentProcessingResponse)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    summary = service.get_summary(document_id)
+    if not summary:
+        raise HTTPException(status_code=404, detail="Không tìm thấy tài liệu")
+    
+    etag = compute_etag(summary, variant=f"fields={fields or ''}")
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    
+    # Projection chỉ gồm trường tóm tắt: trả về trực tiếp từ summary
+    if include and all(value is True and key in DocumentSummary.model_fields for key, value in include.items()):
+        return negotiated_response(request, summary.model_dump(include=include), etag)
+    
     result = service.get_document(document_id)
     if not result:
         raise HTTPException(status_code=404, detail="Không tìm thấy tài liệu")
     
-    return result
+    return negotiated_response(request, result.model_dump(include=include), etag)
 
 @router.get("/documents", response_model=DocumentListResponse, tags=["Document Management"])
-async def list_documents(
+def list_documents(
+    request: Request,
     page: int = Query(1, ge=1, description="Số trang"),
     page_size: int = Query(10, ge=1, le=100, description="Kích thước trang"),
+    cursor: Optional[str] = Query(None, description="Cursor từ next_cursor của trang trước"),
     service: DocumentService = Depends(get_document_service)
 ):
     """
-    Lấy danh sách tài liệu đã xử lý
+    Lấy danh sách tóm tắt tài liệu đã xử lý (không kèm kết quả OCR)
     
-    - **page**: Số trang (bắt đầu từ 1)
+    - **page**: Số trang (bắt đầu từ 1, bị bỏ qua khi có cursor)
     - **page_size**: Kích thước trang (tối đa 100)
+    - **cursor**: Keyset cursor (`next_cursor` của trang trước), nhanh hơn phân trang theo page
+    
+    Kết quả OCR đầy đủ lấy qua `/documents/{document_id}` hoặc `/documents/{document_id}/ocr`.
     """
-    result = service.list_documents(page, page_size)
+    try:
+        result = service.list_documents(page, page_size, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    return DocumentListResponse(
+    return negotiated_response(request, DocumentListResponse(
         documents=result["documents"],
         total=result["total"],
         page=result["page"],
-        page_size=result["page_size"]
-    )
+        page_size=result["page_size"],
+        next_cursor=result["next_cursor"]
+    ))
 
 @router.delete("/documents/{document_id}", tags=["Document Management"])
-async def delete_document(
+def delete_document(
     document_id: str,
     service: DocumentService = Depends(get_document_service)
 ):
@@ -166,7 +300,7 @@ async def delete_document(
     return {"message": "Đã xóa tài liệu thành công"}
 
 @router.post("/documents/{document_id}/reprocess", response_model=DocumentProcessingResponse, tags=["Document Processing"])
-async def reprocess_document(
+def reprocess_document(
     document_id: str,
     document_type: Optional[DocumentType] = Form(None, description="Loại tài liệu mới"),
     custom_fields: Optional[str] = Form(None, description="Danh sách trường tùy chỉnh mới"),
@@ -200,11 +334,11 @@ async def reprocess_document(
         return result
         
     except Exception as e:
-        logger.error(f"Lỗi xử lý lại tài liệu: {str(e)}")
+        logger.error("Lỗi xử lý lại tài liệu: %s", e)
         raise HTTPException(status_code=500, detail=f"Lỗi xử lý lại tài liệu: {str(e)}")
 
 @router.get("/statistics", tags=["Analytics"])
-async def get_statistics(
+def get_statistics(
     service: DocumentService = Depends(get_document_service)
 ):
     """
@@ -216,11 +350,38 @@ async def get_statistics(
     - Thống kê theo loại tài liệu
     - Thời gian xử lý trung bình
     - Confidence score trung bình
+    - Độ trễ từng stage (p50/p95/p99)
+    - Throughput (tài liệu/phút, trang/phút) trong 1, 5, 15 phút gần nhất
     """
     return service.get_statistics()
 
+def get_trace_exporter() -> InMemorySpanExporter:
+    """Dependency lấy exporter in-memory (404 nếu tracing không lưu trong bộ nhớ)"""
+    if not isinstance(tracer.exporter, InMemorySpanExporter):
+        raise HTTPException(status_code=404, detail="Tracing in-memory chưa được bật (TRACING_EXPORTER=memory)")
+    return tracer.exporter
+
+@router.get("/traces", tags=["Analytics"])
+async def list_traces(
+    limit: int = Query(50, ge=1, le=500, description="Số trace tối đa"),
+    exporter: InMemorySpanExporter = Depends(get_trace_exporter)
+):
+    """Danh sách trace gần nhất (mới nhất trước), kèm document_id và thời lượng"""
+    return {"traces": [trace.summary() for trace in exporter.list(limit)]}
+
+@router.get("/traces/{trace_id}", tags=["Analytics"])
+async def get_trace(
+    trace_id: str,
+    exporter: InMemorySpanExporter = Depends(get_trace_exporter)
+):
+    """Toàn bộ span của một trace theo định dạng OTLP/JSON"""
+    trace = exporter.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy trace")
+    return trace.to_otlp()
+
 @router.post("/maintenance/cleanup", tags=["System"])
-async def cleanup_old_documents(
+def cleanup_old_documents(
     max_age_hours: int = Query(24, ge=1, description="Tuổi tối đa (giờ)"),
     service: DocumentService = Depends(get_document_service)
 ):
@@ -233,38 +394,87 @@ async def cleanup_old_documents(
     return {"message": f"Đã dọn dẹp {cleaned_count} tài liệu cũ"}
 
 @router.get("/documents/{document_id}/ocr", tags=["Document Details"])
-async def get_document_ocr(
+def get_document_ocr(
     document_id: str,
+    request: Request,
     page: Optional[int] = Query(None, ge=1, description="Số trang cụ thể"),
+    cursor: Optional[int] = Query(None, ge=1, description="Bắt đầu từ trang này (next_cursor của lần gọi trước)"),
+    limit: Optional[int] = Query(None, ge=1, le=settings.OCR_PAGE_MAX_LIMIT, description="Số trang tối đa mỗi lần gọi"),
     service: DocumentService = Depends(get_document_service)
 ):
     """
     Lấy kết quả OCR chi tiết của tài liệu
     
     - **document_id**: ID của tài liệu
-    - **page**: Số trang cụ thể (nếu không chỉ định sẽ trả về tất cả)
+    - **page**: Số trang cụ thể
+    - **cursor**, **limit**: Phân trang theo trang tài liệu (mặc định tối đa OCR_PAGE_MAX_LIMIT trang),
+      dùng `next_cursor` để lấy phần tiếp theo
     """
-    document = service.get_document(document_id)
-    if not document:
+    summary = service.get_summary(document_id)
+    if not summary:
         raise HTTPException(status_code=404, detail="Không tìm thấy tài liệu")
     
-    ocr_results = document.ocr_results
+    etag = compute_etag(summary, variant=f"ocr:{page}:{cursor}:{limit}")
+    if etag_matches(request, etag):
+        return not_modified(etag)
     
     # Lọc theo trang nếu được chỉ định
     if page is not None:
-        ocr_results = [result for result in ocr_results if result.page_number == page]
-        if not ocr_results:
-            raise HTTPException(status_code=404, detail="Không tìm thấy trang")
+        result = service.get_ocr_pages(document_id, cursor=page, limit=1)
+        if result:
+            result["next_cursor"] = None
+            if not result["ocr_results"] or result["ocr_results"][0].page_number != page:
+                raise HTTPException(status_code=404, detail="Không tìm thấy trang")
+    else:
+        result = service.get_ocr_pages(document_id, cursor=cursor, limit=limit)
     
-    return {
-        "document_id": document_id,
-        "total_pages": document.total_pages,
-        "ocr_results": ocr_results
-    }
+    if not result:
+        raise HTTPException(status_code=404, detail="Không tìm thấy tài liệu")
+    
+    return negotiated_response(request, result, etag)
+
+@router.get("/documents/{document_id}/pages/{page_number}/words", tags=["Document Details"])
+def get_page_words(
+    document_id: str,
+    request: Request,
+    page_number: int = Path(..., ge=1, description="Số trang"),
+    bbox: Optional[str] = Query(None, description="Vùng cần lấy: x0,y0,x1,y1 (pixel ảnh trang)"),
+    service: DocumentService = Depends(get_document_service)
+):
+    """
+    Lấy vị trí từng từ trên một trang, có thể lọc theo vùng
+    
+    - **document_id**: ID của tài liệu
+    - **page_number**: Số trang
+    - **bbox**: Vùng chữ nhật `x0,y0,x1,y1`; trả về các từ giao với vùng (bỏ trống = tất cả)
+    """
+    region = None
+    if bbox:
+        try:
+            region = tuple(int(float(value)) for value in bbox.split(","))
+        except ValueError:
+            region = ()
+        if len(region) != 4:
+            raise HTTPException(status_code=400, detail="bbox phải có dạng x0,y0,x1,y1")
+    
+    summary = service.get_summary(document_id)
+    if not summary:
+        raise HTTPException(status_code=404, detail="Không tìm thấy tài liệu")
+    
+    etag = compute_etag(summary, variant=f"words:{page_number}:{region}")
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    
+    result = service.get_page_words(document_id, page_number, region)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Không có dữ liệu vị trí từ cho trang này")
+    
+    return negotiated_response(request, result, etag)
 
 @router.get("/documents/{document_id}/fields", tags=["Document Details"])
-async def get_document_fields(
+def get_document_fields(
     document_id: str,
+    request: Request,
     service: DocumentService = Depends(get_document_service)
 ):
     """
@@ -272,15 +482,23 @@ async def get_document_fields(
     
     - **document_id**: ID của tài liệu
     """
+    summary = service.get_summary(document_id)
+    if not summary:
+        raise HTTPException(status_code=404, detail="Không tìm thấy tài liệu")
+    
+    etag = compute_etag(summary, variant="fields")
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    
     document = service.get_document(document_id)
     if not document:
         raise HTTPException(status_code=404, detail="Không tìm thấy tài liệu")
     
-    return {
+    return negotiated_response(request, {
         "document_id": document_id,
         "document_type": document.document_type,
         "fields": document.ai_extraction.fields,
         "confidence_score": document.ai_extraction.confidence_score
-    }
+    }, etag)
 
 # Note: Exception handlers sẽ được thêm vào main.py
@@ -0,0 +1,215 @@
+import struct
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config.settings import settings
+
+# Header: magic, version, width, height, grid_size, số từ, số phần tử grid, độ dài text buffer
+_HEADER = struct.Struct("<4sHHHHIII")
+_MAGIC = b"PGEO"
+_VERSION = 1
+_INT16_MAX = np.iinfo(np.int16).max
+
+Box = Tuple[int, int, int, int]
+
+
+class PageGeometry:
+    """Hình học từ (word) của một trang OCR lưu theo cột
+
+    - text: một buffer UTF-8 duy nhất, offsets[i]:offsets[i + 1] là từ thứ i
+    - boxes: int16 (x0, y0, x1, y1) theo pixel của ảnh trang
+    - confidences: float16 trong [0, 1]
+    - lines: chỉ số dòng của từ
+    - grid index: trang chia grid_size x grid_size ô, mỗi ô chứa danh sách
+      chỉ số từ giao với ô (dạng CSR: cell_starts + cell_items)
+
+    to_bytes()/from_bytes() dùng np.frombuffer nên truy vấn vùng chỉ giải mã
+    text của các từ khớp, không cần deserialize cả trang.
+    """
+
+    __slots__ = ("width", "height", "grid_size", "offsets", "boxes", "confidences",
+                 "lines", "cell_starts", "cell_items", "text")
+
+    def __init__(self, width: int, height: int, grid_size: int, offsets: np.ndarray,
+                 boxes: np.ndarray, confidences: np.ndarray, lines: np.ndarray,
+                 cell_starts: np.ndarray, cell_items: np.ndarray, text: bytes):
+        self.width = width
+        self.height = height
+        self.grid_size = grid_size
+        self.offsets = offsets
+        self.boxes = boxes
+        self.confidences = confidences
+        self.lines = lines
+        self.cell_starts = cell_starts
+        self.cell_items = cell_items
+        self.text = text
+
+    def __len__(self) -> int:
+        return len(self.confidences)
+
+    @classmethod
+    def from_words(cls, words: Iterable[Tuple[str, Sequence[float], float, int]],
+                   width: int, height: int, grid_size: int = None) -> "PageGeometry":
+        """Dựng từ danh sách (text, (x0, y0, x1, y1), confidence 0-1, line)"""
+        grid_size = grid_size or settings.WORD_GRID_SIZE
+        encoded: List[bytes] = []
+        boxes: List[Sequence[float]] = []
+        confidences: List[float] = []
+        lines: List[int] = []
+        for text, box, confidence, line in words:
+            encoded.append(text.encode("utf-8"))
+            boxes.append(box)
+            confidences.append(confidence)
+            lines.append(line)
+
+        offsets = np.zeros(len(encoded) + 1, dtype=np.uint32)
+        if encoded:
+            np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        box_array = np.clip(np.asarray(boxes, dtype=np.float64).reshape(-1, 4), 0, _INT16_MAX).astype(np.int16)
+        width = int(min(max(width, 1), _INT16_MAX))
+        height = int(min(max(height, 1), _INT16_MAX))
+        cell_starts, cell_items = cls._build_grid(box_array, width, height, grid_size)
+        return cls(
+            width, height, grid_size, offsets, box_array,
+            np.clip(np.asarray(confidences, dtype=np.float32), 0, 1).astype(np.float16),
+            np.asarray(lines, dtype=np.int32), cell_starts, cell_items, b"".join(encoded)
+        )
+
+    @classmethod
+    def from_tesseract_data(cls, data: Dict[str, List[Any]], width: int, height: int) -> "PageGeometry":
+        """Dựng từ output image_to_data(output_type=DICT) của Tesseract"""
+        line_ids: Dict[Tuple[int, int, int], int] = {}
+        words = []
+        for i, text in enumerate(data.get("text", [])):
+            text = str(text).strip()
+            confidence = float(data["conf"][i])
+            if not text or confidence < 0:
+                continue
+            line_key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+            line = line_ids.setdefault(line_key, len(line_ids))
+            left, top = data["left"][i], data["top"][i]
+            box = (left, top, left + data["width"][i], top + data["height"][i])
+            words.append((text, box, confidence / 100.0, line))
+        return cls.from_words(words, width, height)
+
+    @classmethod
+    def from_polygons(cls, items: Iterable[Tuple[Sequence[Sequence[float]], str, float]],
+                      width: int, height: int) -> "PageGeometry":
+        """Dựng từ kết quả dạng (polygon, text, confidence) của EasyOCR/PaddleOCR
+
+        Mỗi phần tử là một dòng/cụm từ nên chỉ số dòng chính là thứ tự phần tử.
+        """
+        words = []
+        for line, (polygon, text, confidence) in enumerate(items):
+            points = np.asarray(polygon, dtype=np.float64).reshape(-1, 2)
+            box = (points[:, 0].min(), points[:, 1].min(), points[:, 0].max(), points[:, 1].max())
+            words.append((str(text), box, float(confidence), line))
+        return cls.from_words(words, width, height)
+
+    @staticmethod
+    def _cell_range(box: np.ndarray, width: int, height: int, grid_size: int) -> Tuple[int, int, int, int]:
+        cx0 = min(int(box[0]) * grid_size // width, grid_size - 1)
+        cy0 = min(int(box[1]) * grid_size // height, grid_size - 1)
+        cx1 = min(int(box[2]) * grid_size // width, grid_size - 1)
+        cy1 = min(int(box[3]) * grid_size // height, grid_size - 1)
+        return cx0, cy0, cx1, cy1
+
+    @classmethod
+    def _build_grid(cls, boxes: np.ndarray, width: int, height: int,
+                    grid_size: int) -> Tuple[np.ndarray, np.ndarray]:
+        buckets: List[List[int]] = [[] for _ in range(grid_size * grid_size)]
+        for index, box in enumerate(boxes):
+            cx0, cy0, cx1, cy1 = cls._cell_range(box, width, height, grid_size)
+            for cy in range(cy0, cy1 + 1):
+                row = cy * grid_size
+                for cx in range(cx0, cx1 + 1):
+                    buckets[row + cx].append(index)
+        cell_starts = np.zeros(len(buckets) + 1, dtype=np.uint32)
+        np.cumsum([len(b) for b in buckets], out=cell_starts[1:])
+        cell_items = np.fromiter((i for b in buckets for i in b), dtype=np.uint32, count=int(cell_starts[-1]))
+        return cell_starts, cell_items
+
+    def query(self, bbox: Optional[Box] = None) -> np.ndarray:
+        """Chỉ số các từ giao với bbox (theo thứ tự đọc); bbox None = tất cả"""
+        if bbox is None:
+            return np.arange(len(self), dtype=np.uint32)
+        x0, y0, x1, y1 = bbox
+        if x1 < x0 or y1 < y0 or not len(self):
+            return np.empty(0, dtype=np.uint32)
+
+        clipped = np.array([max(x0, 0), max(y0, 0), min(x1, self.width - 1), min(y1, self.height - 1)])
+        cx0, cy0, cx1, cy1 = self._cell_range(clipped, self.width, self.height, self.grid_size)
+        chunks = []
+        for cy in range(cy0, cy1 + 1):
+            row = cy * self.grid_size
+            start, end = self.cell_starts[row + cx0], self.cell_starts[row + cx1 + 1]
+            chunks.append(self.cell_items[start:end])
+        candidates = np.unique(np.concatenate(chunks)) if chunks else np.empty(0, dtype=np.uint32)
+        if not len(candidates):
+            return candidates
+
+        boxes = self.boxes[candidates]
+        mask = (boxes[:, 0] <= x1) & (boxes[:, 2] >= x0) & (boxes[:, 1] <= y1) & (boxes[:, 3] >= y0)
+        return candidates[mask]
+
+    def word_text(self, index: int) -> str:
+        return bytes(self.text[self.offsets[index]:self.offsets[index + 1]]).decode("utf-8")
+
+    def words(self, indices: Iterable[int]) -> List[Dict[str, Any]]:
+        """Giải mã các từ theo chỉ số"""
+        return [
+            {
+                "text": self.word_text(i),
+                "box": self.boxes[i].tolist(),
+                "confidence": round(float(self.confidences[i]), 3),
+                "line": int(self.lines[i])
+            }
+            for i in indices
+        ]
+
+    def extent(self) -> Optional[Dict[str, int]]:
+        """Khung bao của tất cả các từ (dùng cho OCRResult.bounding_box)"""
+        if not len(self):
+            return None
+        x0, y0 = self.boxes[:, :2].min(axis=0).tolist()
+        x1, y1 = self.boxes[:, 2:].max(axis=0).tolist()
+        return {"x": x0, "y": y0, "width": x1 - x0, "height": y1 - y0}
+
+    def to_bytes(self) -> bytes:
+        header = _HEADER.pack(_MAGIC, _VERSION, self.width, self.height, self.grid_size,
+                              len(self), len(self.cell_items), len(self.text))
+        return b"".join([
+            header,
+            self.offsets.astype("<u4").tobytes(),
+            self.cell_starts.astype("<u4").tobytes(),
+            self.cell_items.astype("<u4").tobytes(),
+            self.lines.astype("<i4").tobytes(),
+            self.boxes.astype("<i2").tobytes(),
+            self.confidences.astype("<f2").tobytes(),
+            bytes(self.text)
+        ])
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "PageGeometry":
+        """Đọc lại từ bytes (zero-copy, text được giải mã lười khi truy vấn)"""
+        magic, version, width, height, grid_size, n_words, n_items, text_len = _HEADER.unpack_from(data)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("Dữ liệu hình học trang không hợp lệ")
+        buffer = memoryview(data)
+        position = _HEADER.size
+
+        def take(dtype: str, count: int) -> np.ndarray:
+            nonlocal position
+            array = np.frombuffer(buffer, dtype=dtype, count=count, offset=position)
+            position += array.nbytes
+            return array
+
+        offsets = take("<u4", n_words + 1)
+        cell_starts = take("<u4", grid_size * grid_size + 1)
+        cell_items = take("<u4", n_items)
+        lines = take("<i4", n_words)
+        boxes = take("<i2", n_words * 4).reshape(-1, 4)
+        confidences = take("<f2", n_words)
+        text = buffer[position:position + text_len]
+        return cls(width, height, grid_size, offsets, boxes, confidences, lines, cell_starts, cell_items, text)
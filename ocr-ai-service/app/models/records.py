@@ -0,0 +1,71 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from app.models.geometry import PageGeometry
+from app.models.schemas import OCRResult, DocumentField, AIExtractionResult, FieldType
+
+
+# Record nội bộ dùng trong pipeline OCR/AI. Không validate khi tạo nên rẻ hơn
+# pydantic model nhiều lần; chỉ chuyển sang schema một lần ở ranh giới API.
+
+
+@dataclass(slots=True)
+class PageRecord:
+    """Kết quả OCR của một trang"""
+    page_number: int
+    text: str = ""
+    confidence_score: float = 0.0
+    bounding_box: Optional[Dict[str, int]] = None
+    # Hình học từng từ, lưu riêng khỏi OCRResult
+    geometry: Optional[PageGeometry] = None
+    timings: Optional[Dict[str, float]] = None
+
+    def to_schema(self) -> OCRResult:
+        bounding_box = self.bounding_box
+        if bounding_box is None and self.geometry is not None:
+            bounding_box = self.geometry.extent()
+        return OCRResult(
+            text=self.text,
+            confidence_score=min(max(self.confidence_score, 0.0), 1.0),
+            bounding_box=bounding_box,
+            page_number=self.page_number,
+            timings=self.timings
+        )
+
+
+@dataclass(slots=True)
+class FieldRecord:
+    """Một trường dữ liệu được trích xuất"""
+    name: str
+    field_type: FieldType
+    value: Optional[str] = None
+    confidence_score: float = 0.0
+    is_required: bool = False
+    is_verified: bool = False
+    original_text: Optional[str] = None
+
+    def to_schema(self) -> DocumentField:
+        return DocumentField(
+            name=self.name,
+            value=self.value,
+            field_type=self.field_type,
+            confidence_score=min(max(self.confidence_score, 0.0), 1.0),
+            is_required=self.is_required,
+            is_verified=self.is_verified,
+            original_text=self.original_text
+        )
+
+
+@dataclass(slots=True)
+class ExtractionRecord:
+    """Kết quả AI extraction của một tài liệu"""
+    fields: List[FieldRecord] = field(default_factory=list)
+    confidence_score: float = 0.0
+    processing_time: float = 0.0
+
+    def to_schema(self) -> AIExtractionResult:
+        return AIExtractionResult(
+            fields=[f.to_schema() for f in self.fields],
+            confidence_score=min(max(self.confidence_score, 0.0), 1.0),
+            processing_time=self.processing_time
+        )
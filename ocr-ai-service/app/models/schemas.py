@@ -16,6 +16,11 @@ class ProcessingStatus(str, Enum):
     COMPLETED = "COMPLETED"
     FAILED = "FAILED"
 
+class PriorityClass(str, Enum):
+    """Lớp ưu tiên xử lý"""
+    INTERACTIVE = "INTERACTIVE"  # Người dùng đang chờ (ít trang)
+    BULK = "BULK"  # Xử lý hàng loạt
+
 class FieldType(str, Enum):
     """Loại trường dữ liệu"""
     TEXT = "TEXT"
@@ -39,6 +44,7 @@ class OCRResult(BaseModel):
     confidence_score: float = Field(..., ge=0, le=1, description="Điểm tin cậy")
     bounding_box: Optional[Dict[str, int]] = Field(None, description="Vị trí vùng text")
     page_number: int = Field(..., description="Số trang")
+    timings: Optional[Dict[str, float]] = Field(None, description="Thời gian từng stage của trang (giây)")
 
 class AIExtractionResult(BaseModel):
     """Kết quả trích xuất AI"""
@@ -52,6 +58,8 @@ class DocumentProcessingRequest(BaseModel):
     custom_fields: Optional[List[str]] = Field(None, description="Danh sách trường tùy chỉnh")
     ocr_language: Optional[str] = Field("vie+eng", description="Ngôn ngữ OCR")
     ai_model: Optional[str] = Field(None, description="Model AI sử dụng")
+    priority: Optional[PriorityClass] = Field(None, description="Lớp ưu tiên (tự động theo số trang nếu không chỉ định)")
+    client_id: Optional[str] = Field(None, description="Định danh client dùng cho fair share")
     
 class DocumentProcessingResponse(BaseModel):
     """Response xử lý tài liệu"""
@@ -65,13 +73,44 @@ class DocumentProcessingResponse(BaseModel):
     processing_time: float = Field(..., description="Thời gian xử lý tổng (giây)")
     created_at: datetime = Field(..., description="Thời gian tạo")
     updated_at: Optional[datetime] = Field(None, description="Thời gian cập nhật")
+    timings: Optional[Dict[str, float]] = Field(None, description="Thời gian từng stage của tài liệu (giây)")
+    
+class DocumentSummary(BaseModel):
+    """Thông tin tóm tắt tài liệu (không kèm kết quả OCR)"""
+    document_id: str = Field(..., description="ID tài liệu")
+    filename: str = Field(..., description="Tên file")
+    document_type: DocumentType = Field(..., description="Loại tài liệu")
+    status: ProcessingStatus = Field(..., description="Trạng thái xử lý")
+    total_pages: int = Field(..., description="Tổng số trang")
+    processing_time: float = Field(..., description="Thời gian xử lý tổng (giây)")
+    ai_processing_time: float = Field(..., description="Thời gian trích xuất AI (giây)")
+    confidence_score: float = Field(..., description="Điểm tin cậy tổng thể")
+    created_at: datetime = Field(..., description="Thời gian tạo")
+    updated_at: Optional[datetime] = Field(None, description="Thời gian cập nhật")
+    
+    @classmethod
+    def from_document(cls, document: "DocumentProcessingResponse") -> "DocumentSummary":
+        """Tạo summary từ kết quả xử lý đầy đủ"""
+        return cls(
+            document_id=document.document_id,
+            filename=document.filename,
+            document_type=document.document_type,
+            status=document.status,
+            total_pages=document.total_pages,
+            processing_time=document.processing_time,
+            ai_processing_time=document.ai_extraction.processing_time,
+            confidence_score=document.ai_extraction.confidence_score,
+            created_at=document.created_at,
+            updated_at=document.updated_at
+        )
     
 class DocumentListResponse(BaseModel):
     """Response danh sách tài liệu"""
-    documents: List[DocumentProcessingResponse] = Field(..., description="Danh sách tài liệu")
-    total: int = Field(..., description="Tổng số tài liệu")
+    documents: List[DocumentSummary] = Field(..., description="Danh sách tài liệu (tóm tắt)")
+    total: Optional[int] = Field(None, description="Tổng số tài liệu (không tính khi phân trang bằng cursor)")
     page: int = Field(..., description="Trang hiện tại")
     page_size: int = Field(..., description="Kích thước trang")
+    next_cursor: Optional[str] = Field(None, description="Cursor để lấy trang tiếp theo")
     
 class ErrorResponse(BaseModel):
     """Response lỗi"""
@@ -0,0 +1,169 @@
+import logging
+import math
+import threading
+import time
+from typing import Dict, Any
+
+from app.services.metrics_service import ADMISSION_REJECTIONS
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejectedError(Exception):
+    """Request bị từ chối do vượt quá ngân sách trang"""
+
+    def __init__(self, pages: int, retry_after: int, load: Dict[str, Any]):
+        self.pages = pages
+        self.retry_after = retry_after
+        self.load = load
+        super().__init__(
+            f"Hệ thống đang quá tải ({load['queued_pages'] + load['in_flight_pages']}/{load['max_pages']} trang), "
+            f"thử lại sau {retry_after}s"
+        )
+
+
+class AdmissionTicket:
+    """Vé xử lý cho một tài liệu đã được chấp nhận
+
+    Scheduler báo page_started()/page_finished() cho từng trang để chuyển trang
+    từ queued sang in-flight rồi giải phóng; release() giải phóng phần còn lại.
+    """
+
+    def __init__(self, controller: "AdmissionController", pages: int):
+        self.controller = controller
+        self.pages = pages
+        self.admitted_at = time.monotonic()
+        self.queued = pages
+        self.in_flight = 0
+        self._released = False
+
+    def page_started(self) -> None:
+        self.controller._page_started(self)
+
+    def page_finished(self, elapsed: float) -> None:
+        self.controller._page_finished(self, elapsed)
+
+    def resize(self, pages: int) -> None:
+        """Cập nhật số trang khi biết số trang thật (ước lượng lúc admit có thể sai)"""
+        self.controller._resize(self, pages)
+
+    def __enter__(self) -> "AdmissionTicket":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.release()
+
+    def release(self) -> None:
+        """Giải phóng các trang còn lại của vé (an toàn khi gọi nhiều lần)"""
+        self.controller._release(self)
+
+
+class AdmissionController:
+    """Kiểm soát tải đầu vào dựa trên số trang đang chờ và đang xử lý"""
+
+    def __init__(self,
+                 max_pages: int = None,
+                 workers: int = None,
+                 default_seconds_per_page: float = None):
+        self.max_pages = max_pages or settings.ADMISSION_MAX_PAGES
+        self.workers = workers or settings.OCR_WORKERS
+        self.seconds_per_page = default_seconds_per_page or settings.ADMISSION_DEFAULT_SECONDS_PER_PAGE
+
+        self._lock = threading.Lock()
+        self.queued_pages = 0
+        self.in_flight_pages = 0
+        self.active_documents = 0
+        self.rejected_requests = 0
+
+    def admit(self, pages: int) -> AdmissionTicket:
+        """Chấp nhận tài liệu hoặc ném AdmissionRejectedError nếu vượt ngân sách"""
+        pages = max(1, pages)
+        with self._lock:
+            self._check(pages)
+            self.queued_pages += pages
+            self.active_documents += 1
+        return AdmissionTicket(self, pages)
+
+    def check_capacity(self) -> None:
+        """Kiểm tra nhanh trước khi nhận body upload: ném AdmissionRejectedError nếu
+        tài liệu dù chỉ một trang cũng sẽ bị từ chối (chưa giữ chỗ)"""
+        with self._lock:
+            self._check(1)
+
+    def _check(self, pages: int) -> None:
+        """Ném AdmissionRejectedError nếu nhận thêm pages trang sẽ vượt ngân sách (gọi khi đang giữ lock)"""
+        current = self.queued_pages + self.in_flight_pages
+        # Tài liệu lớn hơn cả ngân sách vẫn được nhận khi hệ thống rảnh
+        if current > 0 and current + pages > self.max_pages:
+            self.rejected_requests += 1
+            ADMISSION_REJECTIONS.inc()
+            retry_after = self._compute_retry_after(current + pages - self.max_pages)
+            load = self._snapshot()
+            logger.warning("Từ chối tài liệu %d trang: tải hiện tại %d/%d trang, Retry-After %ds",
+                           pages, current, self.max_pages, retry_after)
+            raise AdmissionRejectedError(pages, retry_after, load)
+
+    def _page_started(self, ticket: AdmissionTicket) -> None:
+        with self._lock:
+            if ticket._released or ticket.queued == 0:
+                return
+            ticket.queued -= 1
+            ticket.in_flight += 1
+            self.queued_pages -= 1
+            self.in_flight_pages += 1
+
+    def _page_finished(self, ticket: AdmissionTicket, elapsed: float) -> None:
+        with self._lock:
+            # EWMA thời gian xử lý mỗi trang để tính Retry-After
+            alpha = settings.ADMISSION_EWMA_ALPHA
+            self.seconds_per_page = alpha * elapsed + (1 - alpha) * self.seconds_per_page
+            if ticket._released or ticket.in_flight == 0:
+                return
+            ticket.in_flight -= 1
+            self.in_flight_pages -= 1
+
+    def _resize(self, ticket: AdmissionTicket, pages: int) -> None:
+        with self._lock:
+            if ticket._released:
+                return
+            queued = max(0, ticket.queued + pages - ticket.pages)
+            self.queued_pages += queued - ticket.queued
+            ticket.queued = queued
+            ticket.pages = pages
+
+    def _release(self, ticket: AdmissionTicket) -> None:
+        with self._lock:
+            if ticket._released:
+                return
+            ticket._released = True
+            self.queued_pages -= ticket.queued
+            self.in_flight_pages -= ticket.in_flight
+            self.active_documents -= 1
+            ticket.queued = ticket.in_flight = 0
+
+    def _compute_retry_after(self, excess_pages: int) -> int:
+        """Ước lượng số giây cần chờ để giải phóng đủ số trang vượt ngân sách"""
+        # Các worker xử lý song song, mỗi worker một trang
+        pages_per_second = self.workers / max(self.seconds_per_page, 1e-3)
+        retry_after = math.ceil(excess_pages / pages_per_second)
+        return max(1, min(retry_after, settings.ADMISSION_MAX_RETRY_AFTER))
+
+    def _snapshot(self) -> Dict[str, Any]:
+        total = self.queued_pages + self.in_flight_pages
+        return {
+            "queued_pages": self.queued_pages,
+            "in_flight_pages": self.in_flight_pages,
+            "active_documents": self.active_documents,
+            "max_pages": self.max_pages,
+            "workers": self.workers,
+            "utilization": round(total / self.max_pages, 4),
+            "saturated": total >= self.max_pages,
+            "seconds_per_page": round(self.seconds_per_page, 4),
+            "rejected_requests": self.rejected_requests
+        }
+
+    def get_load(self) -> Dict[str, Any]:
+        """Lấy tải hiện tại (dùng cho load balancer)"""
+        with self._lock:
+            return self._snapshot()
@@ -11,11 +11,30 @@ from typing import List, Dict, Optional, Any
 import re
 from datetime import datetime
 
-from app.models.schemas import DocumentField, AIExtractionResult, DocumentType, FieldType
+from app.models.schemas import DocumentType, FieldType
+from app.models.records import FieldRecord, ExtractionRecord
+from app.services.safe_regex import RegexBudget, SafePattern
 from config.settings import settings
 
 logger = logging.getLogger(__name__)
 
+# Patterns cho các loại trường khác nhau (compile một lần; ".*?" trên text dài cần engine an toàn)
+RULE_PATTERNS = {
+    field_name: tuple(SafePattern(pattern, re.IGNORECASE | re.DOTALL) for pattern in patterns)
+    for field_name, patterns in {
+        "so_ho_so": [r"Số.*?(\d+[\w\-/]*\d*)", r"Hồ sơ số.*?(\d+[\w\-/]*\d*)"],
+        "tieu_de_ho_so": [r"Tiêu đề.*?:\s*(.+)", r"Nội dung.*?:\s*(.+)"],
+        "ngay_ban_hanh": [r"(\d{1,2}[\/\-]\d{1,2}[\/\-]\d{4})", r"Ngày.*?(\d{1,2}[\/\-]\d{1,2}[\/\-]\d{4})"],
+        "so_van_ban": [r"Số.*?(\d+[\w\-/]*\d*)", r"Văn bản số.*?(\d+[\w\-/]*\d*)"],
+        "don_vi_ban_hanh": [r"Ban hành.*?:\s*(.+)", r"Đơn vị.*?:\s*(.+)"],
+        "nguoi_ky": [r"Người ký.*?:\s*(.+)", r"Ký.*?:\s*(.+)"],
+        "so_trang": [r"(\d+)\s*trang", r"Trang.*?(\d+)"],
+        "trich_yeu": [r"Trích yếu.*?:\s*(.+)", r"Nội dung.*?:\s*(.+)"]
+    }.items()
+}
+DATE_PATTERN = SafePattern(r"(\d{1,2}[\/\-]\d{1,2}[\/\-]\d{4})")
+NUMBER_PATTERN = SafePattern(r"(\d+)")
+
 class AIService:
     """Dịch vụ AI để trích xuất thông tin từ văn bản OCR"""
     
@@ -105,7 +124,7 @@ Trả về kết quả dưới dạng JSON:
 """
         return prompt
     
-    def extract_with_openai(self, text: str, document_type: DocumentType, custom_fields: Optional[List[str]] = None) -> AIExtractionResult:
+    def extract_with_openai(self, text: str, document_type: DocumentType, custom_fields: Optional[List[str]] = None) -> ExtractionRecord:
         """Trích xuất thông tin sử dụng OpenAI API"""
         try:
             start_time = time.time()
@@ -138,12 +157,12 @@ Trả về kết quả dưới dạng JSON:
                 logger.error("Không thể parse JSON response từ OpenAI")
                 return self.extract_with_rules(text, document_type, custom_fields)
             
-            # Chuyển đổi thành DocumentField objects
+            # Chuyển đổi thành FieldRecord objects
             fields = []
             for field_data in result_data.get("fields", []):
                 field_info = next((f for f in self.document_fields[document_type] if f["name"] == field_data["name"]), None)
                 if field_info:
-                    field = DocumentField(
+                    field = FieldRecord(
                         name=field_data["name"],
                         value=field_data.get("value", ""),
                         field_type=field_info["type"],
@@ -156,25 +175,27 @@ Trả về kết quả dưới dạng JSON:
             processing_time = time.time() - start_time
             overall_confidence = result_data.get("overall_confidence", 0.5)
             
-            logger.info(f"OpenAI extraction hoàn thành: {len(fields)} trường, confidence: {overall_confidence:.2f}, thời gian: {processing_time:.2f}s")
+            logger.info("OpenAI extraction hoàn thành: %d trường, confidence: %.2f, thời gian: %.2fs",
+                        len(fields), overall_confidence, processing_time)
             
-            return AIExtractionResult(
+            return ExtractionRecord(
                 fields=fields,
                 confidence_score=overall_confidence,
                 processing_time=processing_time
             )
             
         except Exception as e:
-            logger.error(f"Lỗi OpenAI extraction: {str(e)}")
+            logger.error("Lỗi OpenAI extraction: %s", e)
             return self.extract_with_rules(text, document_type, custom_fields)
     
-    def extract_with_rules(self, text: str, document_type: DocumentType, custom_fields: Optional[List[str]] = None) -> AIExtractionResult:
+    def extract_with_rules(self, text: str, document_type: DocumentType, custom_fields: Optional[List[str]] = None) -> ExtractionRecord:
         """Trích xuất thông tin sử dụng rules-based (fallback)"""
         try:
             start_time = time.time()
             
             fields = []
             fields_config = self.document_fields.get(document_type, [])
+            budget = RegexBudget()
             
             for field_config in fields_config:
                 field_name = field_config["name"]
@@ -182,9 +203,9 @@ Trả về kết quả dưới dạng JSON:
                 is_required = field_config["required"]
                 
                 # Áp dụng rules cho từng loại trường
-                value, confidence, original = self.extract_field_with_rules(text, field_name, field_type)
+                value, confidence, original = self.extract_field_with_rules(text, field_name, field_type, budget)
                 
-                field = DocumentField(
+                field = FieldRecord(
                     name=field_name,
                     value=value,
                     field_type=field_type,
@@ -200,42 +221,33 @@ Trả về kết quả dưới dạng JSON:
             confidences = [f.confidence_score for f in fields if f.confidence_score > 0]
             overall_confidence = sum(confidences) / len(confidences) if confidences else 0.0
             
-            logger.info(f"Rule-based extraction hoàn thành: {len(fields)} trường, confidence: {overall_confidence:.2f}, thời gian: {processing_time:.2f}s")
+            logger.info("Rule-based extraction hoàn thành: %d trường, confidence: %.2f, thời gian: %.2fs",
+                        len(fields), overall_confidence, processing_time)
             
-            return AIExtractionResult(
+            return ExtractionRecord(
                 fields=fields,
                 confidence_score=overall_confidence,
                 processing_time=processing_time
             )
             
         except Exception as e:
-            logger.error(f"Lỗi rule-based extraction: {str(e)}")
-            return AIExtractionResult(
+            logger.error("Lỗi rule-based extraction: %s", e)
+            return ExtractionRecord(
                 fields=[],
                 confidence_score=0.0,
                 processing_time=0.0
             )
     
-    def extract_field_with_rules(self, text: str, field_name: str, field_type: FieldType) -> tuple[str, float, str]:
-        """Trích xuất một trường cụ thể bằng rules"""
-        
-        # Patterns cho các loại trường khác nhau
-        patterns = {
-            "so_ho_so": [r"Số.*?(\d+[\w\-/]*\d*)", r"Hồ sơ số.*?(\d+[\w\-/]*\d*)"],
-            "tieu_de_ho_so": [r"Tiêu đề.*?:\s*(.+)", r"Nội dung.*?:\s*(.+)"],
-            "ngay_ban_hanh": [r"(\d{1,2}[\/\-]\d{1,2}[\/\-]\d{4})", r"Ngày.*?(\d{1,2}[\/\-]\d{1,2}[\/\-]\d{4})"],
-            "so_van_ban": [r"Số.*?(\d+[\w\-/]*\d*)", r"Văn bản số.*?(\d+[\w\-/]*\d*)"],
-            "don_vi_ban_hanh": [r"Ban hành.*?:\s*(.+)", r"Đơn vị.*?:\s*(.+)"],
-            "nguoi_ky": [r"Người ký.*?:\s*(.+)", r"Ký.*?:\s*(.+)"],
-            "so_trang": [r"(\d+)\s*trang", r"Trang.*?(\d+)"],
-            "trich_yeu": [r"Trích yếu.*?:\s*(.+)", r"Nội dung.*?:\s*(.+)"]
-        }
+    def extract_field_with_rules(self, text: str, field_name: str, field_type: FieldType,
+                                 budget: Optional[RegexBudget] = None) -> tuple[str, float, str]:
+        """Trích xuất một trường cụ thể bằng rules (budget: ngân sách regex dùng chung cho tài liệu)"""
+        budget = budget or RegexBudget()
         
         # Lấy patterns cho trường
-        field_patterns = patterns.get(field_name, [])
+        field_patterns = RULE_PATTERNS.get(field_name, ())
         
         for pattern in field_patterns:
-            match = re.search(pattern, text, re.IGNORECASE | re.DOTALL)
+            match = budget.search(pattern, text)
             if match:
                 value = match.group(1).strip()
                 confidence = 0.8 if len(value) > 0 else 0.0
@@ -243,21 +255,21 @@ Trả về kết quả dưới dạng JSON:
         
         # Nếu không tìm thấy pattern cụ thể, thử tìm kiếm chung
         if field_type == FieldType.DATE:
-            date_match = re.search(r"(\d{1,2}[\/\-]\d{1,2}[\/\-]\d{4})", text)
+            date_match = budget.search(DATE_PATTERN, text)
             if date_match:
                 return date_match.group(1), 0.6, date_match.group(0)
         
         elif field_type == FieldType.NUMERIC:
-            num_match = re.search(r"(\d+)", text)
+            num_match = budget.search(NUMBER_PATTERN, text)
             if num_match:
                 return num_match.group(1), 0.4, num_match.group(0)
         
         return "", 0.0, ""
     
-    def process_document(self, text: str, document_type: DocumentType, custom_fields: Optional[List[str]] = None) -> AIExtractionResult:
+    def process_document(self, text: str, document_type: DocumentType, custom_fields: Optional[List[str]] = None) -> ExtractionRecord:
         """Xử lý tài liệu và trích xuất thông tin"""
         try:
-            logger.info(f"Bắt đầu AI extraction cho loại tài liệu: {document_type.value}")
+            logger.info("Bắt đầu AI extraction cho loại tài liệu: %s", document_type.value)
             
             # Sử dụng OpenAI nếu có API key và thư viện, ngược lại dùng rules
             if OPENAI_AVAILABLE and settings.OPENAI_API_KEY:
@@ -266,14 +278,14 @@ Trả về kết quả dưới dạng JSON:
                 return self.extract_with_rules(text, document_type, custom_fields)
                 
         except Exception as e:
-            logger.error(f"Lỗi AI extraction: {str(e)}")
-            return AIExtractionResult(
+            logger.error("Lỗi AI extraction: %s", e)
+            return ExtractionRecord(
                 fields=[],
                 confidence_score=0.0,
                 processing_time=0.0
             )
     
-    def validate_extracted_data(self, fields: List[DocumentField]) -> Dict[str, Any]:
+    def validate_extracted_data(self, fields: List[FieldRecord]) -> Dict[str, Any]:
         """Validate dữ liệu đã trích xuất"""
         validation_results = {
             "is_valid": True,
@@ -1,14 +1,27 @@
+import bisect
 import logging
 import time
 import json
 import re
-from typing import List, Dict, Optional, Any, Tuple
+from typing import List, Dict, Optional, Any, Iterable, Sequence, Set, Tuple
+from dataclasses import dataclass
 from datetime import datetime
 import pickle
 import os
 from pathlib import Path
 
-from app.models.schemas import DocumentField, AIExtractionResult, DocumentType, FieldType
+import numpy as np
+
+from app.models.schemas import DocumentType, FieldType
+from app.models.records import FieldRecord, ExtractionRecord
+from app.services.metrics_service import stage_timer
+from app.services.embedding_backend import EmbeddingBackend, create_embedding_backend
+from app.services.embedding_cache import EmbeddingCache
+from app.services.extraction_plan import (
+    Encoder, ExtractionPlan, ExtractionPlanCache, FieldPlan, KeywordIndex, PatternMatch, normalize_rows
+)
+from app.services.keyword_matcher import KeywordMatcher, fold_diacritics
+from app.services.safe_regex import RegexBudget
 from config.settings import settings
 
 logger = logging.getLogger(__name__)
@@ -23,15 +36,8 @@ except ImportError:
     logger.warning("Transformers không khả dụng")
 
 try:
-    from sentence_transformers import SentenceTransformer
-    SENTENCE_TRANSFORMERS_AVAILABLE = True
-except ImportError:
-    SENTENCE_TRANSFORMERS_AVAILABLE = False
-    logger.warning("SentenceTransformers không khả dụng")
-
-try:
+    from sklearn.base import clone
     from sklearn.feature_extraction.text import TfidfVectorizer
-    from sklearn.metrics.pairwise import cosine_similarity
     from sklearn.cluster import KMeans
     SKLEARN_AVAILABLE = True
 except ImportError:
@@ -75,7 +81,7 @@ class VietnameseNLPProcessor:
                 logger.warning("Underthesea không khả dụng, sử dụng fallback")
                 self.initialized = True
         except Exception as e:
-            logger.error(f"Lỗi khởi tạo NLP processor: {e}")
+            logger.error("Lỗi khởi tạo NLP processor: %s", e)
             self.initialized = True  # Vẫn cho phép chạy với fallback
     
     def segment_words(self, text: str) -> List[str]:
@@ -90,7 +96,7 @@ class VietnameseNLPProcessor:
                 # Fallback: tách bằng khoảng trắng
                 return text.split()
         except Exception as e:
-            logger.error(f"Lỗi tách từ: {e}")
+            logger.error("Lỗi tách từ: %s", e)
             return text.split()
     
     def extract_named_entities(self, text: str) -> List[Dict]:
@@ -106,7 +112,7 @@ class VietnameseNLPProcessor:
                 # Fallback: regex patterns
                 return self._extract_entities_with_regex(text)
         except Exception as e:
-            logger.error(f"Lỗi trích xuất thực thể: {e}")
+            logger.error("Lỗi trích xuất thực thể: %s", e)
             return self._extract_entities_with_regex(text)
     
     def _extract_entities_with_regex(self, text: str) -> List[Dict]:
@@ -133,14 +139,244 @@ class VietnameseNLPProcessor:
         
         return entities
 
+# Regex dùng chung khi lấy giá trị từ câu
+# Đoạn giữa các dấu kết thúc câu
+SENTENCE_PATTERN = re.compile(r'[^.!?;\n]+')
+DATE_VALUE_PATTERN = re.compile(r'\d{1,2}[\/\-]\d{1,2}[\/\-]\d{4}')
+NUMBER_VALUE_PATTERN = re.compile(r'\d+')
+
+class DocumentAnalysis:
+    """Kết quả phân tích NLP dùng chung cho mọi trường của một tài liệu
+
+    NER chỉ chạy một lần (lười, khi có trường cần đến) và được đánh chỉ mục theo
+    nhãn; mỗi nhãn giữ thứ tự thực thể như NER trả về (start/end nếu có).
+    Câu của tài liệu được encode một lần theo batch và chấm điểm với keyword của
+    mọi trường bằng một phép nhân ma trận.
+
+    Nếu có matcher (prefilter keyword), trường không có keyword nào trong text bị bỏ
+    qua khi dùng NER/semantic search, và chỉ các câu quanh vị trí keyword
+    (±window câu) được encode và làm ứng viên.
+
+    Nếu có vectorizer (TF-IDF n-gram ký tự), semantic search chạy hai tầng: TF-IDF
+    giữa keyword và câu chọn top_k câu ứng viên cho mỗi trường, chỉ các câu này
+    được encode và xếp hạng lại bằng embedding.
+    """
+
+    def __init__(self, text: str, nlp_processor: VietnameseNLPProcessor,
+                 encoder: Optional[Encoder] = None, keywords: Optional[KeywordIndex] = None,
+                 matcher: Optional[KeywordMatcher] = None, window: int = None,
+                 vectorizer=None, top_k: int = None):
+        self.text = text
+        self.nlp_processor = nlp_processor
+        self.encoder = encoder
+        self.keywords = keywords
+        self.matcher = matcher
+        self.window = window if window is not None else settings.KEYWORD_WINDOW_SENTENCES
+        self.vectorizer = vectorizer
+        self.top_k = top_k if top_k is not None else settings.SEMANTIC_SHORTLIST_K
+        self._entities: Optional[List[Dict]] = None
+        # Nhãn -> [(thứ tự trong kết quả NER, thực thể)]
+        self._by_label: Dict[str, List[Tuple[int, Dict]]] = {}
+        self._sentences: Optional[List[str]] = None
+        self._sentence_starts: List[int] = []
+        self._keyword_hits: Optional[Dict[str, List[int]]] = None
+        self._shortlist: Optional[Dict[str, Set[int]]] = None
+        self._similarities: Optional[np.ndarray] = None
+
+    @property
+    def entities(self) -> List[Dict]:
+        if self._entities is None:
+            with stage_timer("ner"):
+                self._entities = self.nlp_processor.extract_named_entities(self.text)
+            for index, entity in enumerate(self._entities):
+                self._by_label.setdefault(entity["label"], []).append((index, entity))
+        return self._entities
+
+    def first_entity(self, labels: Iterable[str]) -> Optional[Dict]:
+        """Thực thể đầu tiên (theo thứ tự NER trả về) có nhãn thuộc labels"""
+        self.entities
+        firsts = [self._by_label[label][0] for label in labels if label in self._by_label]
+        return min(firsts, key=lambda item: item[0])[1] if firsts else None
+
+    @property
+    def sentences(self) -> List[str]:
+        if self._sentences is None:
+            self._sentences = []
+            for match in SENTENCE_PATTERN.finditer(self.text):
+                sentence = match.group().strip()
+                if sentence:
+                    self._sentences.append(sentence)
+                    self._sentence_starts.append(match.start())
+        return self._sentences
+
+    @property
+    def keyword_hits(self) -> Optional[Dict[str, List[int]]]:
+        """Tên trường -> vị trí keyword của trường trong text (None nếu không có prefilter)"""
+        if self.matcher is None:
+            return None
+        if self._keyword_hits is None:
+            with stage_timer("keyword_prefilter"):
+                self._keyword_hits = self.matcher.field_hits(fold_diacritics(self.text))
+        return self._keyword_hits
+
+    def may_match(self, field: FieldPlan) -> bool:
+        """False nếu trường có keywords nhưng không keyword nào xuất hiện trong text"""
+        hits = self.keyword_hits
+        return hits is None or not field.keywords or field.name in hits
+
+    def _candidate_sentences(self, field_name: str) -> Optional[Set[int]]:
+        """Chỉ số các câu quanh keyword của trường (None = mọi câu)"""
+        hits = self.keyword_hits
+        if hits is None:
+            return None
+        self.sentences
+        last = len(self._sentences) - 1
+        candidates: Set[int] = set()
+        for position in hits.get(field_name, ()):
+            index = max(bisect.bisect_right(self._sentence_starts, position) - 1, 0)
+            candidates.update(range(max(index - self.window, 0), min(index + self.window, last) + 1))
+        return candidates
+
+    @property
+    def shortlist(self) -> Optional[Dict[str, Set[int]]]:
+        """Tên trường -> top_k câu ứng viên theo TF-IDF với keyword của trường (None nếu tắt)"""
+        if self.vectorizer is None or self.keywords is None or self.top_k <= 0:
+            return None
+        if self._shortlist is None:
+            with stage_timer("semantic_search.shortlist"):
+                self._shortlist = self._build_shortlist()
+        return self._shortlist
+
+    def _build_shortlist(self) -> Dict[str, Set[int]]:
+        pools = {}
+        for name in self.keywords.rows:
+            pool = self._candidate_sentences(name)
+            pools[name] = set(range(len(self.sentences))) if pool is None else pool
+        columns = sorted(set().union(*pools.values()))
+        shortlist = dict(pools)
+        if len(columns) <= self.top_k:
+            return shortlist
+        try:
+            # IDF tính trên các câu ứng viên của chính tài liệu
+            vectorizer = clone(self.vectorizer)
+            sentence_matrix = vectorizer.fit_transform([self.sentences[i] for i in columns])
+            keyword_matrix = vectorizer.transform(list(self.keywords.keywords))
+        except ValueError:
+            # Không có n-gram nào (câu toàn ký tự lạ): giữ nguyên ứng viên
+            return shortlist
+        # Hàng TF-IDF đã chuẩn hóa L2 nên tích vô hướng là cosine (keyword x câu)
+        scores = (keyword_matrix @ sentence_matrix.T).toarray()
+        position = {column: i for i, column in enumerate(columns)}
+        for name, pool in pools.items():
+            if len(pool) <= self.top_k:
+                continue
+            indexes = sorted(pool)
+            field_scores = scores[self.keywords.rows[name]][:, [position[i] for i in indexes]].max(axis=0)
+            best = np.argsort(-field_scores, kind="stable")[:self.top_k]
+            shortlist[name] = {indexes[i] for i in best}
+        return shortlist
+
+    def _rerank_candidates(self, field_name: str) -> Optional[Set[int]]:
+        """Câu được xếp hạng bằng embedding cho trường (None = mọi câu)"""
+        shortlist = self.shortlist
+        if shortlist is not None:
+            return shortlist.get(field_name, set())
+        return self._candidate_sentences(field_name)
+
+    def similarities(self, field_name: str) -> Optional[np.ndarray]:
+        """Cosine similarity (keyword của trường x câu), None nếu không có embedding/câu ứng viên
+
+        Câu không phải ứng viên của trường có similarity -1.
+        """
+        if self.encoder is None or self.keywords is None or field_name not in self.keywords.rows:
+            return None
+        candidates = self._rerank_candidates(field_name)
+        if candidates is not None and not candidates:
+            return None
+        if not self.sentences:
+            return None
+        if self._similarities is None:
+            self._score_sentences()
+        similarities = self._similarities[self.keywords.rows[field_name]]
+        if candidates is not None:
+            masked = np.full_like(similarities, -1.0)
+            columns = sorted(candidates)
+            masked[:, columns] = similarities[:, columns]
+            similarities = masked
+        return similarities
+
+    def pending_sentences(self, field_names: Optional[Iterable[str]] = None) -> List[int]:
+        """Chỉ số các câu ứng viên của field_names (mặc định mọi trường có keyword) chưa được encode"""
+        if self._similarities is not None or self.encoder is None or self.keywords is None:
+            return []
+        names = [name for name in (field_names or self.keywords.rows) if name in self.keywords.rows]
+        if not names:
+            return []
+        candidates = [self._rerank_candidates(name) for name in names]
+        if any(pool is None for pool in candidates):
+            return list(range(len(self.sentences)))
+        return sorted(set().union(*candidates))
+
+    def set_sentence_embeddings(self, columns: List[int], embeddings: Optional[np.ndarray]) -> None:
+        """Chấm điểm các câu columns đã encode (embeddings theo cùng thứ tự); câu khác có similarity -1"""
+        similarities = np.full((self.keywords.matrix.shape[0], len(self.sentences)), -1.0, dtype=np.float32)
+        if columns:
+            similarities[:, columns] = self.keywords.similarities(normalize_rows(embeddings))
+        self._similarities = similarities
+
+    def _score_sentences(self) -> None:
+        """Encode (một batch) các câu ứng viên của mọi trường và chấm điểm với mọi keyword"""
+        columns = self.pending_sentences()
+        embeddings = None
+        if columns:
+            with stage_timer("semantic_search.encode"):
+                embeddings = self.encoder([self.sentences[i] for i in columns])
+        self.set_sentence_embeddings(columns, embeddings)
+
+
+@dataclass(frozen=True, slots=True)
+class _PendingDocument:
+    """Tài liệu đã quét pattern, chờ encode câu chung batch trong process_documents()"""
+    index: int
+    hits: Dict[str, PatternMatch]
+    analysis: DocumentAnalysis
+    # Câu ứng viên cần encode (chỉ số trong analysis.sentences)
+    columns: List[int]
+    # Thời gian đã xử lý trước khi encode (giây)
+    elapsed: float
+
+
 class LocalAIExtractor:
     """AI Extractor sử dụng models local"""
     
+    # Các trường theo loại tài liệu
+    DOCUMENT_FIELDS = {
+        DocumentType.THONG_TIN_HO_SO: [
+            "so_ho_so", "tieu_de_ho_so", "don_vi_lap_ho_so", 
+            "thoi_han_bao_quan", "ngay_bat_dau", "ngay_ket_thuc", 
+            "tong_so_trang", "ghi_chu"
+        ],
+        DocumentType.MUC_LUC_TAI_LIEU: [
+            "so_thu_tu", "so_ky_hieu", "ngay_thang", 
+            "trich_yeu_noi_dung", "so_trang", "ghi_chu"
+        ],
+        DocumentType.THONG_TIN_VAN_BAN: [
+            "so_van_ban", "ngay_ban_hanh", "trich_yeu", 
+            "don_vi_ban_hanh", "nguoi_ky", "loai_van_ban", 
+            "so_trang", "ghi_chu"
+        ]
+    }
+    REQUIRED_FIELDS = ["so_ho_so", "tieu_de_ho_so", "so_van_ban", "trich_yeu"]
+    
     def __init__(self):
         self.nlp_processor = VietnameseNLPProcessor()
-        self.sentence_model = None
+        self.sentence_model: Optional[EmbeddingBackend] = None
+        # sentence_model.encode đặt sau cache embedding
+        self.embedding_cache: Optional[EmbeddingCache] = None
+        self.encoder: Optional[Encoder] = None
         self.vectorizer = None
-        self.field_patterns = self._load_field_patterns()
+        # Plan trích xuất (regex đã compile) được cache theo loại tài liệu
+        self.plans = ExtractionPlanCache(self._load_field_patterns(), self.DOCUMENT_FIELDS, self.REQUIRED_FIELDS)
         self.semantic_model_ready = False
         
         # Khởi tạo models
@@ -149,26 +385,45 @@ class LocalAIExtractor:
     def _initialize_semantic_models(self):
         """Khởi tạo các model semantic"""
         try:
-            if SENTENCE_TRANSFORMERS_AVAILABLE:
-                logger.info("Đang tải SentenceTransformer model...")
-                # Sử dụng model đa ngôn ngữ hỗ trợ tiếng Việt
-                self.sentence_model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
+            logger.info("Đang tải embedding model (%s)...", settings.EMBEDDING_BACKEND)
+            # Sử dụng model đa ngôn ngữ hỗ trợ tiếng Việt
+            self.sentence_model = create_embedding_backend()
+            if self.sentence_model is not None:
+                # Vector khác nhau giữa các backend (fp32/int8) nên cache tách theo backend
+                self.embedding_cache = EmbeddingCache(
+                    f"{settings.SEMANTIC_MODEL}:{self.sentence_model.name}", self.sentence_model.dim
+                )
+                self.encoder = self.embedding_cache.wrap(self.sentence_model.encode)
+                # Embedding keyword được tính sẵn khi build plan
+                self.plans.set_encoder(self.encoder)
                 self.semantic_model_ready = True
-                logger.info("SentenceTransformer model đã sẵn sàng")
+                logger.info("Embedding model đã sẵn sàng (backend %s)", self.sentence_model.name)
             
             if SKLEARN_AVAILABLE:
-                # Khởi tạo TF-IDF vectorizer cho tiếng Việt
+                # TF-IDF n-gram ký tự trên text đã bỏ dấu (chịu được lỗi dấu của OCR),
+                # tầng lọc rẻ trước khi xếp hạng lại bằng embedding
                 self.vectorizer = TfidfVectorizer(
-                    max_features=5000,
-                    ngram_range=(1, 3),
-                    stop_words=None  # Sẽ tự define stop words cho tiếng Việt
+                    analyzer="char_wb",
+                    ngram_range=(2, 4),
+                    preprocessor=fold_diacritics,
+                    sublinear_tf=True,
+                    dtype=np.float32
                 )
                 logger.info("TF-IDF vectorizer đã sẵn sàng")
                 
         except Exception as e:
-            logger.error(f"Lỗi khởi tạo semantic models: {e}")
+            logger.error("Lỗi khởi tạo semantic models: %s", e)
             self.semantic_model_ready = False
     
+    @property
+    def field_patterns(self) -> Dict[str, Dict]:
+        return self.plans.definitions
+    
+    @field_patterns.setter
+    def field_patterns(self, definitions: Dict[str, Dict]) -> None:
+        # Đổi định nghĩa trường thì build lại plan
+        self.plans.set_definitions(definitions)
+    
     def _load_field_patterns(self) -> Dict[str, Dict]:
         """Load patterns cho từng loại trường"""
         return {
@@ -280,222 +535,288 @@ class LocalAIExtractor:
             }
         }
     
-    def extract_field_with_patterns(self, text: str, field_name: str, field_config: Dict) -> Tuple[str, float, str]:
-        """Trích xuất trường bằng patterns"""
-        patterns = field_config.get("patterns", [])
-        keywords = field_config.get("keywords", [])
-        
-        # Thử patterns regex
-        for pattern in patterns:
-            matches = re.finditer(pattern, text, re.IGNORECASE | re.DOTALL)
-            for match in matches:
-                if match.groups():
-                    value = match.group(1).strip()
-                    confidence = 0.9  # High confidence cho pattern match
-                    return value, confidence, match.group(0)
-                else:
-                    value = match.group(0).strip()
-                    confidence = 0.8
-                    return value, confidence, match.group(0)
+    def extract_field_with_patterns(self, text: str, field: FieldPlan,
+                                    hits: Optional[Dict[str, PatternMatch]] = None,
+                                    analysis: Optional[DocumentAnalysis] = None) -> Tuple[str, float, str]:
+        """Trích xuất trường bằng patterns
+
+        hits: kết quả ExtractionPlan.scan() của cả tài liệu; nếu không có thì quét riêng trường này.
+        analysis: phân tích dùng chung cho semantic search fallback.
+        """
+        if hits is None:
+            hit = field.first_match(text)
+        else:
+            hit = hits.get(field.name)
+        if hit is not None:
+            if hit.group is not None:
+                return hit.group.strip(), 0.9, hit.text  # High confidence cho pattern match
+            return hit.text.strip(), 0.8, hit.text
         
         # Thử semantic search nếu có keywords
-        if keywords and self.semantic_model_ready:
-            semantic_result = self._extract_with_semantic_search(text, keywords, field_config)
+        if field.keywords and self.semantic_model_ready:
+            with stage_timer("semantic_search"):
+                semantic_result = self._extract_with_semantic_search(text, field, analysis)
             if semantic_result[0]:
                 return semantic_result
         
         return "", 0.0, ""
     
-    def _extract_with_semantic_search(self, text: str, keywords: List[str], field_config: Dict) -> Tuple[str, float, str]:
+    def _extract_with_semantic_search(self, text: str, field: FieldPlan,
+                                      analysis: Optional[DocumentAnalysis] = None) -> Tuple[str, float, str]:
         """Trích xuất bằng semantic search"""
         try:
-            if not self.sentence_model:
+            if self.encoder is None:
                 return "", 0.0, ""
             
-            # Tách text thành các câu
-            sentences = re.split(r'[.!?;\n]', text)
-            sentences = [s.strip() for s in sentences if s.strip()]
+            if analysis is None:
+                analysis = DocumentAnalysis(text, self.nlp_processor, self.encoder,
+                                            KeywordIndex.build([field], self.encoder),
+                                            vectorizer=self.vectorizer)
             
-            if not sentences:
+            # Similarity giữa keywords và các câu (embedding tính một lần cho cả tài liệu)
+            similarities = analysis.similarities(field.name)
+            if similarities is None:
                 return "", 0.0, ""
             
-            # Encode keywords và sentences
-            keyword_embeddings = self.sentence_model.encode(keywords)
-            sentence_embeddings = self.sentence_model.encode(sentences)
-            
             # Tìm câu có similarity cao nhất
-            similarities = cosine_similarity(keyword_embeddings, sentence_embeddings)
-            max_similarity = similarities.max()
+            max_similarity = float(similarities.max())
             
             if max_similarity > 0.6:  # Threshold cho semantic similarity
-                best_sentence_idx = similarities.argmax() // len(keywords)
-                best_sentence = sentences[best_sentence_idx]
+                # Ma trận là keyword x câu: cột của phần tử lớn nhất là câu tốt nhất
+                _, best_sentence_idx = np.unravel_index(similarities.argmax(), similarities.shape)
+                best_sentence = analysis.sentences[best_sentence_idx]
                 
                 # Trích xuất value từ câu tốt nhất
-                value = self._extract_value_from_sentence(best_sentence, field_config)
+                value = self._extract_value_from_sentence(best_sentence, field)
                 confidence = min(max_similarity, 0.8)  # Cap confidence
                 
                 return value, confidence, best_sentence
             
         except Exception as e:
-            logger.error(f"Lỗi semantic search: {e}")
+            logger.error("Lỗi semantic search: %s", e)
         
         return "", 0.0, ""
     
-    def _extract_value_from_sentence(self, sentence: str, field_config: Dict) -> str:
+    def _extract_value_from_sentence(self, sentence: str, field: FieldPlan) -> str:
         """Trích xuất giá trị từ câu"""
-        field_type = field_config.get("field_type", FieldType.TEXT)
-        
         # Xử lý theo loại trường
-        if field_type == FieldType.DATE:
-            date_match = re.search(r'\d{1,2}[\/\-]\d{1,2}[\/\-]\d{4}', sentence)
+        if field.field_type == FieldType.DATE:
+            date_match = DATE_VALUE_PATTERN.search(sentence)
             return date_match.group() if date_match else ""
         
-        elif field_type == FieldType.NUMERIC:
-            num_match = re.search(r'\d+', sentence)
+        elif field.field_type == FieldType.NUMERIC:
+            num_match = NUMBER_VALUE_PATTERN.search(sentence)
             return num_match.group() if num_match else ""
         
         else:  # TEXT
             # Loại bỏ keywords và lấy phần còn lại
-            keywords = field_config.get("keywords", [])
             cleaned_sentence = sentence
             
-            for keyword in keywords:
-                cleaned_sentence = re.sub(rf'\b{re.escape(keyword)}[:\s]*', '', cleaned_sentence, flags=re.IGNORECASE)
+            for keyword_pattern in field.keyword_patterns:
+                cleaned_sentence = keyword_pattern.sub('', cleaned_sentence)
             
             return cleaned_sentence.strip()
     
-    def extract_with_entities(self, text: str, field_name: str, field_config: Dict) -> Tuple[str, float, str]:
-        """Trích xuất dựa trên named entities"""
+    def extract_with_entities(self, text: str, field: FieldPlan,
+                              analysis: Optional[DocumentAnalysis] = None) -> Tuple[str, float, str]:
+        """Trích xuất dựa trên named entities
+
+        analysis: phân tích dùng chung của tài liệu; nếu không có thì chạy NER riêng cho lần gọi này.
+        """
         try:
-            entities = self.nlp_processor.extract_named_entities(text)
-            field_type = field_config.get("field_type", FieldType.TEXT)
-            
-            # Map field type với entity labels
-            entity_type_mapping = {
-                FieldType.DATE: ['DATE'],
-                FieldType.NUMERIC: ['NUMBER'],
-                FieldType.TEXT: ['PERSON', 'ORGANIZATION', 'LOCATION']
-            }
-            
-            target_labels = entity_type_mapping.get(field_type, [])
-            
-            # Tìm entities phù hợp
-            matching_entities = [
-                entity for entity in entities 
-                if entity['label'] in target_labels
-            ]
+            if analysis is None:
+                analysis = DocumentAnalysis(text, self.nlp_processor)
+            elif not analysis.may_match(field):
+                # Không có keyword nào của trường trong text
+                return "", 0.0, ""
             
-            if matching_entities:
-                # Chọn entity đầu tiên (có thể cải thiện logic này)
-                best_entity = matching_entities[0]
+            # Chọn entity đầu tiên phù hợp với loại trường (có thể cải thiện logic này)
+            best_entity = analysis.first_entity(field.entity_labels)
+            if best_entity is not None:
                 return best_entity['text'], 0.7, best_entity['text']
             
         except Exception as e:
-            logger.error(f"Lỗi extract với entities: {e}")
+            logger.error("Lỗi extract với entities: %s", e)
         
         return "", 0.0, ""
     
-    def process_document(self, text: str, document_type: DocumentType, custom_fields: Optional[List[str]] = None) -> AIExtractionResult:
+    def process_document(self, text: str, document_type: DocumentType, custom_fields: Optional[List[str]] = None) -> ExtractionRecord:
         """Xử lý tài liệu với local AI models"""
         start_time = time.time()
         
         try:
-            logger.info(f"Bắt đầu local AI extraction cho {document_type.value}")
+            logger.debug("Bắt đầu local AI extraction cho %s", document_type.value)
             
             # Khởi tạo NLP processor nếu chưa
             if not self.nlp_processor.initialized:
                 self.nlp_processor.initialize()
             
-            # Định nghĩa fields theo document type
-            field_configs = self._get_field_configs_for_document_type(document_type)
-            
-            extracted_fields = []
-            
-            for field_name, field_config in field_configs.items():
-                # Thử multiple extraction methods
-                methods = [
-                    self.extract_field_with_patterns,
-                    self.extract_with_entities,
-                ]
-                
-                best_value = ""
-                best_confidence = 0.0
-                best_original = ""
-                
-                for method in methods:
-                    try:
-                        value, confidence, original = method(text, field_name, field_config)
-                        if confidence > best_confidence:
-                            best_value = value
-                            best_confidence = confidence
-                            best_original = original
-                    except Exception as e:
-                        logger.error(f"Lỗi method {method.__name__}: {e}")
-                        continue
-                
-                # Tạo DocumentField
-                field = DocumentField(
-                    name=field_name,
-                    value=best_value,
-                    field_type=field_config["field_type"],
-                    confidence_score=best_confidence,
-                    is_required=field_config.get("required", False),
-                    original_text=best_original
-                )
-                extracted_fields.append(field)
-            
-            # Tính overall confidence
-            confidences = [f.confidence_score for f in extracted_fields if f.confidence_score > 0]
-            overall_confidence = sum(confidences) / len(confidences) if confidences else 0.0
-            
-            processing_time = time.time() - start_time
-            
-            logger.info(f"Local AI extraction hoàn thành: {len(extracted_fields)} trường, confidence: {overall_confidence:.2f}, thời gian: {processing_time:.2f}s")
-            
-            return AIExtractionResult(
-                fields=extracted_fields,
-                confidence_score=overall_confidence,
-                processing_time=processing_time
-            )
+            # Plan trích xuất theo document type (cache, regex đã compile)
+            plan = self.plans.get(document_type, custom_fields)
+            hits, analysis = self._analyze(text, plan)
+            return self._extract_fields(text, plan, hits, analysis, start_time)
             
         except Exception as e:
-            logger.error(f"Lỗi local AI extraction: {str(e)}")
-            return AIExtractionResult(
+            logger.error("Lỗi local AI extraction: %s", e)
+            return ExtractionRecord(
                 fields=[],
                 confidence_score=0.0,
                 processing_time=time.time() - start_time
             )
     
-    def _get_field_configs_for_document_type(self, document_type: DocumentType) -> Dict:
-        """Lấy cấu hình fields cho loại tài liệu"""
-        field_mappings = {
-            DocumentType.THONG_TIN_HO_SO: [
-                "so_ho_so", "tieu_de_ho_so", "don_vi_lap_ho_so", 
-                "thoi_han_bao_quan", "ngay_bat_dau", "ngay_ket_thuc", 
-                "tong_so_trang", "ghi_chu"
-            ],
-            DocumentType.MUC_LUC_TAI_LIEU: [
-                "so_thu_tu", "so_ky_hieu", "ngay_thang", 
-                "trich_yeu_noi_dung", "so_trang", "ghi_chu"
-            ],
-            DocumentType.THONG_TIN_VAN_BAN: [
-                "so_van_ban", "ngay_ban_hanh", "trich_yeu", 
-                "don_vi_ban_hanh", "nguoi_ky", "loai_van_ban", 
-                "so_trang", "ghi_chu"
-            ]
-        }
-        
-        field_names = field_mappings.get(document_type, [])
-        return {
-            name: {
-                **self.field_patterns.get(name, {}),
-                "required": name in ["so_ho_so", "tieu_de_ho_so", "so_van_ban", "trich_yeu"]
-            }
-            for name in field_names
-            if name in self.field_patterns
-        }
+    def process_documents(self, texts: Sequence[str], document_types: Sequence[DocumentType],
+                          custom_fields: Optional[List[str]] = None) -> List[ExtractionRecord]:
+        """Xử lý nhiều tài liệu (backfill), kết quả theo thứ tự texts như gọi process_document() từng tài liệu
 
+        Tài liệu được gom theo loại (dùng chung plan và embedding keyword); câu ứng viên
+        semantic search của nhiều tài liệu được encode chung một lần gọi encoder, tối đa
+        EXTRACTION_BATCH_SENTENCES câu hoặc EXTRACTION_BATCH_DOCUMENTS tài liệu mỗi lần
+        (backend tự chia tiếp theo EMBEDDING_BATCH_SIZE). NER vẫn chạy từng tài liệu.
+        """
+        if len(texts) != len(document_types):
+            raise ValueError("texts và document_types phải có cùng số phần tử")
+        if not self.nlp_processor.initialized:
+            self.nlp_processor.initialize()
+        
+        results: List[Optional[ExtractionRecord]] = [None] * len(texts)
+        groups: Dict[DocumentType, List[int]] = {}
+        for index, document_type in enumerate(document_types):
+            groups.setdefault(document_type, []).append(index)
+        
+        for document_type, indexes in groups.items():
+            logger.debug("Bắt đầu local AI extraction cho %d tài liệu %s", len(indexes), document_type.value)
+            plan = self.plans.get(document_type, custom_fields)
+            batch: List[_PendingDocument] = []
+            pending_sentences = 0
+            for index in indexes:
+                start_time = time.time()
+                try:
+                    hits, analysis = self._analyze(texts[index], plan)
+                    # Chỉ trường không khớp pattern mới cần semantic search
+                    columns = analysis.pending_sentences(
+                        field.name for field in plan.fields if field.keywords and field.name not in hits
+                    ) if self.semantic_model_ready else []
+                except Exception as e:
+                    logger.error("Lỗi local AI extraction: %s", e)
+                    results[index] = ExtractionRecord(
+                        fields=[], confidence_score=0.0, processing_time=time.time() - start_time
+                    )
+                    continue
+                batch.append(_PendingDocument(index, hits, analysis, columns, time.time() - start_time))
+                pending_sentences += len(columns)
+                if pending_sentences >= settings.EXTRACTION_BATCH_SENTENCES \
+                        or len(batch) >= settings.EXTRACTION_BATCH_DOCUMENTS:
+                    self._extract_batch(texts, plan, batch, results)
+                    batch, pending_sentences = [], 0
+            if batch:
+                self._extract_batch(texts, plan, batch, results)
+        return results
+    
+    def _extract_batch(self, texts: Sequence[str], plan: ExtractionPlan,
+                       batch: List["_PendingDocument"], results: List[Optional[ExtractionRecord]]) -> None:
+        """Encode câu ứng viên của cả batch một lần rồi trích xuất từng tài liệu"""
+        sentences = [document.analysis.sentences[i] for document in batch for i in document.columns]
+        encode_start = time.time()
+        embeddings = None
+        if sentences:
+            try:
+                with stage_timer("semantic_search.encode"):
+                    embeddings = self.encoder(sentences)
+            except Exception as e:
+                # Từng tài liệu sẽ tự encode lại khi cần (như process_document)
+                logger.error("Lỗi encode batch %d câu: %s", len(sentences), e)
+        # Thời gian encode chia đều cho các tài liệu trong batch
+        share = (time.time() - encode_start) / len(batch)
+        
+        offset = 0
+        for document in batch:
+            start_time = time.time() - document.elapsed - share
+            try:
+                if embeddings is not None and document.columns:
+                    document.analysis.set_sentence_embeddings(
+                        document.columns, embeddings[offset:offset + len(document.columns)]
+                    )
+                offset += len(document.columns)
+                results[document.index] = self._extract_fields(
+                    texts[document.index], plan, document.hits, document.analysis, start_time
+                )
+            except Exception as e:
+                logger.error("Lỗi local AI extraction: %s", e)
+                results[document.index] = ExtractionRecord(
+                    fields=[], confidence_score=0.0, processing_time=time.time() - start_time
+                )
+    
+    def _analyze(self, text: str, plan: ExtractionPlan) -> Tuple[Dict[str, PatternMatch], DocumentAnalysis]:
+        """Quét pattern và tạo phân tích dùng chung của một tài liệu"""
+        # Quét pattern của tất cả các trường một lần cho cả tài liệu (giới hạn thời gian regex)
+        with stage_timer("extraction.scan"):
+            hits = plan.scan(text, RegexBudget())
+        
+        # NER và embedding câu chạy một lần cho cả tài liệu, dùng chung cho mọi trường
+        analysis = DocumentAnalysis(
+            text, self.nlp_processor,
+            encoder=self.encoder,
+            keywords=plan.keywords,
+            matcher=plan.matcher if settings.KEYWORD_PREFILTER else None,
+            vectorizer=self.vectorizer
+        )
+        return hits, analysis
+    
+    def _extract_fields(self, text: str, plan: ExtractionPlan, hits: Dict[str, PatternMatch],
+                        analysis: DocumentAnalysis, start_time: float) -> ExtractionRecord:
+        """Chọn giá trị tốt nhất cho từng trường của plan"""
+        extracted_fields = []
+        
+        # Thử multiple extraction methods
+        methods = [
+            (self.extract_field_with_patterns, {"hits": hits, "analysis": analysis}),
+            (self.extract_with_entities, {"analysis": analysis}),
+        ]
+        
+        for field_plan in plan.fields:
+            
+            best_value = ""
+            best_confidence = 0.0
+            best_original = ""
+            
+            for method, kwargs in methods:
+                try:
+                    with stage_timer(f"extraction.{method.__name__}"):
+                        value, confidence, original = method(text, field_plan, **kwargs)
+                    if confidence > best_confidence:
+                        best_value = value
+                        best_confidence = confidence
+                        best_original = original
+                except Exception as e:
+                    logger.error("Lỗi method %s: %s", method.__name__, e)
+                    continue
+            
+            # Tạo FieldRecord
+            field = FieldRecord(
+                name=field_plan.name,
+                value=best_value,
+                field_type=field_plan.field_type,
+                confidence_score=best_confidence,
+                is_required=field_plan.required,
+                original_text=best_original
+            )
+            extracted_fields.append(field)
+        
+        # Tính overall confidence
+        confidences = [f.confidence_score for f in extracted_fields if f.confidence_score > 0]
+        overall_confidence = sum(confidences) / len(confidences) if confidences else 0.0
+        
+        processing_time = time.time() - start_time
+        
+        logger.debug("Local AI extraction hoàn thành: %d trường, confidence: %.2f, thời gian: %.2fs",
+                     len(extracted_fields), overall_confidence, processing_time)
+        
+        return ExtractionRecord(
+            fields=extracted_fields,
+            confidence_score=overall_confidence,
+            processing_time=processing_time
+        )
+    
 class AIServiceLocal:
     """AI Service sử dụng local models với OpenAI fallback"""
     
@@ -510,60 +831,82 @@ class AIServiceLocal:
         else:
             self.openai_available = False
     
-    def process_document(self, text: str, document_type: DocumentType, custom_fields: Optional[List[str]] = None) -> AIExtractionResult:
+    def process_document(self, text: str, document_type: DocumentType, custom_fields: Optional[List[str]] = None) -> ExtractionRecord:
         """Xử lý tài liệu với local AI và OpenAI fallback"""
         try:
-            logger.info(f"Bắt đầu AI extraction cho loại tài liệu: {document_type.value}")
+            logger.debug("Bắt đầu AI extraction cho loại tài liệu: %s", document_type.value)
             
             # Thử local extraction trước
             local_result = self.local_extractor.process_document(text, document_type, custom_fields)
-            
-            # Nếu local result có confidence tốt, sử dụng luôn
-            if local_result.confidence_score >= settings.MIN_CONFIDENCE_SCORE:
-                logger.info(f"Sử dụng kết quả local AI (confidence: {local_result.confidence_score:.2f})")
-                return local_result
-            
-            # Nếu local result không tốt và có OpenAI, thử OpenAI
-            if self.openai_available and local_result.confidence_score < 0.6:
-                logger.info("Local confidence thấp, thử OpenAI fallback")
-                openai_result = self._extract_with_openai(text, document_type, custom_fields)
-                
-                # So sánh và chọn kết quả tốt hơn
-                if openai_result.confidence_score > local_result.confidence_score:
-                    logger.info(f"Sử dụng kết quả OpenAI (confidence: {openai_result.confidence_score:.2f})")
-                    return openai_result
-            
-            logger.info(f"Sử dụng kết quả local AI (confidence: {local_result.confidence_score:.2f})")
-            return local_result
+            return self._select_result(text, document_type, custom_fields, local_result)
             
         except Exception as e:
-            logger.error(f"Lỗi AI extraction: {str(e)}")
-            return AIExtractionResult(
+            logger.error("Lỗi AI extraction: %s", e)
+            return ExtractionRecord(
                 fields=[],
                 confidence_score=0.0,
                 processing_time=0.0
             )
     
-    def _extract_with_openai(self, text: str, document_type: DocumentType, custom_fields: Optional[List[str]] = None) -> AIExtractionResult:
+    def process_documents(self, texts: Sequence[str], document_types: Sequence[DocumentType],
+                          custom_fields: Optional[List[str]] = None) -> List[ExtractionRecord]:
+        """Xử lý nhiều tài liệu (backfill): local extraction theo batch, OpenAI fallback từng tài liệu
+
+        Kết quả theo thứ tự texts; chuyển sang AIExtractionResult bằng to_schema() như process_document().
+        """
+        logger.debug("Bắt đầu AI extraction cho %d tài liệu", len(texts))
+        local_results = self.local_extractor.process_documents(texts, document_types, custom_fields)
+        results = []
+        for text, document_type, local_result in zip(texts, document_types, local_results):
+            try:
+                results.append(self._select_result(text, document_type, custom_fields, local_result))
+            except Exception as e:
+                logger.error("Lỗi AI extraction: %s", e)
+                results.append(local_result)
+        return results
+    
+    def _select_result(self, text: str, document_type: DocumentType, custom_fields: Optional[List[str]],
+                       local_result: ExtractionRecord) -> ExtractionRecord:
+        """Chọn giữa kết quả local và OpenAI fallback"""
+        # Nếu local result có confidence tốt, sử dụng luôn
+        if local_result.confidence_score >= settings.MIN_CONFIDENCE_SCORE:
+            logger.info("Sử dụng kết quả local AI (confidence: %.2f)", local_result.confidence_score)
+            return local_result
+        
+        # Nếu local result không tốt và có OpenAI, thử OpenAI
+        if self.openai_available and local_result.confidence_score < 0.6:
+            logger.info("Local confidence thấp, thử OpenAI fallback")
+            with stage_timer("extraction.openai"):
+                openai_result = self._extract_with_openai(text, document_type, custom_fields)
+            
+            # So sánh và chọn kết quả tốt hơn
+            if openai_result.confidence_score > local_result.confidence_score:
+                logger.info("Sử dụng kết quả OpenAI (confidence: %.2f)", openai_result.confidence_score)
+                return openai_result
+        
+        logger.info("Sử dụng kết quả local AI (confidence: %.2f)", local_result.confidence_score)
+        return local_result
+    
+    def _extract_with_openai(self, text: str, document_type: DocumentType, custom_fields: Optional[List[str]] = None) -> ExtractionRecord:
         """OpenAI extraction (fallback)"""
         try:
             # Import logic from original ai_service.py
             # ... (implement OpenAI extraction similar to original)
             # For now, return empty result
-            return AIExtractionResult(
+            return ExtractionRecord(
                 fields=[],
                 confidence_score=0.0,
                 processing_time=0.0
             )
         except Exception as e:
-            logger.error(f"Lỗi OpenAI extraction: {str(e)}")
-            return AIExtractionResult(
+            logger.error("Lỗi OpenAI extraction: %s", e)
+            return ExtractionRecord(
                 fields=[],
                 confidence_score=0.0,
                 processing_time=0.0
             )
     
-    def validate_extracted_data(self, fields: List[DocumentField]) -> Dict[str, Any]:
+    def validate_extracted_data(self, fields: List[FieldRecord]) -> Dict[str, Any]:
         """Validate dữ liệu đã trích xuất"""
         validation_results = {
             "is_valid": True,
@@ -1,14 +1,27 @@
 import uuid
+import base64
 import logging
 import time
-from typing import List, Optional, Dict, Any
-from datetime import datetime
+from typing import List, Optional, Dict, Any, Tuple
+from datetime import datetime, timedelta
 from pathlib import Path
 import os
+from functools import partial
 
 from app.models.schemas import (
     DocumentProcessingRequest, DocumentProcessingResponse, 
-    DocumentType, ProcessingStatus, OCRResult, AIExtractionResult
+    DocumentType, ProcessingStatus, AIExtractionResult, PriorityClass,
+    DocumentSummary
+)
+from app.models.records import PageRecord
+from app.models.geometry import PageGeometry
+from app.services.scheduler_service import PageScheduler
+from app.services.document_store import create_document_store
+from app.services.statistics_service import StatisticsCollector
+from app.services.retention_service import RetentionManager
+from app.services.tracing_service import tracer
+from app.services.metrics_service import (
+    stage_timer, collect_timings, Timings, STAGE_DURATION, PAGES_PROCESSED, DOCUMENTS_PROCESSED
 )
 from config.settings import settings
 
@@ -41,7 +54,17 @@ class DocumentService:
         """Khởi tạo Document service"""
         self.ocr_service = OCRService()
         self.ai_service = AIService()
-        self.processed_documents: Dict[str, DocumentProcessingResponse] = {}
+        self.scheduler = PageScheduler()
+        self.store = create_document_store()
+        self.statistics = StatisticsCollector()
+        if self.store.shared:
+            # Một worker xóa theo index created_at thay vì mỗi worker dựng heap toàn bộ tài liệu
+            self.retention = RetentionManager(
+                self.delete_document, sweep_callback=self._delete_expired,
+                lock_path=Path(f"{settings.DOCUMENT_STORE_PATH}.retention.lock"))
+        else:
+            self.retention = RetentionManager(self.delete_document)
+            self.retention.track_all(self.store.iter_keys())
         
         # Tạo thư mục upload nếu chưa tồn tại
         self.upload_dir = Path(settings.UPLOAD_DIR)
@@ -67,6 +90,61 @@ class DocumentService:
         
         return validation_result
     
+    def estimate_page_count(self, file_content: bytes) -> int:
+        """Ước lượng số trang của tài liệu (dùng cho admission control)"""
+        try:
+            return self.ocr_service.estimate_page_count(file_content)
+        except Exception as e:
+            logger.warning("Không ước lượng được số trang: %s", e)
+            return 1
+    
+    def resolve_priority(self, request: DocumentProcessingRequest, page_count: int) -> PriorityClass:
+        """Xác định lớp ưu tiên: theo request hoặc tự động theo số trang"""
+        if request.priority:
+            return request.priority
+        if page_count <= settings.SCHEDULER_INTERACTIVE_MAX_PAGES:
+            return PriorityClass.INTERACTIVE
+        return PriorityClass.BULK
+    
+    def run_ocr(self, file_content: bytes, request: DocumentProcessingRequest,
+                page_count: int, ticket=None) -> List[PageRecord]:
+        """OCR tài liệu theo từng trang thông qua page scheduler"""
+        priority = self.resolve_priority(request, page_count)
+        client_id = request.client_id or "anonymous"
+        # Page task chạy ở worker thread, gắn span hiện tại để trace nối tiếp
+        tasks = [
+            tracer.wrap(partial(self._process_page, file_content, page_num))
+            for page_num in range(1, page_count + 1)
+        ]
+        job = self.scheduler.submit(client_id, priority, tasks, listener=ticket)
+        logger.debug("Đã xếp lịch %d trang (client: %s, ưu tiên: %s)", page_count, client_id, priority.value)
+        return job.wait()
+    
+    def _process_page(self, file_content: bytes, page_num: int) -> PageRecord:
+        """Page task: rasterize + OCR một trang, ghi nhận độ trễ"""
+        with collect_timings() as timings:
+            with stage_timer("page", self.statistics.observe_stage):
+                tracer.set_attributes(page_number=page_num)
+                result = self.ocr_service.process_pdf_page(file_content, page_num)
+        result.timings = timings.as_dict()
+        PAGES_PROCESSED.inc()
+        return result
+    
+    @staticmethod
+    def _document_timings(timings: Timings, pages: List[PageRecord], total: float) -> Dict[str, float]:
+        """Gộp thời gian các stage của tài liệu với tổng thời gian các trang (tiền tố page.)"""
+        for page in pages:
+            if page.timings:
+                timings.merge(page.timings, prefix="page.")
+        timings.add("total", total)
+        return timings.as_dict()
+    
+    def _save(self, document: DocumentProcessingResponse, new: bool = False) -> None:
+        """Lưu tài liệu, tài liệu mới được đưa vào retention"""
+        self.store.save(document)
+        if new:
+            self.retention.track(DocumentSummary.from_document(document))
+    
     def save_uploaded_file(self, file_content: bytes, filename: str) -> str:
         """Lưu file đã upload"""
         try:
@@ -80,180 +158,262 @@ class DocumentService:
             with open(file_path, 'wb') as f:
                 f.write(file_content)
             
-            logger.info(f"Đã lưu file: {saved_filename}")
+            logger.info("Đã lưu file: %s", saved_filename)
             return str(file_path)
             
         except Exception as e:
-            logger.error(f"Lỗi lưu file: {str(e)}")
+            logger.error("Lỗi lưu file: %s", e)
             raise
     
     def process_document(self, 
                         file_content: bytes, 
                         filename: str, 
-                        request: DocumentProcessingRequest) -> DocumentProcessingResponse:
-        """Xử lý tài liệu hoàn chỉnh (OCR + AI)"""
+                        request: DocumentProcessingRequest,
+                        ticket=None) -> DocumentProcessingResponse:
+        """Xử lý tài liệu hoàn chỉnh (OCR + AI)
+        
+        ticket (tùy chọn) là AdmissionTicket nhận thông báo tiến độ từng trang.
+        """
         
         start_time = time.time()
         document_id = str(uuid.uuid4())
+        response = None
         
-        try:
-            logger.info(f"Bắt đầu xử lý tài liệu: {filename} (ID: {document_id})")
+        with tracer.trace("process_document", document_id=document_id, filename=filename), \
+                collect_timings() as timings:
+            try:
+                logger.info("Bắt đầu xử lý tài liệu: %s (ID: %s)", filename, document_id)
             
-            # Validate file
-            validation = self.validate_file(filename, len(file_content))
-            if not validation["is_valid"]:
-                raise ValueError(f"File không hợp lệ: {', '.join(validation['errors'])}")
+                # Validate file
+                with tracer.span("validate_file", size=len(file_content)):
+                    validation = self.validate_file(filename, len(file_content))
+                if not validation["is_valid"]:
+                    raise ValueError(f"File không hợp lệ: {', '.join(validation['errors'])}")
             
-            # Nhận diện loại tài liệu từ tên file nếu chưa được chỉ định
-            document_type = request.document_type
-            if not document_type:
-                document_type = self.ocr_service.detect_document_type(filename)
+                # Nhận diện loại tài liệu từ tên file nếu chưa được chỉ định
+                document_type = request.document_type
+                if not document_type:
+                    with tracer.span("detect_document_type"):
+                        document_type = self.ocr_service.detect_document_type(filename)
+                tracer.set_attributes(document_type=document_type.value)
             
-            # Tạo response ban đầu
-            response = DocumentProcessingResponse(
-                document_id=document_id,
-                filename=filename,
-                document_type=document_type,
-                status=ProcessingStatus.PROCESSING,
-                ocr_results=[],
-                ai_extraction=AIExtractionResult(
-                    fields=[],
-                    confidence_score=0.0,
-                    processing_time=0.0
-                ),
-                total_pages=0,
-                processing_time=0.0,
-                created_at=datetime.now(),
-                updated_at=None
-            )
+                # Tạo response ban đầu
+                response = DocumentProcessingResponse(
+                    document_id=document_id,
+                    filename=filename,
+                    document_type=document_type,
+                    status=ProcessingStatus.PROCESSING,
+                    ocr_results=[],
+                    ai_extraction=AIExtractionResult(
+                        fields=[],
+                        confidence_score=0.0,
+                        processing_time=0.0
+                    ),
+                    total_pages=0,
+                    processing_time=0.0,
+                    created_at=datetime.now(),
+                    updated_at=None
+                )
             
-            # Lưu vào bộ nhớ tạm
-            self.processed_documents[document_id] = response
+                # Lưu trạng thái PROCESSING
+                self._save(response, new=True)
             
-            # Bước 1: OCR
-            logger.info(f"Bước 1: Thực hiện OCR cho tài liệu {document_id}")
-            ocr_results = self.ocr_service.process_pdf_bytes(file_content)
+                # Bước 1: OCR
+                logger.debug("Bước 1: Thực hiện OCR cho tài liệu %s", document_id)
+                # Số trang thật từ rasterizer (ước lượng chỉ dùng cho admission), lỗi thì tài liệu FAILED
+                page_count = self.ocr_service.get_page_count(file_content)
+                if ticket is not None and ticket.pages != page_count:
+                    ticket.resize(page_count)
+                with stage_timer("ocr", self.statistics.observe_stage):
+                    ocr_results = self.run_ocr(file_content, request, page_count, ticket)
             
-            # Cập nhật kết quả OCR
-            response.ocr_results = ocr_results
-            response.total_pages = len(ocr_results)
+                # Cập nhật kết quả OCR (chuyển record nội bộ sang schema một lần)
+                response.ocr_results = [result.to_schema() for result in ocr_results]
+                geometry = {
+                    result.page_number: result.geometry.to_bytes()
+                    for result in ocr_results if result.geometry is not None
+                }
+                if geometry:
+                    self.store.save_geometry(document_id, geometry)
+                response.total_pages = len(ocr_results)
             
-            # Bước 2: AI Extraction
-            logger.info(f"Bước 2: Thực hiện AI extraction cho tài liệu {document_id}")
-            combined_text = self.ocr_service.get_combined_text(ocr_results)
+                # Bước 2: AI Extraction
+                logger.debug("Bước 2: Thực hiện AI extraction cho tài liệu %s", document_id)
+                combined_text = self.ocr_service.get_combined_text(ocr_results)
             
-            ai_extraction = self.ai_service.process_document(
-                text=combined_text,
-                document_type=document_type,
-                custom_fields=request.custom_fields
-            )
+                with stage_timer("ai_extraction", self.statistics.observe_stage):
+                    ai_extraction = self.ai_service.process_document(
+                        text=combined_text,
+                        document_type=document_type,
+                        custom_fields=request.custom_fields
+                    )
             
-            # Cập nhật kết quả AI
-            response.ai_extraction = ai_extraction
+                # Cập nhật kết quả AI
+                response.ai_extraction = ai_extraction.to_schema()
             
-            # Bước 3: Validation
-            logger.info(f"Bước 3: Validate dữ liệu cho tài liệu {document_id}")
-            validation_results = self.ai_service.validate_extracted_data(ai_extraction.fields)
+                # Bước 3: Validation
+                logger.debug("Bước 3: Validate dữ liệu cho tài liệu %s", document_id)
+                with stage_timer("validation", self.statistics.observe_stage):
+                    validation_results = self.ai_service.validate_extracted_data(ai_extraction.fields)
             
-            # Cập nhật trạng thái
-            response.status = ProcessingStatus.COMPLETED
-            response.processing_time = time.time() - start_time
-            response.updated_at = datetime.now()
+                # Cập nhật trạng thái
+                response.status = ProcessingStatus.COMPLETED
+                response.processing_time = time.time() - start_time
+                response.updated_at = datetime.now()
+                response.timings = self._document_timings(timings, ocr_results, response.processing_time)
+                self._save(response)
+                self.statistics.observe_stage("total", response.processing_time)
+                self.statistics.record_completion(response.total_pages)
+                STAGE_DURATION.observe(response.processing_time, stage="total")
+                DOCUMENTS_PROCESSED.inc(status=ProcessingStatus.COMPLETED.value)
             
-            # Lưu thông tin validation vào metadata (có thể mở rộng schema)
-            logger.info(f"Validation results: {validation_results}")
+                # Lưu thông tin validation vào metadata (có thể mở rộng schema)
+                logger.debug("Validation results: %s", validation_results)
             
-            logger.info(f"Hoàn thành xử lý tài liệu {document_id}: "
-                       f"OCR {len(ocr_results)} trang, "
-                       f"AI {len(ai_extraction.fields)} trường, "
-                       f"thời gian: {response.processing_time:.2f}s")
+                # Thời gian từng stage đã có trong metrics/timings, chỉ log một dòng tổng kết
+                logger.info("Hoàn thành xử lý tài liệu %s: OCR %d trang, AI %d trường, thời gian: %.2fs",
+                            document_id, len(ocr_results), len(ai_extraction.fields), response.processing_time)
             
-            return response
+                return response
             
-        except Exception as e:
-            logger.error(f"Lỗi xử lý tài liệu {document_id}: {str(e)}")
-            
-            # Cập nhật trạng thái lỗi
-            response.status = ProcessingStatus.FAILED
-            response.processing_time = time.time() - start_time
-            response.updated_at = datetime.now()
+            except Exception as e:
+                logger.error("Lỗi xử lý tài liệu %s: %s", document_id, e)
             
-            self.processed_documents[document_id] = response
-            raise
+                # Cập nhật trạng thái lỗi (nếu tài liệu đã được tạo)
+                if response is not None:
+                    response.status = ProcessingStatus.FAILED
+                    response.processing_time = time.time() - start_time
+                    response.updated_at = datetime.now()
+                    response.timings = self._document_timings(timings, [], response.processing_time)
+                    self._save(response)
+                    DOCUMENTS_PROCESSED.inc(status=ProcessingStatus.FAILED.value)
+                raise
+    
     
     def get_document(self, document_id: str) -> Optional[DocumentProcessingResponse]:
         """Lấy thông tin tài liệu đã xử lý"""
-        return self.processed_documents.get(document_id)
+        return self.store.get(document_id)
+    
+    def get_summary(self, document_id: str) -> Optional[DocumentSummary]:
+        """Lấy tóm tắt tài liệu (không đọc kết quả OCR)"""
+        return self.store.get_summary(document_id)
     
-    def list_documents(self, page: int = 1, page_size: int = 10) -> Dict[str, Any]:
-        """Lấy danh sách tài liệu đã xử lý"""
-        documents = list(self.processed_documents.values())
+    def get_page_words(self, document_id: str, page_number: int,
+                       bbox: Optional[Tuple[int, int, int, int]] = None) -> Optional[Dict[str, Any]]:
+        """Lấy các từ của một trang (lọc theo vùng bbox) từ hình học đã lưu"""
+        data = self.store.get_geometry(document_id, page_number)
+        if data is None:
+            return None
         
-        # Sắp xếp theo thời gian tạo (mới nhất trước)
-        documents.sort(key=lambda x: x.created_at, reverse=True)
+        geometry = PageGeometry.from_bytes(data)
+        indices = geometry.query(bbox)
+        return {
+            "document_id": document_id,
+            "page_number": page_number,
+            "width": geometry.width,
+            "height": geometry.height,
+            "total_words": len(geometry),
+            "words": geometry.words(indices)
+        }
+    
+    def get_ocr_pages(self, document_id: str, cursor: Optional[int] = None,
+                      limit: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Lấy kết quả OCR theo trang, phân trang bằng cursor là số trang bắt đầu
+
+        Mặc định trả về tối đa OCR_PAGE_MAX_LIMIT trang; store chỉ đọc các trang cần lấy.
+        """
+        summary = self.store.get_summary(document_id)
+        if not summary:
+            return None
         
-        # Phân trang
-        total = len(documents)
-        start_idx = (page - 1) * page_size
-        end_idx = start_idx + page_size
-        page_documents = documents[start_idx:end_idx]
+        limit = min(limit or settings.OCR_PAGE_MAX_LIMIT, settings.OCR_PAGE_MAX_LIMIT)
+        # Lấy thêm một trang để biết còn trang tiếp theo
+        ocr_results = self.store.get_pages(document_id, start=cursor or 1, limit=limit + 1)
+        next_cursor = None
+        if len(ocr_results) > limit:
+            next_cursor = ocr_results[limit].page_number
+            ocr_results = ocr_results[:limit]
         
         return {
-            "documents": page_documents,
+            "document_id": document_id,
+            "total_pages": summary.total_pages,
+            "ocr_results": ocr_results,
+            "next_cursor": next_cursor
+        }
+    
+    @staticmethod
+    def encode_cursor(created_at: datetime, document_id: str) -> str:
+        """Mã hóa keyset cursor (created_at, document_id)"""
+        raw = f"{created_at.timestamp()!r}|{document_id}".encode("utf-8")
+        return base64.urlsafe_b64encode(raw).decode("ascii")
+    
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[float, str]:
+        """Giải mã keyset cursor, ném ValueError nếu không hợp lệ"""
+        try:
+            raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+            timestamp, document_id = raw.split("|", 1)
+            return float(timestamp), document_id
+        except Exception:
+            raise ValueError("Cursor không hợp lệ")
+    
+    def list_documents(self, page: int = 1, page_size: int = 10, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """Lấy danh sách tóm tắt tài liệu đã xử lý (mới nhất trước)
+        
+        Với cursor, trang được lấy bằng keyset trên index created_at (O(page_size)) và
+        không đếm tổng (total/total_pages là None); không có cursor thì dùng page/offset
+        để tương thích.
+        """
+        # Lấy thêm 1 bản ghi để biết còn trang tiếp theo hay không
+        if cursor:
+            summaries = self.store.list_summaries(page_size + 1, before=self.decode_cursor(cursor))
+        else:
+            summaries = self.store.list_summaries(page_size + 1, offset=(page - 1) * page_size)
+        
+        next_cursor = None
+        if len(summaries) > page_size:
+            summaries = summaries[:page_size]
+            last = summaries[-1]
+            next_cursor = self.encode_cursor(last.created_at, last.document_id)
+        
+        total = total_pages = None
+        if not cursor:
+            total = self.store.count()
+            total_pages = (total + page_size - 1) // page_size
+        return {
+            "documents": summaries,
             "total": total,
             "page": page,
             "page_size": page_size,
-            "total_pages": (total + page_size - 1) // page_size
+            "total_pages": total_pages,
+            "next_cursor": next_cursor
         }
     
     def delete_document(self, document_id: str) -> bool:
         """Xóa tài liệu đã xử lý"""
-        if document_id in self.processed_documents:
-            del self.processed_documents[document_id]
-            logger.info(f"Đã xóa tài liệu {document_id}")
+        if self.store.delete(document_id):
+            self.retention.forget(document_id)
+            logger.info("Đã xóa tài liệu %s", document_id)
             return True
         return False
     
     def get_statistics(self) -> Dict[str, Any]:
-        """Lấy thống kê xử lý"""
-        documents = list(self.processed_documents.values())
-        
-        stats = {
-            "total_documents": len(documents),
-            "by_status": {},
-            "by_document_type": {},
-            "average_processing_time": 0.0,
-            "total_pages_processed": 0,
-            "average_confidence": 0.0
-        }
-        
-        if not documents:
-            return stats
-        
-        # Thống kê theo trạng thái
-        for doc in documents:
-            status = doc.status.value
-            stats["by_status"][status] = stats["by_status"].get(status, 0) + 1
-            
-            # Thống kê theo loại tài liệu
-            doc_type = doc.document_type.value
-            stats["by_document_type"][doc_type] = stats["by_document_type"].get(doc_type, 0) + 1
-            
-            # Tính tổng
-            stats["total_pages_processed"] += doc.total_pages
-        
-        # Tính trung bình
-        completed_docs = [doc for doc in documents if doc.status == ProcessingStatus.COMPLETED]
-        if completed_docs:
-            stats["average_processing_time"] = sum(doc.processing_time for doc in completed_docs) / len(completed_docs)
-            stats["average_confidence"] = sum(doc.ai_extraction.confidence_score for doc in completed_docs) / len(completed_docs)
-        
-        return stats
+        """Lấy thống kê xử lý
+
+        Thống kê tài liệu tính từ store (giống nhau giữa các worker); latency và
+        throughput là của worker đang phục vụ request (worker_pid).
+        """
+        statistics = self.store.aggregates()
+        statistics.update(self.statistics.snapshot())
+        statistics["worker_pid"] = os.getpid()
+        statistics["storage"] = self.store.get_status()
+        statistics["retention"] = self.retention.get_status()
+        return statistics
     
     def reprocess_document(self, document_id: str, request: DocumentProcessingRequest) -> Optional[DocumentProcessingResponse]:
         """Xử lý lại tài liệu với cấu hình mới"""
         # Lấy tài liệu cũ
-        old_doc = self.processed_documents.get(document_id)
+        old_doc = self.store.get(document_id)
         if not old_doc:
             return None
         
@@ -263,37 +423,42 @@ class DocumentService:
             
             # Xử lý lại AI với cấu hình mới
             document_type = request.document_type or old_doc.document_type
-            ai_extraction = self.ai_service.process_document(
-                text=combined_text,
-                document_type=document_type,
-                custom_fields=request.custom_fields
-            )
+            with tracer.trace("reprocess_document", document_id=document_id), collect_timings() as timings:
+                with stage_timer("ai_extraction", self.statistics.observe_stage):
+                    ai_extraction = self.ai_service.process_document(
+                        text=combined_text,
+                        document_type=document_type,
+                        custom_fields=request.custom_fields
+                    )
             
             # Cập nhật kết quả
-            old_doc.ai_extraction = ai_extraction
+            old_doc.ai_extraction = ai_extraction.to_schema()
             old_doc.document_type = document_type
             old_doc.updated_at = datetime.now()
+            old_doc.timings = {
+                **(old_doc.timings or {}),
+                **{f"reprocess.{stage}": seconds for stage, seconds in timings.as_dict().items()}
+            }
+            self._save(old_doc)
             
-            logger.info(f"Đã xử lý lại tài liệu {document_id}")
+            logger.info("Đã xử lý lại tài liệu %s", document_id)
             return old_doc
             
         except Exception as e:
-            logger.error(f"Lỗi xử lý lại tài liệu {document_id}: {str(e)}")
+            logger.error("Lỗi xử lý lại tài liệu %s: %s", document_id, e)
             return None
     
+    def _delete_expired(self, cutoff: datetime) -> int:
+        """Xóa tài liệu tạo trước cutoff (retention của store dùng chung)"""
+        return len(self.store.delete_older_than(cutoff))
+    
     def cleanup_old_documents(self, max_age_hours: int = 24) -> int:
         """Dọn dẹp các tài liệu cũ"""
-        current_time = datetime.now()
-        expired_docs = []
-        
-        for doc_id, doc in self.processed_documents.items():
-            age_hours = (current_time - doc.created_at).total_seconds() / 3600
-            if age_hours > max_age_hours:
-                expired_docs.append(doc_id)
-        
-        # Xóa các tài liệu hết hạn
-        for doc_id in expired_docs:
-            del self.processed_documents[doc_id]
+        cutoff = datetime.now() - timedelta(hours=max_age_hours)
+        expired = self.store.delete_older_than(cutoff)
+        for summary in expired:
+            self.retention.forget(summary.document_id)
+        cleaned_count = len(expired)
         
-        logger.info(f"Đã dọn dẹp {len(expired_docs)} tài liệu cũ")
-        return len(expired_docs)
+        logger.info("Đã dọn dẹp %d tài liệu cũ", cleaned_count)
+        return cleaned_count
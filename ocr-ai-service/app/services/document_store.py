@@ -0,0 +1,619 @@
+import bisect
+import json
+import logging
+import sqlite3
+import sys
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from app.models.schemas import DocumentProcessingResponse, DocumentSummary, OCRResult, ProcessingStatus
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Khóa sắp xếp/keyset: (created_at timestamp, document_id)
+SortKey = Tuple[float, str]
+
+
+def sort_key(document: DocumentProcessingResponse) -> SortKey:
+    return document.created_at.timestamp(), document.document_id
+
+
+# Nhóm thống kê: (status, document_type, số tài liệu, số trang, tổng processing_time, tổng confidence)
+AggregateGroup = Tuple[str, str, int, int, float, float]
+
+
+def merge_aggregates(groups: Iterable[AggregateGroup]) -> Dict[str, Any]:
+    """Gộp các nhóm (status, document_type) thành thống kê tài liệu
+
+    Thời gian xử lý và confidence trung bình chỉ tính trên tài liệu COMPLETED.
+    """
+    by_status: Dict[str, int] = {}
+    by_document_type: Dict[str, int] = {}
+    total_documents = total_pages = completed = 0
+    completed_time = completed_confidence = 0.0
+    for status, document_type, count, pages, processing_time, confidence in groups:
+        total_documents += count
+        total_pages += pages or 0
+        by_status[status] = by_status.get(status, 0) + count
+        by_document_type[document_type] = by_document_type.get(document_type, 0) + count
+        if status == ProcessingStatus.COMPLETED.value:
+            completed += count
+            completed_time += processing_time or 0.0
+            completed_confidence += confidence or 0.0
+    return {
+        "total_documents": total_documents,
+        "by_status": by_status,
+        "by_document_type": by_document_type,
+        "average_processing_time": completed_time / completed if completed else 0.0,
+        "total_pages_processed": total_pages,
+        "average_confidence": completed_confidence / completed if completed else 0.0
+    }
+
+
+class DocumentStore(ABC):
+    """Interface lưu trữ kết quả xử lý tài liệu"""
+
+    # Dữ liệu dùng chung giữa các worker (chỉ cần một worker xóa tài liệu hết hạn)
+    shared: bool = False
+
+    @abstractmethod
+    def save(self, document: DocumentProcessingResponse) -> None:
+        """Lưu (insert hoặc update) tài liệu"""
+
+    @abstractmethod
+    def get(self, document_id: str) -> Optional[DocumentProcessingResponse]:
+        """Lấy tài liệu theo ID"""
+
+    @abstractmethod
+    def delete(self, document_id: str) -> bool:
+        """Xóa tài liệu, trả về False nếu không tồn tại"""
+
+    @abstractmethod
+    def count(self) -> int:
+        """Tổng số tài liệu"""
+
+    @abstractmethod
+    def list_summaries(self, limit: int, before: Optional[SortKey] = None,
+                       offset: int = 0) -> List[DocumentSummary]:
+        """Danh sách tóm tắt, mới nhất trước
+
+        before: keyset cursor, chỉ lấy các tài liệu có khóa nhỏ hơn (trang tiếp theo)
+        """
+
+    @abstractmethod
+    def get_pages(self, document_id: str, start: int = 1, limit: int = 100) -> List[OCRResult]:
+        """Kết quả OCR của tối đa limit trang có số trang >= start (không đọc các trang khác)"""
+
+    @abstractmethod
+    def aggregates(self) -> Dict[str, Any]:
+        """Thống kê tài liệu theo trạng thái/loại (xem merge_aggregates)"""
+
+    @abstractmethod
+    def get_summary(self, document_id: str) -> Optional[DocumentSummary]:
+        """Lấy thông tin tóm tắt theo ID"""
+
+    @abstractmethod
+    def iter_keys(self) -> Iterator[SortKey]:
+        """Duyệt khóa (created_at, document_id) của toàn bộ tài liệu (không dựng summary)"""
+
+    @abstractmethod
+    def delete_older_than(self, cutoff: datetime) -> List[DocumentSummary]:
+        """Xóa các tài liệu tạo trước cutoff, trả về tóm tắt các tài liệu đã xóa"""
+
+    @abstractmethod
+    def save_geometry(self, document_id: str, pages: Dict[int, bytes]) -> None:
+        """Lưu hình học từ (PageGeometry.to_bytes()) theo số trang"""
+
+    @abstractmethod
+    def get_geometry(self, document_id: str, page_number: int) -> Optional[bytes]:
+        """Lấy hình học từ của một trang (không đọc OCR text của tài liệu)"""
+
+    def get_status(self) -> Dict[str, Any]:
+        """Trạng thái store (bộ nhớ, spill...)"""
+        return {}
+
+
+class InMemoryDocumentStore(DocumentStore):
+    """Lưu trữ trong bộ nhớ (mất khi restart, không chia sẻ giữa các worker)
+
+    Summary của mọi tài liệu luôn nằm trong bộ nhớ. Payload đầy đủ (OCR text) bị
+    giới hạn bởi max_resident_bytes: khi vượt, payload ít được truy cập gần đây nhất
+    được spill ra đĩa và nạp lại khi có request.
+    """
+
+    def __init__(self, max_resident_bytes: int = None, spill_dir: str = None):
+        self.max_resident_bytes = max_resident_bytes if max_resident_bytes is not None \
+            else settings.DOCUMENT_STORE_MAX_RESIDENT_MB * 1024 * 1024
+        self.spill_dir = Path(spill_dir or settings.DOCUMENT_SPILL_DIR)
+
+        self._summaries: Dict[str, DocumentSummary] = {}
+        # Payload đầy đủ theo thứ tự LRU (cuối = mới truy cập nhất)
+        self._resident: "OrderedDict[str, DocumentProcessingResponse]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._spilled: Set[str] = set()
+        # Hình học từ đã ở dạng bytes cột nén gọn nên luôn giữ trong bộ nhớ
+        self._geometry: Dict[str, Dict[int, bytes]] = {}
+        self.geometry_bytes = 0
+        self.resident_bytes = 0
+        self.spill_count = 0
+        self.reload_count = 0
+        # Index sắp xếp tăng dần theo (created_at, document_id)
+        self._keys: List[SortKey] = []
+        self._key_by_id: Dict[str, SortKey] = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _estimate_size(document: DocumentProcessingResponse) -> int:
+        """Ước lượng bộ nhớ của payload (chủ yếu là OCR text)"""
+        size = 1024
+        for result in document.ocr_results:
+            size += sys.getsizeof(result.text) + 256
+        for field in document.ai_extraction.fields:
+            size += sys.getsizeof(field.value or "") + sys.getsizeof(field.original_text or "") + 256
+        return size
+
+    def _spill_path(self, document_id: str) -> Path:
+        return self.spill_dir / f"{document_id}.json.z"
+
+    def _make_resident(self, document: DocumentProcessingResponse) -> None:
+        document_id = document.document_id
+        self.resident_bytes -= self._sizes.pop(document_id, 0)
+        size = self._estimate_size(document)
+        self._resident[document_id] = document
+        self._resident.move_to_end(document_id)
+        self._sizes[document_id] = size
+        self.resident_bytes += size
+        self._enforce_cap()
+
+    def _enforce_cap(self) -> None:
+        """Spill payload LRU ra đĩa cho tới khi dưới giới hạn (giữ lại payload mới nhất)"""
+        while self.resident_bytes > self.max_resident_bytes and len(self._resident) > 1:
+            document_id, document = self._resident.popitem(last=False)
+            self.resident_bytes -= self._sizes.pop(document_id, 0)
+            try:
+                self.spill_dir.mkdir(parents=True, exist_ok=True)
+                self._spill_path(document_id).write_bytes(
+                    zlib.compress(document.model_dump_json().encode("utf-8"))
+                )
+                self._spilled.add(document_id)
+                self.spill_count += 1
+            except Exception as e:
+                logger.error("Lỗi spill tài liệu %s: %s", document_id, e)
+                self._resident[document_id] = document
+                self._resident.move_to_end(document_id, last=False)
+                self._sizes[document_id] = self._estimate_size(document)
+                self.resident_bytes += self._sizes[document_id]
+                break
+
+    def _drop(self, document_id: str) -> Optional[DocumentSummary]:
+        """Xóa mọi dữ liệu của tài liệu (gọi khi đang giữ lock)"""
+        key = self._key_by_id.pop(document_id, None)
+        if key is not None:
+            index = bisect.bisect_left(self._keys, key)
+            del self._keys[index]
+        self._resident.pop(document_id, None)
+        self.resident_bytes -= self._sizes.pop(document_id, 0)
+        for data in self._geometry.pop(document_id, {}).values():
+            self.geometry_bytes -= len(data)
+        if document_id in self._spilled:
+            self._spilled.discard(document_id)
+            self._spill_path(document_id).unlink(missing_ok=True)
+        return self._summaries.pop(document_id, None)
+
+    def save(self, document: DocumentProcessingResponse) -> None:
+        key = sort_key(document)
+        with self._lock:
+            if self._key_by_id.get(document.document_id) != key:
+                old_key = self._key_by_id.pop(document.document_id, None)
+                if old_key is not None:
+                    del self._keys[bisect.bisect_left(self._keys, old_key)]
+                bisect.insort(self._keys, key)
+                self._key_by_id[document.document_id] = key
+            self._summaries[document.document_id] = DocumentSummary.from_document(document)
+            if document.document_id in self._spilled:
+                self._spilled.discard(document.document_id)
+                self._spill_path(document.document_id).unlink(missing_ok=True)
+            self._make_resident(document)
+
+    def get(self, document_id: str) -> Optional[DocumentProcessingResponse]:
+        with self._lock:
+            document = self._resident.get(document_id)
+            if document is not None:
+                self._resident.move_to_end(document_id)
+                return document
+            if document_id not in self._spilled:
+                return None
+
+            # Nạp lại payload đã spill
+            path = self._spill_path(document_id)
+            document = DocumentProcessingResponse.model_validate_json(zlib.decompress(path.read_bytes()))
+            self._spilled.discard(document_id)
+            path.unlink(missing_ok=True)
+            self.reload_count += 1
+            self._make_resident(document)
+            return document
+
+    def delete(self, document_id: str) -> bool:
+        with self._lock:
+            return self._drop(document_id) is not None
+
+    def count(self) -> int:
+        return len(self._summaries)
+
+    def list_summaries(self, limit: int, before: Optional[SortKey] = None,
+                       offset: int = 0) -> List[DocumentSummary]:
+        with self._lock:
+            end = bisect.bisect_left(self._keys, before) if before else len(self._keys)
+            end = max(0, end - offset)
+            keys = self._keys[max(0, end - limit):end]
+            return [self._summaries[doc_id] for _, doc_id in reversed(keys)]
+
+    def get_pages(self, document_id: str, start: int = 1, limit: int = 100) -> List[OCRResult]:
+        document = self.get(document_id)
+        if document is None:
+            return []
+        results = document.ocr_results
+        index = bisect.bisect_left([result.page_number for result in results], start)
+        return results[index:index + limit]
+
+    def aggregates(self) -> Dict[str, Any]:
+        groups: Dict[Tuple[str, str], List[float]] = {}
+        with self._lock:
+            for summary in self._summaries.values():
+                group = groups.setdefault((summary.status.value, summary.document_type.value), [0, 0, 0.0, 0.0])
+                group[0] += 1
+                group[1] += summary.total_pages
+                group[2] += summary.processing_time
+                group[3] += summary.confidence_score
+        return merge_aggregates(key + tuple(values) for key, values in groups.items())
+
+    def get_summary(self, document_id: str) -> Optional[DocumentSummary]:
+        return self._summaries.get(document_id)
+
+    def iter_keys(self) -> Iterator[SortKey]:
+        with self._lock:
+            return iter(list(self._keys))
+
+    def delete_older_than(self, cutoff: datetime) -> List[DocumentSummary]:
+        with self._lock:
+            end = bisect.bisect_left(self._keys, (cutoff.timestamp(), ""))
+            expired = [doc_id for _, doc_id in self._keys[:end]]
+            return [self._drop(doc_id) for doc_id in expired]
+
+    def save_geometry(self, document_id: str, pages: Dict[int, bytes]) -> None:
+        with self._lock:
+            if document_id not in self._summaries:
+                return
+            stored = self._geometry.setdefault(document_id, {})
+            for page_number, data in pages.items():
+                self.geometry_bytes += len(data) - len(stored.get(page_number, b""))
+                stored[page_number] = data
+
+    def get_geometry(self, document_id: str, page_number: int) -> Optional[bytes]:
+        return self._geometry.get(document_id, {}).get(page_number)
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "documents": len(self._summaries),
+                "resident_documents": len(self._resident),
+                "resident_bytes": self.resident_bytes,
+                "max_resident_bytes": self.max_resident_bytes,
+                "spilled_documents": len(self._spilled),
+                "spill_evictions": self.spill_count,
+                "spill_reloads": self.reload_count,
+                "geometry_bytes": self.geometry_bytes
+            }
+
+
+class SQLiteDocumentStore(DocumentStore):
+    """Lưu trữ SQLite (WAL) dùng chung giữa các worker uvicorn
+
+    Các cột tóm tắt được đánh index; OCR text nén zlib theo từng trang (bảng ocr_pages)
+    để đọc một khoảng trang không phải giải nén cả tài liệu, AI extraction lưu JSON.
+    Mỗi thread dùng một connection riêng, WAL cho phép đọc song song với ghi.
+    """
+
+    shared = True
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS documents (
+            document_id TEXT PRIMARY KEY,
+            filename TEXT NOT NULL,
+            document_type TEXT NOT NULL,
+            status TEXT NOT NULL,
+            total_pages INTEGER NOT NULL,
+            processing_time REAL NOT NULL,
+            ai_processing_time REAL NOT NULL,
+            confidence_score REAL NOT NULL,
+            created_at REAL NOT NULL,
+            updated_at REAL,
+            ai_extraction TEXT NOT NULL,
+            ocr_results BLOB NOT NULL,  -- Không còn dùng (OCR nằm trong ocr_pages), giữ cho database cũ
+            timings TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_documents_created_at ON documents (created_at, document_id);
+        CREATE INDEX IF NOT EXISTS idx_documents_status ON documents (status);
+        CREATE INDEX IF NOT EXISTS idx_documents_type ON documents (document_type);
+        -- Index bao phủ cho thống kê GROUP BY (không phải đọc dòng dữ liệu)
+        CREATE INDEX IF NOT EXISTS idx_documents_stats
+            ON documents (status, document_type, total_pages, processing_time, confidence_score);
+        CREATE TABLE IF NOT EXISTS ocr_pages (
+            document_id TEXT NOT NULL,
+            page_number INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (document_id, page_number)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS page_geometry (
+            document_id TEXT NOT NULL,
+            page_number INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (document_id, page_number)
+        ) WITHOUT ROWID;
+    """
+
+    SUMMARY_COLUMNS = ("document_id, filename, document_type, status, total_pages, processing_time, "
+                       "ai_processing_time, confidence_score, created_at, updated_at")
+    COLUMNS = SUMMARY_COLUMNS + ", ai_extraction, timings"
+    # Phiên bản schema (PRAGMA user_version): 1 = OCR lưu theo trang
+    SCHEMA_VERSION = 1
+
+    def __init__(self, path: str = None, compression_level: int = None):
+        self.path = Path(path or settings.DOCUMENT_STORE_PATH)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.compression_level = compression_level if compression_level is not None \
+            else settings.DOCUMENT_STORE_COMPRESSION_LEVEL
+        self._local = threading.local()
+
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(self.SCHEMA)
+        self._migrate(conn)
+        logger.info("SQLite document store: %s", self.path)
+
+    def _migrate(self, conn: sqlite3.Connection) -> None:
+        """Nâng cấp database tạo từ phiên bản cũ"""
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(documents)")}
+        if "timings" not in columns:
+            with conn:
+                conn.execute("ALTER TABLE documents ADD COLUMN timings TEXT")
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= self.SCHEMA_VERSION:
+            return
+
+        with conn:
+            # Khóa ghi rồi kiểm tra lại để chỉ một worker chuyển dữ liệu
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= self.SCHEMA_VERSION:
+                return
+            rows = conn.execute(
+                "SELECT document_id, ocr_results FROM documents WHERE length(ocr_results) > 0"
+            ).fetchall()
+            for document_id, ocr_results in rows:
+                pages = [OCRResult.model_validate(result) for result in json.loads(zlib.decompress(ocr_results))]
+                conn.executemany(
+                    "INSERT OR REPLACE INTO ocr_pages (document_id, page_number, data) VALUES (?, ?, ?)",
+                    self._page_rows(document_id, pages)
+                )
+            conn.execute("UPDATE documents SET ocr_results = x'' WHERE length(ocr_results) > 0")
+            conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        if rows:
+            logger.info("Đã chuyển OCR của %d tài liệu sang bảng ocr_pages", len(rows))
+
+    def _connection(self) -> sqlite3.Connection:
+        """Connection riêng cho từng thread"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=settings.DOCUMENT_STORE_BUSY_TIMEOUT)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={int(settings.DOCUMENT_STORE_BUSY_TIMEOUT * 1000)}")
+            self._local.conn = conn
+        return conn
+
+    def _page_rows(self, document_id: str, pages: List[OCRResult]) -> List[tuple]:
+        """Dòng ocr_pages: mỗi trang nén zlib riêng"""
+        return [
+            (document_id, page.page_number,
+             zlib.compress(json.dumps(page.model_dump(), ensure_ascii=False).encode("utf-8"),
+                           self.compression_level))
+            for page in pages
+        ]
+
+    @staticmethod
+    def _page_from_data(data: bytes) -> OCRResult:
+        return OCRResult.model_validate(json.loads(zlib.decompress(data)))
+
+    def _to_row(self, document: DocumentProcessingResponse) -> tuple:
+        return (
+            document.document_id,
+            document.filename,
+            document.document_type.value,
+            document.status.value,
+            document.total_pages,
+            document.processing_time,
+            document.ai_extraction.processing_time,
+            document.ai_extraction.confidence_score,
+            document.created_at.timestamp(),
+            document.updated_at.timestamp() if document.updated_at else None,
+            document.ai_extraction.model_dump_json(),
+            json.dumps(document.timings) if document.timings is not None else None
+        )
+
+    def _from_row(self, row: tuple, ocr_results: List[OCRResult]) -> DocumentProcessingResponse:
+        (document_id, filename, document_type, status, total_pages, processing_time,
+         _ai_time, _confidence, created_at, updated_at, ai_extraction, timings) = row
+        return DocumentProcessingResponse(
+            document_id=document_id,
+            filename=filename,
+            document_type=document_type,
+            status=status,
+            ocr_results=ocr_results,
+            ai_extraction=json.loads(ai_extraction),
+            total_pages=total_pages,
+            processing_time=processing_time,
+            created_at=datetime.fromtimestamp(created_at),
+            updated_at=datetime.fromtimestamp(updated_at) if updated_at is not None else None,
+            timings=json.loads(timings) if timings is not None else None
+        )
+
+    def _summary_from_row(self, row: tuple) -> DocumentSummary:
+        (document_id, filename, document_type, status, total_pages, processing_time,
+         ai_processing_time, confidence_score, created_at, updated_at) = row
+        return DocumentSummary(
+            document_id=document_id,
+            filename=filename,
+            document_type=document_type,
+            status=status,
+            total_pages=total_pages,
+            processing_time=processing_time,
+            ai_processing_time=ai_processing_time,
+            confidence_score=confidence_score,
+            created_at=datetime.fromtimestamp(created_at),
+            updated_at=datetime.fromtimestamp(updated_at) if updated_at is not None else None
+        )
+
+    def save(self, document: DocumentProcessingResponse) -> None:
+        row = self._to_row(document)
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                f"""
+                INSERT INTO documents ({self.COLUMNS}, ocr_results)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, x'')
+                ON CONFLICT(document_id) DO UPDATE SET
+                    filename = excluded.filename,
+                    document_type = excluded.document_type,
+                    status = excluded.status,
+                    total_pages = excluded.total_pages,
+                    processing_time = excluded.processing_time,
+                    ai_processing_time = excluded.ai_processing_time,
+                    confidence_score = excluded.confidence_score,
+                    created_at = excluded.created_at,
+                    updated_at = excluded.updated_at,
+                    ai_extraction = excluded.ai_extraction,
+                    timings = excluded.timings
+                """,
+                row
+            )
+            conn.execute("DELETE FROM ocr_pages WHERE document_id = ?", (document.document_id,))
+            conn.executemany(
+                "INSERT OR REPLACE INTO ocr_pages (document_id, page_number, data) VALUES (?, ?, ?)",
+                self._page_rows(document.document_id, document.ocr_results)
+            )
+
+    def get(self, document_id: str) -> Optional[DocumentProcessingResponse]:
+        row = self._connection().execute(
+            f"SELECT {self.COLUMNS} FROM documents WHERE document_id = ?", (document_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        pages = self._connection().execute(
+            "SELECT data FROM ocr_pages WHERE document_id = ? ORDER BY page_number", (document_id,)
+        ).fetchall()
+        return self._from_row(row, [self._page_from_data(data) for data, in pages])
+
+    def get_pages(self, document_id: str, start: int = 1, limit: int = 100) -> List[OCRResult]:
+        # Chỉ giải nén các trang được yêu cầu (duyệt theo khóa chính)
+        rows = self._connection().execute(
+            "SELECT data FROM ocr_pages WHERE document_id = ? AND page_number >= ? "
+            "ORDER BY page_number LIMIT ?",
+            (document_id, start, limit)
+        ).fetchall()
+        return [self._page_from_data(data) for data, in rows]
+
+    def delete(self, document_id: str) -> bool:
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM page_geometry WHERE document_id = ?", (document_id,))
+            conn.execute("DELETE FROM ocr_pages WHERE document_id = ?", (document_id,))
+            cursor = conn.execute("DELETE FROM documents WHERE document_id = ?", (document_id,))
+        return cursor.rowcount > 0
+
+    def count(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def list_summaries(self, limit: int, before: Optional[SortKey] = None,
+                       offset: int = 0) -> List[DocumentSummary]:
+        # Chỉ đọc các cột tóm tắt, duyệt index created_at theo keyset
+        if before:
+            where = "WHERE created_at < ? OR (created_at = ? AND document_id < ?)"
+            params = (before[0], before[0], before[1])
+        else:
+            where, params = "", ()
+        rows = self._connection().execute(
+            f"SELECT {self.SUMMARY_COLUMNS} FROM documents {where} "
+            f"ORDER BY created_at DESC, document_id DESC LIMIT ? OFFSET ?",
+            params + (limit, offset)
+        ).fetchall()
+        return [self._summary_from_row(row) for row in rows]
+
+    def aggregates(self) -> Dict[str, Any]:
+        # Tính từ database dùng chung nên mọi worker thấy cùng một số liệu
+        rows = self._connection().execute(
+            "SELECT status, document_type, COUNT(*), SUM(total_pages), SUM(processing_time), "
+            "SUM(confidence_score) FROM documents GROUP BY status, document_type"
+        ).fetchall()
+        return merge_aggregates(rows)
+
+    def get_summary(self, document_id: str) -> Optional[DocumentSummary]:
+        row = self._connection().execute(
+            f"SELECT {self.SUMMARY_COLUMNS} FROM documents WHERE document_id = ?", (document_id,)
+        ).fetchone()
+        return self._summary_from_row(row) if row else None
+
+    def iter_keys(self) -> Iterator[SortKey]:
+        # Chỉ đọc index created_at (covering index), không đọc các cột khác
+        yield from self._connection().execute("SELECT created_at, document_id FROM documents")
+
+    def delete_older_than(self, cutoff: datetime) -> List[DocumentSummary]:
+        conn = self._connection()
+        with conn:
+            # Khóa ghi trước khi đọc để danh sách trả về khớp với các dòng bị xóa
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                f"SELECT {self.SUMMARY_COLUMNS} FROM documents WHERE created_at < ?",
+                (cutoff.timestamp(),)
+            ).fetchall()
+            for table in ("page_geometry", "ocr_pages"):
+                conn.execute(
+                    f"DELETE FROM {table} WHERE document_id IN "
+                    "(SELECT document_id FROM documents WHERE created_at < ?)",
+                    (cutoff.timestamp(),)
+                )
+            conn.execute("DELETE FROM documents WHERE created_at < ?", (cutoff.timestamp(),))
+        return [self._summary_from_row(row) for row in rows]
+
+    def save_geometry(self, document_id: str, pages: Dict[int, bytes]) -> None:
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO page_geometry (document_id, page_number, data) VALUES (?, ?, ?)",
+                [(document_id, page_number, data) for page_number, data in pages.items()]
+            )
+
+    def get_geometry(self, document_id: str, page_number: int) -> Optional[bytes]:
+        row = self._connection().execute(
+            "SELECT data FROM page_geometry WHERE document_id = ? AND page_number = ?",
+            (document_id, page_number)
+        ).fetchone()
+        return row[0] if row else None
+
+    def get_status(self) -> Dict[str, Any]:
+        # Payload nằm trên đĩa, bộ nhớ chỉ là page cache của SQLite
+        return {"backend": "sqlite", "path": str(self.path), "documents": self.count()}
+
+
+def create_document_store() -> DocumentStore:
+    """Tạo document store theo cấu hình DOCUMENT_STORE"""
+    backend = settings.DOCUMENT_STORE.lower()
+    if backend == "sqlite":
+        return SQLiteDocumentStore()
+    if backend == "memory":
+        return InMemoryDocumentStore()
+    raise ValueError(f"DOCUMENT_STORE không hợp lệ: {settings.DOCUMENT_STORE}")
@@ -0,0 +1,161 @@
+import logging
+import re
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import torch
+    from sentence_transformers import SentenceTransformer
+    SENTENCE_TRANSFORMERS_AVAILABLE = True
+except ImportError:
+    SENTENCE_TRANSFORMERS_AVAILABLE = False
+
+try:
+    import onnxruntime
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoTokenizer
+    ONNXRUNTIME_AVAILABLE = True
+except ImportError:
+    ONNXRUNTIME_AVAILABLE = False
+
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+
+
+class EmbeddingBackend:
+    """Interface model embedding câu: encode(list câu) -> ma trận float32 (số câu x dim)"""
+
+    name = ""
+    dim = 0
+
+    def encode(self, sentences: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """SentenceTransformer trên PyTorch (fp32, hoặc Linear lượng tử hóa động int8)"""
+
+    def __init__(self, model_name: str, quantize: bool = False, threads: int = None, batch_size: int = None):
+        self.name = "torch-int8" if quantize else "torch"
+        self.batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+        threads = threads if threads is not None else settings.EMBEDDING_THREADS
+        if threads > 0:
+            torch.set_num_threads(threads)
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.model.max_seq_length = settings.EMBEDDING_MAX_SEQ_LENGTH
+        if quantize:
+            self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def encode(self, sentences: List[str]) -> np.ndarray:
+        # SentenceTransformer tự sắp câu theo độ dài trước khi chia batch
+        with torch.inference_mode():
+            return self.model.encode(sentences, batch_size=self.batch_size, convert_to_numpy=True,
+                                     show_progress_bar=False).astype(np.float32, copy=False)
+
+
+class ONNXBackend(EmbeddingBackend):
+    """Cùng model chạy bằng ONNX Runtime (tùy chọn lượng tử hóa động int8), mean pooling
+
+    Lần đầu model được export từ SentenceTransformer vào EMBEDDING_ONNX_DIR (cần torch);
+    các lần sau chỉ cần onnxruntime và tokenizer đã lưu cùng thư mục.
+    """
+
+    def __init__(self, model_name: str, quantize: bool = True, threads: int = None,
+                 batch_size: int = None, directory: str = None):
+        self.name = "onnx-int8" if quantize else "onnx"
+        self.batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+        self.max_length = settings.EMBEDDING_MAX_SEQ_LENGTH
+        export_dir = Path(directory or settings.EMBEDDING_ONNX_DIR) / re.sub(r"[^\w.-]", "_", model_name)
+        model_path = export_dir / "model.onnx"
+        if not model_path.exists():
+            self._export(model_name, export_dir, model_path)
+        if quantize:
+            quantized_path = export_dir / "model.int8.onnx"
+            if not quantized_path.exists():
+                quantize_dynamic(str(model_path), str(quantized_path), weight_type=QuantType.QInt8)
+            model_path = quantized_path
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        threads = threads if threads is not None else settings.EMBEDDING_THREADS
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+        self.input_names = [node.name for node in self.session.get_inputs()]
+        self.tokenizer = AutoTokenizer.from_pretrained(str(export_dir))
+        self.dim = self.session.get_outputs()[0].shape[-1]
+        if not isinstance(self.dim, int):
+            self.dim = self._embed_batch(self.tokenizer(["."], return_tensors="np")).shape[1]
+
+    @staticmethod
+    def _export(model_name: str, export_dir: Path, model_path: Path) -> None:
+        if not SENTENCE_TRANSFORMERS_AVAILABLE:
+            raise RuntimeError("Cần torch và sentence-transformers để export model ONNX lần đầu")
+        logger.info("Export %s sang ONNX: %s", model_name, model_path)
+        model = SentenceTransformer(model_name, device="cpu")
+        pooling = getattr(model[1], "pooling_mode_mean_tokens", True) if len(model) > 1 else True
+        if not pooling:
+            logger.warning("Model %s không dùng mean pooling, kết quả ONNX có thể khác", model_name)
+        transformer = model[0].auto_model.eval()
+        export_dir.mkdir(parents=True, exist_ok=True)
+        model.tokenizer.save_pretrained(str(export_dir))
+
+        inputs = model.tokenizer(["xin chào"], return_tensors="pt")
+        input_names = list(inputs.keys())
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+        with torch.no_grad():
+            torch.onnx.export(
+                transformer, (dict(inputs),), str(model_path),
+                input_names=input_names, output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes, opset_version=14
+            )
+
+    def encode(self, sentences: List[str]) -> np.ndarray:
+        result = np.empty((len(sentences), self.dim), dtype=np.float32)
+        if not sentences:
+            return result
+        encoded = self.tokenizer(list(sentences), truncation=True, max_length=self.max_length)
+        # Sắp theo số token để mỗi batch chỉ pad tới câu dài nhất của chính nó
+        order = np.argsort([len(ids) for ids in encoded["input_ids"]], kind="stable")
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            features = self.tokenizer.pad(
+                {key: [encoded[key][i] for i in batch] for key in encoded.keys()}, return_tensors="np"
+            )
+            result[batch] = self._embed_batch(features)
+        return result
+
+    def _embed_batch(self, features) -> np.ndarray:
+        """Chạy model cho một batch đã pad, mean pooling theo attention mask"""
+        feeds = {name: features[name].astype(np.int64) for name in self.input_names}
+        hidden = self.session.run(None, feeds)[0]
+        mask = features["attention_mask"][..., None].astype(np.float32)
+        return (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+
+def create_embedding_backend(model_name: str = None, backend: str = None) -> Optional[EmbeddingBackend]:
+    """Tạo backend theo EMBEDDING_BACKEND; None nếu thiếu thư viện (semantic search bị tắt)"""
+    model_name = model_name or settings.SEMANTIC_MODEL
+    backend = (backend or settings.EMBEDDING_BACKEND).lower()
+    if backend not in BACKENDS:
+        logger.warning("EMBEDDING_BACKEND không hợp lệ: %s, dùng torch", backend)
+        backend = "torch"
+
+    if backend.startswith("onnx"):
+        if ONNXRUNTIME_AVAILABLE:
+            return ONNXBackend(model_name, quantize=backend == "onnx-int8")
+        logger.warning("onnxruntime không khả dụng, dùng backend torch")
+        backend = "torch-int8" if backend == "onnx-int8" else "torch"
+
+    if not SENTENCE_TRANSFORMERS_AVAILABLE:
+        logger.warning("SentenceTransformers không khả dụng")
+        return None
+    return SentenceTransformerBackend(model_name, quantize=backend == "torch-int8")
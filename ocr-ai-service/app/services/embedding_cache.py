@@ -0,0 +1,257 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+# Khóa file giữa các worker (không có trên Windows: mỗi process dùng file riêng)
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+from app.services.extraction_plan import Encoder
+from app.services.metrics_service import CACHE_REQUESTS
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+KEY_SIZE = 16
+_EMPTY_KEY = bytes(KEY_SIZE)
+
+# Header file cache trên đĩa: định danh định dạng, cấu hình, bộ đếm thứ tự ghi dùng chung
+HEADER_SIZE = 64
+_MAGIC = b"OCREMB01"
+_HEADER = np.dtype([("magic", "S8"), ("dim", "<u8"), ("capacity", "<u8"), ("seq", "<u8")])
+
+
+def normalize_sentence(sentence: str) -> str:
+    """Chuẩn hóa câu trước khi encode và tạo khóa cache (NFC, gộp khoảng trắng)"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", sentence)).strip()
+
+
+class DiskEmbeddingStore:
+    """Tầng cache trên đĩa: file memory-mapped gồm header và số slot cố định (khóa, thứ tự ghi, vector)
+
+    Khi đầy, slot được ghi đè theo vòng (slot cũ nhất trước). Các worker dùng chung
+    một file: thứ tự ghi lấy từ bộ đếm trong header dưới khóa file (flock) nên không
+    ghi đè slot của nhau, slot do worker khác ghi được đưa vào index khi tra cứu.
+    File có kích thước cố định HEADER_SIZE + capacity * kích thước slot (file thưa,
+    chỉ chiếm đĩa khi được ghi); file khác định dạng/kích thước bị tạo lại.
+    """
+
+    def __init__(self, path: Path, dim: int, capacity: int):
+        self.path = path
+        self.dim = dim
+        self.capacity = capacity
+        self.dtype = np.dtype([("key", f"V{KEY_SIZE}"), ("seq", "<u8"), ("vector", "<f4", (dim,))])
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        with self._file_lock():
+            self._prepare()
+        self._header = np.memmap(self.path, dtype=_HEADER, mode="r+", shape=(1,))
+        self._slots = np.memmap(self.path, dtype=self.dtype, mode="r+", offset=HEADER_SIZE, shape=(capacity,))
+        self._index: Dict[bytes, int] = {}
+        for slot in np.flatnonzero(self._slots["seq"]):
+            self._index[self._slots["key"][slot].tobytes()] = int(slot)
+        # Thứ tự ghi lớn nhất đã đưa vào index
+        self._seen = int(self._header["seq"][0])
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        """Khóa ghi giữa các process (không có fcntl thì file chỉ dùng riêng một process)"""
+        if FCNTL_AVAILABLE:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if FCNTL_AVAILABLE:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _prepare(self) -> None:
+        """Kiểm tra header, tạo lại file nếu không khớp cấu hình (gọi khi giữ khóa file)"""
+        size = HEADER_SIZE + self.dtype.itemsize * self.capacity
+        actual = os.fstat(self._fd).st_size
+        if actual == size:
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            header = np.frombuffer(os.read(self._fd, _HEADER.itemsize), dtype=_HEADER)[0]
+            if header["magic"] == _MAGIC and header["dim"] == self.dim and header["capacity"] == self.capacity:
+                return
+            logger.warning("Tạo lại cache embedding %s: header không khớp (dim %d, %d slot), cache cũ bị xóa",
+                           self.path, self.dim, self.capacity)
+        elif actual:
+            logger.warning("Tạo lại cache embedding %s: kích thước %d bytes khác %d bytes cần cho %d slot, "
+                           "cache cũ bị xóa", self.path, actual, size, self.capacity)
+        else:
+            logger.info("Tạo cache embedding %s (%d slot, tối đa %.1f MB)", self.path, self.capacity, size / 2 ** 20)
+        os.ftruncate(self._fd, 0)
+        os.ftruncate(self._fd, size)
+        header = np.zeros(1, dtype=_HEADER)
+        header["magic"] = _MAGIC
+        header["dim"] = self.dim
+        header["capacity"] = self.capacity
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        os.write(self._fd, header.tobytes())
+
+    def _sync(self, upto: int) -> None:
+        """Đưa các slot có thứ tự ghi trong (_seen, upto] (có thể do worker khác ghi) vào index"""
+        for seq in range(max(self._seen, upto - self.capacity) + 1, upto + 1):
+            slot = (seq - 1) % self.capacity
+            key = self._slots["key"][slot].tobytes()
+            if key != _EMPTY_KEY and self._slots["seq"][slot] == seq:
+                self._index[key] = slot
+        self._seen = max(self._seen, upto)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        slot = self._index.get(key)
+        if slot is None:
+            current = int(self._header["seq"][0])
+            if current <= self._seen:
+                return None
+            self._sync(current)
+            slot = self._index.get(key)
+            if slot is None:
+                return None
+        vector = np.array(self._slots["vector"][slot])
+        if self._slots["key"][slot].tobytes() != key:
+            # Slot đã bị ghi đè (vòng mới)
+            del self._index[key]
+            return None
+        return vector
+
+    def put(self, key: bytes, vector: np.ndarray) -> None:
+        with self._file_lock():
+            seq = int(self._header["seq"][0]) + 1
+            self._header["seq"][0] = seq
+            self._sync(seq - 1)
+            slot = (seq - 1) % self.capacity
+            old_key = self._slots["key"][slot].tobytes()
+            if old_key != _EMPTY_KEY:
+                self._index.pop(old_key, None)
+            # Xóa khóa trước khi ghi vector để bên đọc không thấy vector ghi dở với khóa cũ
+            self._slots["key"][slot] = _EMPTY_KEY
+            self._slots["vector"][slot] = vector
+            self._slots["seq"][slot] = seq
+            self._slots["key"][slot] = key
+        self._index[key] = slot
+        self._seen = seq
+
+    def flush(self) -> None:
+        self._header.flush()
+        self._slots.flush()
+
+
+class EmbeddingCache:
+    """Cache embedding câu đặt trước model.encode: LRU trong bộ nhớ + tầng đĩa memory-mapped
+
+    Khóa là hash của (tên model, câu đã chuẩn hóa). Câu chưa có trong cache được
+    encode chung một batch. Số lần hit/miss được ghi vào ocr_cache_requests_total
+    với cache="embedding" (cả hai tầng) và cache="embedding_disk".
+    """
+
+    def __init__(self, model_name: str, dim: int, memory_entries: int = None,
+                 disk_entries: int = None, directory: str = None):
+        self.model_name = model_name
+        self.dim = dim
+        self.memory_entries = memory_entries if memory_entries is not None \
+            else settings.EMBEDDING_CACHE_MEMORY_ENTRIES
+        disk_entries = disk_entries if disk_entries is not None else settings.EMBEDDING_CACHE_DISK_ENTRIES
+        self._memory: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.disk: Optional[DiskEmbeddingStore] = None
+        if disk_entries > 0:
+            slug = re.sub(r"[^\w.-]", "_", model_name)
+            path = Path(directory or settings.EMBEDDING_CACHE_DIR) / f"{slug}-{dim}.f32"
+            if not FCNTL_AVAILABLE:
+                path = path.with_name(f"{path.stem}-{os.getpid()}{path.suffix}")
+            try:
+                self.disk = DiskEmbeddingStore(path, dim, disk_entries)
+            except Exception as e:
+                logger.error("Lỗi mở cache embedding trên đĩa %s: %s", path, e)
+
+    def key(self, sentence: str) -> bytes:
+        data = f"{self.model_name}\0{sentence}".encode("utf-8")
+        return hashlib.blake2b(data, digest_size=KEY_SIZE).digest()
+
+    def _lookup(self, key: bytes) -> Optional[np.ndarray]:
+        vector = self._memory.get(key)
+        if vector is not None:
+            self._memory.move_to_end(key)
+            return vector
+        if self.disk is None:
+            return None
+        vector = self.disk.get(key)
+        CACHE_REQUESTS.inc(cache="embedding_disk", result="hit" if vector is not None else "miss")
+        if vector is not None:
+            self._remember(key, vector)
+        return vector
+
+    def _remember(self, key: bytes, vector: np.ndarray) -> None:
+        if self.memory_entries <= 0:
+            return
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def encode(self, sentences: List[str], encoder: Encoder) -> np.ndarray:
+        """Embedding của sentences (theo thứ tự), chỉ encode các câu chưa có trong cache"""
+        normalized = [normalize_sentence(sentence) for sentence in sentences]
+        keys = [self.key(sentence) for sentence in normalized]
+        result = np.empty((len(sentences), self.dim), dtype=np.float32)
+
+        # Câu chưa có trong cache -> các vị trí trong batch (câu lặp lại chỉ encode một lần)
+        missing: "OrderedDict[bytes, List[int]]" = OrderedDict()
+        missing_text: Dict[bytes, str] = {}
+        with self._lock:
+            for index, key in enumerate(keys):
+                vector = self._lookup(key) if key not in missing else None
+                if vector is None:
+                    missing.setdefault(key, []).append(index)
+                    missing_text[key] = normalized[index]
+                else:
+                    result[index] = vector
+        # Câu lặp lại trong cùng batch được tính là hit
+        hits = len(sentences) - len(missing)
+        if hits:
+            CACHE_REQUESTS.inc(hits, cache="embedding", result="hit")
+
+        if missing:
+            CACHE_REQUESTS.inc(len(missing), cache="embedding", result="miss")
+            embeddings = np.asarray(encoder([missing_text[key] for key in missing]), dtype=np.float32)
+            with self._lock:
+                for (key, indexes), vector in zip(missing.items(), embeddings):
+                    result[indexes] = vector
+                    self._remember(key, vector)
+                    if self.disk is not None:
+                        self.disk.put(key, vector)
+        return result
+
+    def wrap(self, encoder: Encoder) -> Encoder:
+        """Encoder có cache, dùng thay cho model.encode"""
+        return lambda sentences: self.encode(list(sentences), encoder)
+
+    def flush(self) -> None:
+        if self.disk is not None:
+            with self._lock:
+                self.disk.flush()
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "model": self.model_name,
+            "memory_entries": len(self._memory),
+            "disk_entries": len(self.disk) if self.disk is not None else 0
+        }
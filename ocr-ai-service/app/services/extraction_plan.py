@@ -0,0 +1,274 @@
+import logging
+import re
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.models.schemas import DocumentType, FieldType
+from app.services.keyword_matcher import KeywordMatcher
+from app.services.safe_regex import RegexBudget, SafePattern
+
+logger = logging.getLogger(__name__)
+
+# Hàm encode danh sách câu thành ma trận embedding (vd. SentenceTransformer.encode)
+Encoder = Callable[[List[str]], np.ndarray]
+
+PATTERN_FLAGS = re.IGNORECASE | re.DOTALL
+
+# Nhãn thực thể phù hợp với từng loại trường
+ENTITY_LABELS: Dict[FieldType, Tuple[str, ...]] = {
+    FieldType.DATE: ("DATE",),
+    FieldType.NUMERIC: ("NUMBER",),
+    FieldType.TEXT: ("PERSON", "ORGANIZATION", "LOCATION"),
+}
+
+
+@dataclass(frozen=True, slots=True)
+class FieldPlan:
+    """Cấu hình đã biên dịch của một trường (regex compile sẵn, kiểu và cờ bắt buộc đã xác định)"""
+    name: str
+    field_type: FieldType
+    required: bool
+    # Pattern trích xuất chạy trên toàn bộ text nên dùng engine an toàn (xem safe_regex)
+    patterns: Tuple[SafePattern, ...]
+    keywords: Tuple[str, ...]
+    # Regex xóa keyword khỏi câu khi lấy giá trị bằng semantic search
+    keyword_patterns: Tuple[re.Pattern, ...]
+    entity_labels: Tuple[str, ...]
+
+    @classmethod
+    def compile(cls, name: str, definition: Mapping[str, Any], required: bool) -> "FieldPlan":
+        field_type = definition.get("field_type", FieldType.TEXT)
+        keywords = tuple(definition.get("keywords", ()))
+        return cls(
+            name=name,
+            field_type=field_type,
+            required=required,
+            patterns=tuple(SafePattern(pattern, PATTERN_FLAGS) for pattern in definition.get("patterns", ())),
+            keywords=keywords,
+            keyword_patterns=tuple(
+                re.compile(rf"\b{re.escape(keyword)}[:\s]*", re.IGNORECASE) for keyword in keywords
+            ),
+            entity_labels=ENTITY_LABELS.get(field_type, ())
+        )
+
+    def first_match(self, text: str, budget: Optional[RegexBudget] = None) -> Optional["PatternMatch"]:
+        """Match đầu tiên theo thứ tự ưu tiên pattern (quét riêng cho trường này)"""
+        budget = budget or RegexBudget()
+        for pattern in self.patterns:
+            match = budget.search(pattern, text)
+            if match:
+                return PatternMatch.from_match(pattern, match)
+        return None
+
+
+@dataclass(frozen=True, slots=True)
+class PatternMatch:
+    """Match của một trường, cắt từ text gốc (giữ nguyên chữ hoa/thường)"""
+    text: str
+    # Nhóm 1 nếu pattern có nhóm bắt, None nếu pattern không có nhóm
+    group: Optional[str]
+
+    @classmethod
+    def from_match(cls, pattern: SafePattern, match) -> "PatternMatch":
+        return cls(text=match.group(0), group=(match.group(1) or "") if pattern.groups else None)
+
+
+class PatternScanner:
+    """Quét pattern của tất cả các trường trong plan trên text đã hạ chữ thường một lần
+
+    Pattern viết bằng chữ thường được compile lại không có IGNORECASE và chạy trên
+    text.lower(): sre khi đó dùng được tối ưu bỏ qua nhanh theo ký tự đầu, nhanh
+    hơn nhiều so với so khớp không phân biệt hoa/thường từng ký tự. Vị trí match
+    được cắt lại từ text gốc. Pattern có chữ hoa, hoặc text mà lower() đổi độ dài,
+    dùng pattern IGNORECASE trên text gốc như cũ. Kết quả giống FieldPlan.first_match().
+    Với re2 không còn khác biệt về tốc độ nhưng vẫn giữ cách quét này để kết quả
+    không phụ thuộc engine.
+    """
+
+    def __init__(self, fields: Sequence[FieldPlan]):
+        self._fields = [
+            (field.name, tuple((self._fold(pattern), pattern) for pattern in field.patterns))
+            for field in fields
+        ]
+
+    @staticmethod
+    def _fold(pattern: SafePattern) -> Optional[SafePattern]:
+        source = pattern.pattern
+        if source != source.lower():
+            return None
+        return SafePattern(source, pattern.flags & ~re.IGNORECASE, engine=pattern.engine)
+
+    @staticmethod
+    def _to_match(text: str, pattern: SafePattern, match) -> PatternMatch:
+        group = None
+        if pattern.groups:
+            start, end = match.span(1)
+            group = text[start:end] if start >= 0 else ""
+        return PatternMatch(text=text[match.start():match.end()], group=group)
+
+    def scan(self, text: str, budget: Optional[RegexBudget] = None) -> Dict[str, PatternMatch]:
+        """Tên trường -> match của pattern ưu tiên cao nhất (trường không khớp không có trong dict)
+
+        Khi budget hết thời gian, các trường chưa quét được coi như không khớp.
+        """
+        budget = budget or RegexBudget()
+        folded = text.lower()
+        if len(folded) != len(text):
+            folded = None  # Không ánh xạ được vị trí 1-1 về text gốc
+        result: Dict[str, PatternMatch] = {}
+        for name, patterns in self._fields:
+            for folded_pattern, pattern in patterns:
+                if folded_pattern is not None and folded is not None:
+                    match = budget.search(folded_pattern, folded)
+                else:
+                    match = budget.search(pattern, text)
+                if match:
+                    result[name] = self._to_match(text, pattern, match)
+                    break
+        return result
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Chuẩn hóa L2 từng hàng để tích vô hướng là cosine similarity"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+@dataclass(frozen=True, slots=True)
+class KeywordIndex:
+    """Embedding keyword của mọi trường trong plan, xếp chồng thành một ma trận đã chuẩn hóa
+
+    Một phép nhân ma trận với embedding câu của tài liệu cho điểm của tất cả các trường.
+    """
+    matrix: np.ndarray
+    # Tên trường -> các hàng keyword của trường trong matrix
+    rows: Dict[str, slice]
+    # Keyword theo thứ tự hàng của matrix
+    keywords: Tuple[str, ...] = ()
+
+    @classmethod
+    def build(cls, fields: Sequence[FieldPlan], encoder: Encoder) -> Optional["KeywordIndex"]:
+        keywords: List[str] = []
+        rows: Dict[str, slice] = {}
+        for field in fields:
+            if field.keywords:
+                rows[field.name] = slice(len(keywords), len(keywords) + len(field.keywords))
+                keywords.extend(field.keywords)
+        if not keywords:
+            return None
+        return cls(matrix=normalize_rows(encoder(keywords)), rows=rows, keywords=tuple(keywords))
+
+    def similarities(self, sentence_embeddings: np.ndarray) -> np.ndarray:
+        """Cosine similarity (keyword x câu); sentence_embeddings phải đã chuẩn hóa"""
+        return self.matrix @ sentence_embeddings.T
+
+
+@dataclass(frozen=True, slots=True)
+class ExtractionPlan:
+    """Danh sách trường cần trích xuất cho một loại tài liệu (và tập trường tùy chỉnh)"""
+    document_type: DocumentType
+    custom_fields: Tuple[str, ...]
+    fields: Tuple[FieldPlan, ...]
+    scanner: PatternScanner
+    # Tìm keyword của mọi trường trên text đã bỏ dấu (prefilter cho NER/semantic search)
+    matcher: KeywordMatcher
+    # None nếu chưa có model embedding hoặc không trường nào có keyword
+    keywords: Optional[KeywordIndex] = None
+
+    def scan(self, text: str, budget: Optional[RegexBudget] = None) -> Dict[str, PatternMatch]:
+        """Match pattern của tất cả các trường (text chỉ được hạ chữ thường một lần)"""
+        return self.scanner.scan(text, budget)
+
+
+class ExtractionPlanCache:
+    """Cache ExtractionPlan theo (DocumentType, tập trường tùy chỉnh)
+
+    Plan được build một lần và dùng lại cho mọi tài liệu; chỉ bị xóa khi
+    định nghĩa trường (set_definitions) hoặc model embedding (set_encoder) thay đổi.
+    """
+
+    def __init__(self, definitions: Mapping[str, Mapping[str, Any]],
+                 document_fields: Mapping[DocumentType, Sequence[str]],
+                 required_fields: Iterable[str], encoder: Optional[Encoder] = None):
+        self._document_fields = {doc_type: tuple(names) for doc_type, names in document_fields.items()}
+        self._required = frozenset(required_fields)
+        self._encoder = encoder
+        self._lock = threading.Lock()
+        self.version = 0
+        self.set_definitions(definitions)
+
+    def set_encoder(self, encoder: Optional[Encoder]) -> None:
+        """Đổi model embedding keyword và hủy các plan đã build"""
+        with self._lock:
+            self._encoder = encoder
+            self._plans = {}
+            self.version += 1
+
+    def set_definitions(self, definitions: Mapping[str, Mapping[str, Any]]) -> None:
+        """Thay định nghĩa trường và hủy các plan đã build"""
+        with self._lock:
+            self._definitions = dict(definitions)
+            self._fields: Dict[str, FieldPlan] = {}
+            self._plans: Dict[Tuple[DocumentType, Tuple[str, ...]], ExtractionPlan] = {}
+            self.version += 1
+
+    @property
+    def definitions(self) -> Dict[str, Mapping[str, Any]]:
+        return self._definitions
+
+    def _field(self, name: str) -> FieldPlan:
+        field = self._fields.get(name)
+        if field is None:
+            field = self._fields[name] = FieldPlan.compile(
+                name, self._definitions[name], name in self._required
+            )
+        return field
+
+    def get(self, document_type: DocumentType, custom_fields: Optional[Sequence[str]] = None) -> ExtractionPlan:
+        """Plan cho loại tài liệu; trường tùy chỉnh chưa có định nghĩa bị bỏ qua"""
+        base = self._document_fields.get(document_type, ())
+        extra: Tuple[str, ...] = ()
+        if custom_fields:
+            extra = tuple(sorted({
+                name for name in custom_fields if name in self._definitions and name not in base
+            }))
+        key = (document_type, extra)
+
+        plan = self._plans.get(key)
+        if plan is not None:
+            return plan
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is None:
+                names = [name for name in base if name in self._definitions] + list(extra)
+                fields = tuple(self._field(name) for name in names)
+                plan = self._plans[key] = ExtractionPlan(
+                    document_type=document_type,
+                    custom_fields=extra,
+                    fields=fields,
+                    scanner=PatternScanner(fields),
+                    matcher=KeywordMatcher({field.name: field.keywords for field in fields}),
+                    keywords=self._keyword_index(fields)
+                )
+            return plan
+
+    def _keyword_index(self, fields: Sequence[FieldPlan]) -> Optional[KeywordIndex]:
+        if self._encoder is None:
+            return None
+        try:
+            return KeywordIndex.build(fields, self._encoder)
+        except Exception as e:
+            logger.error("Lỗi encode keyword cho plan: %s", e)
+            return None
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "plans": len(self._plans),
+            "compiled_fields": len(self._fields),
+            "keyword_embeddings": self._encoder is not None
+        }
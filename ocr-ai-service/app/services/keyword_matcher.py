@@ -0,0 +1,96 @@
+import re
+import unicodedata
+from typing import Dict, FrozenSet, Iterator, List, Mapping, Sequence, Tuple
+
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+
+def _build_fold_table() -> Dict[int, str]:
+    table = {}
+    for code in list(range(0x41, 0x250)) + list(range(0x1E00, 0x1F00)):
+        char = chr(code)
+        base = unicodedata.normalize("NFD", char)[0].lower()
+        if len(base) == 1 and base != char:
+            table[code] = base
+    # đ/Đ không tách dấu được bằng NFD
+    table[ord("đ")] = table[ord("Đ")] = "d"
+    return table
+
+
+# Mỗi ký tự Latin -> một ký tự thường không dấu, nên vị trí trong text đã fold khớp với text gốc
+_FOLD_TABLE = _build_fold_table()
+
+
+def fold_diacritics(text: str) -> str:
+    """Hạ chữ thường và bỏ dấu tiếng Việt (giữ nguyên độ dài text)"""
+    return text.translate(_FOLD_TABLE)
+
+
+def _is_boundary(text: str, index: int) -> bool:
+    return index < 0 or index >= len(text) or not text[index].isalnum()
+
+
+class KeywordMatcher:
+    """Tìm keyword của mọi trường trong một lần quét text đã bỏ dấu
+
+    Dùng automaton Aho–Corasick (pyahocorasick) nếu có; nếu không, dùng regex
+    lookahead với các keyword xếp dài trước: ở mỗi vị trí regex trả về keyword dài
+    nhất, các keyword ngắn hơn khớp cùng vị trí là tiền tố của nó nên được suy ra
+    từ bảng tiền tố. Chỉ nhận match trọn từ (biên từ ở hai đầu).
+    """
+
+    def __init__(self, keywords: Mapping[str, Sequence[str]]):
+        fields_by_keyword: Dict[str, set] = {}
+        for field_name, field_keywords in keywords.items():
+            for keyword in field_keywords:
+                folded = fold_diacritics(keyword).strip()
+                if folded:
+                    fields_by_keyword.setdefault(folded, set()).add(field_name)
+        self.fields_by_keyword: Dict[str, FrozenSet[str]] = {
+            keyword: frozenset(fields) for keyword, fields in fields_by_keyword.items()
+        }
+        ordered = sorted(self.fields_by_keyword, key=len, reverse=True)
+        # Keyword -> các keyword (kể cả chính nó) là tiền tố của nó
+        self._prefixes: Dict[str, Tuple[str, ...]] = {
+            keyword: tuple(other for other in ordered if keyword.startswith(other)) for keyword in ordered
+        }
+        self._automaton = None
+        self._pattern = None
+        if not ordered:
+            return
+        if AHOCORASICK_AVAILABLE:
+            self._automaton = ahocorasick.Automaton()
+            for keyword in ordered:
+                self._automaton.add_word(keyword, keyword)
+            self._automaton.make_automaton()
+        else:
+            self._pattern = re.compile("(?=(" + "|".join(re.escape(keyword) for keyword in ordered) + "))")
+
+    def _candidates(self, folded: str) -> Iterator[Tuple[int, str]]:
+        if self._automaton is not None:
+            for end, keyword in self._automaton.iter(folded):
+                yield end - len(keyword) + 1, keyword
+        elif self._pattern is not None:
+            for match in self._pattern.finditer(folded):
+                start = match.start()
+                for keyword in self._prefixes[match.group(1)]:
+                    yield start, keyword
+
+    def find(self, folded: str) -> Iterator[Tuple[int, int, str]]:
+        """(start, end, keyword) của mọi keyword trọn từ trong text đã fold_diacritics()"""
+        for start, keyword in self._candidates(folded):
+            end = start + len(keyword)
+            if _is_boundary(folded, start - 1) and _is_boundary(folded, end):
+                yield start, end, keyword
+
+    def field_hits(self, folded: str) -> Dict[str, List[int]]:
+        """Tên trường -> vị trí bắt đầu các keyword của trường xuất hiện trong text"""
+        hits: Dict[str, List[int]] = {}
+        for start, _, keyword in self.find(folded):
+            for field_name in self.fields_by_keyword[keyword]:
+                hits.setdefault(field_name, []).append(start)
+        return hits
@@ -0,0 +1,277 @@
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app.services.statistics_service import DEFAULT_LATENCY_BUCKETS, LatencyHistogram
+from app.services.tracing_service import tracer
+
+logger = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric(ABC):
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return lines
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        """Các dòng sample theo định dạng text của Prometheus"""
+
+
+class Counter(_Metric):
+    """Bộ đếm tăng dần"""
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def values(self) -> Dict[LabelValues, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def _samples(self) -> List[str]:
+        items = self.values().items()
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """Giá trị tức thời, đọc qua callback lúc scrape (không tốn chi phí ghi)"""
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 callback: Optional[Callable[[], Dict[LabelValues, float]]] = None):
+        super().__init__(name, documentation, labels)
+        self.callback = callback
+
+    def set_callback(self, callback: Callable[[], Dict[LabelValues, float]]) -> None:
+        self.callback = callback
+
+    def _samples(self) -> List[str]:
+        if self.callback is None:
+            return []
+        try:
+            values = self.callback()
+        except Exception as e:
+            logger.error("Lỗi đọc gauge %s: %s", self.name, e)
+            return []
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in values.items()]
+
+
+class Histogram(_Metric):
+    """Histogram bucket cố định (dùng LatencyHistogram cho mỗi tổ hợp label)"""
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        self._children: Dict[LabelValues, LatencyHistogram] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = LatencyHistogram(self.buckets)
+            child.observe(value)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, child in self._children.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else _format_value(bound)
+                    labels = _format_labels(self.label_names, key, 'le="' + le + '"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {repr(float(child.sum))}")
+                lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {child.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Tập hợp metric của process, xuất theo định dạng text của Prometheus"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} đã tồn tại")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Histogram:
+        return self.register(Histogram(name, documentation, labels))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# Độ trễ
+STAGE_DURATION = registry.histogram(
+    "ocr_stage_duration_seconds", "Thời gian từng stage xử lý", ("stage",))
+ENGINE_DURATION = registry.histogram(
+    "ocr_engine_duration_seconds", "Thời gian mỗi lần gọi OCR engine", ("engine",))
+
+# Bộ đếm
+PAGES_PROCESSED = registry.counter(
+    "ocr_pages_processed_total", "Số trang đã OCR")
+DOCUMENTS_PROCESSED = registry.counter(
+    "ocr_documents_processed_total", "Số tài liệu đã xử lý theo trạng thái", ("status",))
+ENGINE_SELECTIONS = registry.counter(
+    "ocr_engine_selected_total", "Số lần kết quả của engine được chọn trong hybrid OCR", ("engine",))
+ENGINE_FAILURES = registry.counter(
+    "ocr_engine_failures_total", "Số lần engine OCR gặp lỗi", ("engine",))
+CACHE_REQUESTS = registry.counter(
+    "ocr_cache_requests_total", "Số lần tra cứu cache theo kết quả (hit/miss)", ("cache", "result"))
+ADMISSION_REJECTIONS = registry.counter(
+    "ocr_admission_rejected_total", "Số request bị từ chối do quá tải")
+REGEX_BUDGET_EXCEEDED = registry.counter(
+    "ocr_regex_budget_exceeded_total", "Số tài liệu hết ngân sách thời gian regex trích xuất trường")
+
+# Gauge (callback được gắn khi khởi tạo service)
+QUEUE_PAGES = registry.gauge(
+    "ocr_scheduler_queued_pages", "Số trang đang chờ trong scheduler", ("priority",))
+BUSY_WORKERS = registry.gauge(
+    "ocr_scheduler_busy_workers", "Số worker đang xử lý trang")
+ADMISSION_PAGES = registry.gauge(
+    "ocr_admission_pages", "Số trang đã nhận theo trạng thái", ("state",))
+CACHE_HIT_RATIO = registry.gauge(
+    "ocr_cache_hit_ratio", "Tỷ lệ hit của cache (tính từ ocr_cache_requests_total)", ("cache",))
+
+
+def _cache_hit_ratios() -> Dict[LabelValues, float]:
+    totals: Dict[str, List[float]] = {}
+    for (cache, result), value in CACHE_REQUESTS.values().items():
+        counts = totals.setdefault(cache, [0.0, 0.0])
+        counts[1] += value
+        if result == "hit":
+            counts[0] += value
+    return {(cache,): hits / total for cache, (hits, total) in totals.items() if total}
+
+
+CACHE_HIT_RATIO.set_callback(_cache_hit_ratios)
+
+
+class Timings:
+    """Thời gian từng stage của một request/trang (giây, cộng dồn theo tên stage)"""
+
+    __slots__ = ("values",)
+
+    def __init__(self):
+        self.values: Dict[str, float] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.values[stage] = self.values.get(stage, 0.0) + seconds
+
+    def merge(self, other: Dict[str, float], prefix: str = "") -> None:
+        for stage, seconds in other.items():
+            self.add(prefix + stage, seconds)
+
+    def as_dict(self) -> Dict[str, float]:
+        return {stage: round(seconds, 6) for stage, seconds in self.values.items()}
+
+
+# Timings đang thu thập trong context hiện tại (mỗi page task/request một đối tượng)
+_current_timings: ContextVar[Optional[Timings]] = ContextVar("current_timings", default=None)
+
+
+@contextmanager
+def collect_timings() -> Iterator[Timings]:
+    """Thu thập thời gian của các stage_timer/engine_timer chạy bên trong"""
+    timings = Timings()
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+
+@contextmanager
+def stage_timer(stage: str, observer: Optional[Callable[[str, float], None]] = None) -> Iterator[None]:
+    """Đo thời gian một stage, ghi vào histogram và mở span (observer nhận thêm kết quả nếu có)"""
+    with tracer.span(stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            STAGE_DURATION.observe(elapsed, stage=stage)
+            timings = _current_timings.get()
+            if timings is not None:
+                timings.add(stage, elapsed)
+            if observer is not None:
+                observer(stage, elapsed)
+
+
+@contextmanager
+def engine_timer(engine: str) -> Iterator[None]:
+    """Đo thời gian gọi một OCR engine"""
+    with tracer.span(f"engine.{engine}", engine=engine):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            ENGINE_DURATION.observe(elapsed, engine=engine)
+            timings = _current_timings.get()
+            if timings is not None:
+                timings.add(f"engine.{engine}", elapsed)
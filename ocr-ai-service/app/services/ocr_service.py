@@ -7,8 +7,12 @@ from typing import List, Dict, Optional, Tuple
 import time
 import numpy as np
 from pathlib import Path
+import re
 
-from app.models.schemas import OCRResult, DocumentType
+from app.models.schemas import DocumentType
+from app.models.records import PageRecord
+from app.models.geometry import PageGeometry
+from app.services.metrics_service import stage_timer, engine_timer, ENGINE_SELECTIONS, ENGINE_FAILURES
 from config.settings import settings
 
 logger = logging.getLogger(__name__)
@@ -26,33 +30,51 @@ class OCRService:
     def pdf_to_images(self, pdf_path: str) -> List[Image.Image]:
         """Chuyển đổi PDF thành danh sách hình ảnh"""
         try:
-            logger.info(f"Chuyển đổi PDF sang hình ảnh: {pdf_path}")
+            logger.debug("Chuyển đổi PDF sang hình ảnh: %s", pdf_path)
             images = pdf2image.convert_from_path(
                 pdf_path,
                 dpi=self.dpi,
                 fmt='PNG'
             )
-            logger.info(f"Chuyển đổi thành công {len(images)} trang")
+            logger.debug("Chuyển đổi thành công %d trang", len(images))
             return images
         except Exception as e:
-            logger.error(f"Lỗi chuyển đổi PDF: {str(e)}")
+            logger.error("Lỗi chuyển đổi PDF: %s", e)
             raise
     
     def pdf_bytes_to_images(self, pdf_bytes: bytes) -> List[Image.Image]:
         """Chuyển đổi PDF bytes thành danh sách hình ảnh"""
         try:
-            logger.info("Chuyển đổi PDF bytes sang hình ảnh")
+            logger.debug("Chuyển đổi PDF bytes sang hình ảnh")
             images = pdf2image.convert_from_bytes(
                 pdf_bytes,
                 dpi=self.dpi,
                 fmt='PNG'
             )
-            logger.info(f"Chuyển đổi thành công {len(images)} trang")
+            logger.debug("Chuyển đổi thành công %d trang", len(images))
             return images
         except Exception as e:
-            logger.error(f"Lỗi chuyển đổi PDF bytes: {str(e)}")
+            logger.error("Lỗi chuyển đổi PDF bytes: %s", e)
             raise
     
+    def get_page_count(self, pdf_bytes: bytes) -> int:
+        """Số trang PDF theo poppler (cùng công cụ rasterize), ném ValueError nếu không xác định được"""
+        try:
+            pages = int(pdf2image.pdfinfo_from_bytes(pdf_bytes).get("Pages", 0))
+        except Exception as e:
+            raise ValueError(f"Không đọc được số trang PDF: {str(e)}")
+        if pages < 1:
+            raise ValueError("PDF không có trang nào")
+        return pages
+    
+    def estimate_page_count(self, pdf_bytes: bytes) -> int:
+        """Ước lượng số trang cho admission control (đếm /Type /Page nếu pdfinfo lỗi)"""
+        try:
+            return self.get_page_count(pdf_bytes)
+        except ValueError as e:
+            logger.warning("Không đọc được pdfinfo, ước lượng số trang từ nội dung PDF: %s", e)
+            return max(1, len(re.findall(rb"/Type\s*/Page(?!s)", pdf_bytes)))
+    
     def preprocess_image(self, image: Image.Image) -> Image.Image:
         """Tiền xử lý hình ảnh để cải thiện OCR"""
         try:
@@ -72,63 +94,72 @@ class OCRService:
             
             return processed_image
         except Exception as e:
-            logger.error(f"Lỗi tiền xử lý hình ảnh: {str(e)}")
+            logger.error("Lỗi tiền xử lý hình ảnh: %s", e)
             return image
     
-    def extract_text_from_image(self, image: Image.Image, page_num: int = 1) -> OCRResult:
+    def extract_text_from_image(self, image: Image.Image, page_num: int = 1) -> PageRecord:
         """Trích xuất văn bản từ hình ảnh"""
         try:
             start_time = time.time()
             
             # Tiền xử lý hình ảnh
-            processed_image = self.preprocess_image(image)
+            with stage_timer("preprocess"):
+                processed_image = self.preprocess_image(image)
             
             # Cấu hình OCR
             config = r'--oem 3 --psm 6 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789ÀÁÂÃÈÉÊÌÍÒÓÔÕÙÚÝàáâãèéêìíòóôõùúýĂăĐđĨĩŨũƠơƯưẠạẢảẤấẦầẨẩẪẫẬậẮắẰằẲẳẴẵẶặẸẹẺẻẼẽẾếỀềỂểỄễỆệỈỉỊịỌọỎỏỐốỒồỔổỖỗỘộỚớỜờỞởỠỡỢợỤụỦủỨứỪừỬửỮữỰựỲỳỴỵỶỷỸỹ .,!?;:()[]{}"\'-/@#$%^&*+=<>|\\~`'
             
-            # Nhận dạng văn bản
-            text = pytesseract.image_to_string(
-                processed_image,
-                lang=self.lang,
-                config=config
-            )
-            
-            # Lấy thông tin chi tiết với confidence score
-            data = pytesseract.image_to_data(
-                processed_image,
-                lang=self.lang,
-                config=config,
-                output_type=pytesseract.Output.DICT
-            )
+            with engine_timer("tesseract"):
+                # Nhận dạng văn bản
+                text = pytesseract.image_to_string(
+                    processed_image,
+                    lang=self.lang,
+                    config=config
+                )
+                
+                # Lấy thông tin chi tiết với confidence score
+                data = pytesseract.image_to_data(
+                    processed_image,
+                    lang=self.lang,
+                    config=config,
+                    output_type=pytesseract.Output.DICT
+                )
             
             # Tính confidence score trung bình
-            confidences = [int(conf) for conf in data['conf'] if int(conf) > 0]
+            confidences = [int(float(conf)) for conf in data['conf'] if float(conf) > 0]
             avg_confidence = sum(confidences) / len(confidences) if confidences else 0
             
+            # Vị trí từng từ
+            geometry = PageGeometry.from_tesseract_data(data, *processed_image.size)
+            
             processing_time = time.time() - start_time
             
-            logger.info(f"OCR trang {page_num}: {len(text)} ký tự, confidence: {avg_confidence:.2f}%, thời gian: {processing_time:.2f}s")
+            logger.info("OCR trang %d: %d ký tự, confidence: %.2f%%, thời gian: %.2fs",
+                        page_num, len(text), avg_confidence, processing_time)
             
-            return OCRResult(
+            ENGINE_SELECTIONS.inc(engine="tesseract")
+            return PageRecord(
                 text=text.strip(),
                 confidence_score=avg_confidence / 100.0,  # Chuyển về scale 0-1
                 page_number=page_num,
-                bounding_box=None  # Có thể mở rộng để lấy bounding box
+                bounding_box=None,
+                geometry=geometry
             )
             
         except Exception as e:
-            logger.error(f"Lỗi OCR trang {page_num}: {str(e)}")
-            return OCRResult(
+            logger.error("Lỗi OCR trang %d: %s", page_num, e)
+            ENGINE_FAILURES.inc(engine="tesseract")
+            return PageRecord(
                 text="",
                 confidence_score=0.0,
                 page_number=page_num,
                 bounding_box=None
             )
     
-    def process_pdf_file(self, pdf_path: str) -> List[OCRResult]:
+    def process_pdf_file(self, pdf_path: str) -> List[PageRecord]:
         """Xử lý file PDF và trả về kết quả OCR cho tất cả các trang"""
         try:
-            logger.info(f"Bắt đầu xử lý OCR file: {pdf_path}")
+            logger.info("Bắt đầu xử lý OCR file: %s", pdf_path)
             
             # Chuyển PDF sang hình ảnh
             images = self.pdf_to_images(pdf_path)
@@ -139,14 +170,14 @@ class OCRService:
                 result = self.extract_text_from_image(image, i)
                 results.append(result)
             
-            logger.info(f"Hoàn thành OCR {len(results)} trang")
+            logger.info("Hoàn thành OCR %d trang", len(results))
             return results
             
         except Exception as e:
-            logger.error(f"Lỗi xử lý PDF: {str(e)}")
+            logger.error("Lỗi xử lý PDF: %s", e)
             raise
     
-    def process_pdf_bytes(self, pdf_bytes: bytes) -> List[OCRResult]:
+    def process_pdf_bytes(self, pdf_bytes: bytes) -> List[PageRecord]:
         """Xử lý PDF bytes và trả về kết quả OCR cho tất cả các trang"""
         try:
             logger.info("Bắt đầu xử lý OCR PDF bytes")
@@ -160,13 +191,36 @@ class OCRService:
                 result = self.extract_text_from_image(image, i)
                 results.append(result)
             
-            logger.info(f"Hoàn thành OCR {len(results)} trang")
+            logger.info("Hoàn thành OCR %d trang", len(results))
             return results
             
         except Exception as e:
-            logger.error(f"Lỗi xử lý PDF bytes: {str(e)}")
+            logger.error("Lỗi xử lý PDF bytes: %s", e)
             raise
     
+    def pdf_page_to_image(self, pdf_bytes: bytes, page_num: int) -> Optional[Image.Image]:
+        """Chuyển đổi một trang PDF thành hình ảnh (chỉ rasterize trang cần thiết)"""
+        try:
+            with stage_timer("rasterize"):
+                images = pdf2image.convert_from_bytes(
+                    pdf_bytes,
+                    dpi=self.dpi,
+                    fmt='PNG',
+                    first_page=page_num,
+                    last_page=page_num
+                )
+            return images[0] if images else None
+        except Exception as e:
+            logger.error("Lỗi chuyển đổi trang %d: %s", page_num, e)
+            raise
+    
+    def process_pdf_page(self, pdf_bytes: bytes, page_num: int) -> PageRecord:
+        """Rasterize và OCR một trang PDF (đơn vị công việc của page scheduler)"""
+        image = self.pdf_page_to_image(pdf_bytes, page_num)
+        if image is None:
+            raise ValueError(f"Không rasterize được trang {page_num} của PDF")
+        return self.extract_text_from_image(image, page_num)
+    
     def detect_document_type(self, filename: str) -> DocumentType:
         """Nhận diện loại tài liệu từ tên file"""
         filename_upper = filename.upper()
@@ -178,11 +232,11 @@ class OCRService:
         else:
             return DocumentType.THONG_TIN_VAN_BAN
     
-    def get_combined_text(self, ocr_results: List[OCRResult]) -> str:
+    def get_combined_text(self, ocr_results: List[PageRecord]) -> str:
         """Kết hợp văn bản từ tất cả các trang"""
         return "\n\n".join([result.text for result in ocr_results if result.text])
     
-    def get_average_confidence(self, ocr_results: List[OCRResult]) -> float:
+    def get_average_confidence(self, ocr_results: List[PageRecord]) -> float:
         """Tính confidence score trung bình"""
         if not ocr_results:
             return 0.0
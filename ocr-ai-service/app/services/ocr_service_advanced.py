@@ -8,8 +8,12 @@ import time
 from typing import List, Dict, Optional, Tuple, Union
 from pathlib import Path
 import io
+import re
 
-from app.models.schemas import OCRResult, DocumentType
+from app.models.schemas import DocumentType
+from app.models.records import PageRecord
+from app.models.geometry import PageGeometry
+from app.services.metrics_service import stage_timer, engine_timer, ENGINE_SELECTIONS, ENGINE_FAILURES
 from config.settings import settings
 
 logger = logging.getLogger(__name__)
@@ -46,7 +50,7 @@ class OCRServiceAdvanced:
                 self.easyocr_reader = easyocr.Reader(['vi', 'en'], gpu=False)
                 logger.info("EasyOCR đã được khởi tạo cho tiếng Việt")
             except Exception as e:
-                logger.error(f"Lỗi khởi tạo EasyOCR: {e}")
+                logger.error("Lỗi khởi tạo EasyOCR: %s", e)
                 self.easyocr_reader = None
         else:
             self.easyocr_reader = None
@@ -60,7 +64,7 @@ class OCRServiceAdvanced:
                 )
                 logger.info("PaddleOCR đã được khởi tạo cho tiếng Việt")
             except Exception as e:
-                logger.error(f"Lỗi khởi tạo PaddleOCR: {e}")
+                logger.error("Lỗi khởi tạo PaddleOCR: %s", e)
                 self.paddleocr = None
         else:
             self.paddleocr = None
@@ -68,33 +72,51 @@ class OCRServiceAdvanced:
     def pdf_to_images(self, pdf_path: str) -> List[Image.Image]:
         """Chuyển đổi PDF thành danh sách hình ảnh"""
         try:
-            logger.info(f"Chuyển đổi PDF sang hình ảnh: {pdf_path}")
+            logger.debug("Chuyển đổi PDF sang hình ảnh: %s", pdf_path)
             images = pdf2image.convert_from_path(
                 pdf_path,
                 dpi=self.dpi,
                 fmt='PNG'
             )
-            logger.info(f"Chuyển đổi thành công {len(images)} trang")
+            logger.debug("Chuyển đổi thành công %d trang", len(images))
             return images
         except Exception as e:
-            logger.error(f"Lỗi chuyển đổi PDF: {str(e)}")
+            logger.error("Lỗi chuyển đổi PDF: %s", e)
             raise
     
     def pdf_bytes_to_images(self, pdf_bytes: bytes) -> List[Image.Image]:
         """Chuyển đổi PDF bytes thành danh sách hình ảnh"""
         try:
-            logger.info("Chuyển đổi PDF bytes sang hình ảnh")
+            logger.debug("Chuyển đổi PDF bytes sang hình ảnh")
             images = pdf2image.convert_from_bytes(
                 pdf_bytes,
                 dpi=self.dpi,
                 fmt='PNG'
             )
-            logger.info(f"Chuyển đổi thành công {len(images)} trang")
+            logger.debug("Chuyển đổi thành công %d trang", len(images))
             return images
         except Exception as e:
-            logger.error(f"Lỗi chuyển đổi PDF bytes: {str(e)}")
+            logger.error("Lỗi chuyển đổi PDF bytes: %s", e)
             raise
     
+    def get_page_count(self, pdf_bytes: bytes) -> int:
+        """Số trang PDF theo poppler (cùng công cụ rasterize), ném ValueError nếu không xác định được"""
+        try:
+            pages = int(pdf2image.pdfinfo_from_bytes(pdf_bytes).get("Pages", 0))
+        except Exception as e:
+            raise ValueError(f"Không đọc được số trang PDF: {str(e)}")
+        if pages < 1:
+            raise ValueError("PDF không có trang nào")
+        return pages
+    
+    def estimate_page_count(self, pdf_bytes: bytes) -> int:
+        """Ước lượng số trang cho admission control (đếm /Type /Page nếu pdfinfo lỗi)"""
+        try:
+            return self.get_page_count(pdf_bytes)
+        except ValueError as e:
+            logger.warning("Không đọc được pdfinfo, ước lượng số trang từ nội dung PDF: %s", e)
+            return max(1, len(re.findall(rb"/Type\s*/Page(?!s)", pdf_bytes)))
+    
     def preprocess_image_for_handwriting(self, image: Union[Image.Image, np.ndarray]) -> np.ndarray:
         """Tiền xử lý hình ảnh cho chữ viết tay"""
         try:
@@ -126,7 +148,7 @@ class OCRServiceAdvanced:
             return cleaned
             
         except Exception as e:
-            logger.error(f"Lỗi tiền xử lý hình ảnh: {str(e)}")
+            logger.error("Lỗi tiền xử lý hình ảnh: %s", e)
             # Fallback về image gốc
             if isinstance(image, Image.Image):
                 return np.array(image.convert('L'))
@@ -151,7 +173,7 @@ class OCRServiceAdvanced:
             return Image.fromarray(binary)
             
         except Exception as e:
-            logger.error(f"Lỗi tiền xử lý văn bản in: {str(e)}")
+            logger.error("Lỗi tiền xử lý văn bản in: %s", e)
             return image
     
     def detect_handwriting_regions(self, image: Union[Image.Image, np.ndarray]) -> List[Dict]:
@@ -191,117 +213,132 @@ class OCRServiceAdvanced:
             return regions
             
         except Exception as e:
-            logger.error(f"Lỗi phát hiện vùng chữ viết tay: {str(e)}")
+            logger.error("Lỗi phát hiện vùng chữ viết tay: %s", e)
             return []
     
-    def ocr_with_tesseract(self, image: Image.Image, page_num: int = 1, is_handwriting: bool = False) -> OCRResult:
+    def ocr_with_tesseract(self, image: Image.Image, page_num: int = 1, is_handwriting: bool = False) -> PageRecord:
         """OCR với Tesseract cho văn bản in và viết tay"""
         try:
             start_time = time.time()
             
             # Tiền xử lý dựa trên loại văn bản
             if is_handwriting:
-                processed_image = Image.fromarray(self.preprocess_image_for_handwriting(image))
+                with stage_timer("preprocess"):
+                    processed_image = Image.fromarray(self.preprocess_image_for_handwriting(image))
                 # Cấu hình Tesseract cho chữ viết tay
                 config = r'--oem 3 --psm 8 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789àáạảãâầấậẩẫăằắặẳẵèéẹẻẽêềếệểễìíịỉĩòóọỏõôồốộổỗơờớợởỡùúụủũưừứựửữỳýỵỷỹđÀÁẠẢÃÂẦẤẬẨẪĂẰẮẶẲẴÈÉẸẺẼÊỀẾỆỂỄÌÍỊỈĨÒÓỌỎÕÔỒỐỘỔỖƠỜỚỢỞỠÙÚỤỦŨƯỪỨỰỬỮỲÝỴỶỸĐ .,!?/:;()-'
             else:
-                processed_image = self.preprocess_image_for_printed_text(image)
+                with stage_timer("preprocess"):
+                    processed_image = self.preprocess_image_for_printed_text(image)
                 # Cấu hình Tesseract cho văn bản in
                 config = r'--oem 3 --psm 6'
             
-            # OCR
-            text = pytesseract.image_to_string(
-                processed_image,
-                lang=self.lang,
-                config=config
-            )
-            
-            # Lấy confidence score
-            data = pytesseract.image_to_data(
-                processed_image,
-                lang=self.lang,
-                config=config,
-                output_type=pytesseract.Output.DICT
-            )
+            with engine_timer("tesseract"):
+                # OCR
+                text = pytesseract.image_to_string(
+                    processed_image,
+                    lang=self.lang,
+                    config=config
+                )
+                
+                # Lấy confidence score
+                data = pytesseract.image_to_data(
+                    processed_image,
+                    lang=self.lang,
+                    config=config,
+                    output_type=pytesseract.Output.DICT
+                )
             
-            confidences = [int(conf) for conf in data['conf'] if int(conf) > 0]
+            confidences = [int(float(conf)) for conf in data['conf'] if float(conf) > 0]
             avg_confidence = sum(confidences) / len(confidences) if confidences else 0
             
+            # Vị trí từng từ
+            geometry = PageGeometry.from_tesseract_data(data, *processed_image.size)
+            
             processing_time = time.time() - start_time
             
-            logger.info(f"Tesseract OCR trang {page_num}: {len(text)} ký tự, confidence: {avg_confidence:.2f}%")
+            logger.info("Tesseract OCR trang %d: %d ký tự, confidence: %.2f%%", page_num, len(text), avg_confidence)
             
-            return OCRResult(
+            return PageRecord(
                 text=text.strip(),
                 confidence_score=avg_confidence / 100.0,
                 page_number=page_num,
-                bounding_box=None
+                bounding_box=None,
+                geometry=geometry
             )
             
         except Exception as e:
-            logger.error(f"Lỗi Tesseract OCR trang {page_num}: {str(e)}")
-            return OCRResult(
+            logger.error("Lỗi Tesseract OCR trang %d: %s", page_num, e)
+            ENGINE_FAILURES.inc(engine="tesseract")
+            return PageRecord(
                 text="",
                 confidence_score=0.0,
                 page_number=page_num,
                 bounding_box=None
             )
     
-    def ocr_with_easyocr(self, image: Union[Image.Image, np.ndarray], page_num: int = 1) -> OCRResult:
+    def ocr_with_easyocr(self, image: Union[Image.Image, np.ndarray], page_num: int = 1) -> PageRecord:
         """OCR với EasyOCR cho chữ viết tay"""
         if not self.easyocr_reader:
             logger.warning("EasyOCR không khả dụng")
-            return OCRResult(text="", confidence_score=0.0, page_number=page_num)
+            return PageRecord(text="", confidence_score=0.0, page_number=page_num)
         
         try:
             start_time = time.time()
             
             # Tiền xử lý cho chữ viết tay
-            if isinstance(image, Image.Image):
-                processed_image = self.preprocess_image_for_handwriting(image)
-            else:
+            with stage_timer("preprocess"):
                 processed_image = self.preprocess_image_for_handwriting(image)
             
             # EasyOCR
-            results = self.easyocr_reader.readtext(processed_image)
+            with engine_timer("easyocr"):
+                results = self.easyocr_reader.readtext(processed_image)
             
             # Kết hợp text và tính confidence
             text_parts = []
             confidences = []
+            kept = []
             
             for (bbox, text, confidence) in results:
                 if confidence > 0.3:  # Lọc kết quả có confidence thấp
                     text_parts.append(text)
                     confidences.append(confidence)
+                    kept.append((bbox, text, confidence))
             
             combined_text = " ".join(text_parts)
             avg_confidence = sum(confidences) / len(confidences) if confidences else 0
             
+            # Vị trí từng cụm từ
+            height, width = processed_image.shape[:2]
+            geometry = PageGeometry.from_polygons(kept, width, height)
+            
             processing_time = time.time() - start_time
             
-            logger.info(f"EasyOCR trang {page_num}: {len(combined_text)} ký tự, confidence: {avg_confidence:.2f}")
+            logger.info("EasyOCR trang %d: %d ký tự, confidence: %.2f", page_num, len(combined_text), avg_confidence)
             
-            return OCRResult(
+            return PageRecord(
                 text=combined_text.strip(),
                 confidence_score=avg_confidence,
                 page_number=page_num,
-                bounding_box=None
+                bounding_box=None,
+                geometry=geometry
             )
             
         except Exception as e:
-            logger.error(f"Lỗi EasyOCR trang {page_num}: {str(e)}")
-            return OCRResult(
+            logger.error("Lỗi EasyOCR trang %d: %s", page_num, e)
+            ENGINE_FAILURES.inc(engine="easyocr")
+            return PageRecord(
                 text="",
                 confidence_score=0.0,
                 page_number=page_num,
                 bounding_box=None
             )
     
-    def ocr_with_paddleocr(self, image: Union[Image.Image, np.ndarray], page_num: int = 1) -> OCRResult:
+    def ocr_with_paddleocr(self, image: Union[Image.Image, np.ndarray], page_num: int = 1) -> PageRecord:
         """OCR với PaddleOCR cho chữ viết tay tiếng Việt"""
         if not self.paddleocr:
             logger.warning("PaddleOCR không khả dụng")
-            return OCRResult(text="", confidence_score=0.0, page_number=page_num)
+            return PageRecord(text="", confidence_score=0.0, page_number=page_num)
         
         try:
             start_time = time.time()
@@ -313,11 +350,13 @@ class OCRServiceAdvanced:
                 image_array = image
             
             # PaddleOCR
-            results = self.paddleocr.ocr(image_array)
+            with engine_timer("paddleocr"):
+                results = self.paddleocr.ocr(image_array)
             
             # Xử lý kết quả
             text_parts = []
             confidences = []
+            kept = []
             
             if results and results[0]:
                 for line in results[0]:
@@ -333,34 +372,41 @@ class OCRServiceAdvanced:
                         if confidence > 0.5:  # Lọc kết quả có confidence thấp
                             text_parts.append(text)
                             confidences.append(confidence)
+                            kept.append((line[0], text, confidence))
             
             combined_text = " ".join(text_parts)
             avg_confidence = sum(confidences) / len(confidences) if confidences else 0
             
+            # Vị trí từng cụm từ
+            height, width = image_array.shape[:2]
+            geometry = PageGeometry.from_polygons(kept, width, height)
+            
             processing_time = time.time() - start_time
             
-            logger.info(f"PaddleOCR trang {page_num}: {len(combined_text)} ký tự, confidence: {avg_confidence:.2f}")
+            logger.info("PaddleOCR trang %d: %d ký tự, confidence: %.2f", page_num, len(combined_text), avg_confidence)
             
-            return OCRResult(
+            return PageRecord(
                 text=combined_text.strip(),
                 confidence_score=avg_confidence,
                 page_number=page_num,
-                bounding_box=None
+                bounding_box=None,
+                geometry=geometry
             )
             
         except Exception as e:
-            logger.error(f"Lỗi PaddleOCR trang {page_num}: {str(e)}")
-            return OCRResult(
+            logger.error("Lỗi PaddleOCR trang %d: %s", page_num, e)
+            ENGINE_FAILURES.inc(engine="paddleocr")
+            return PageRecord(
                 text="",
                 confidence_score=0.0,
                 page_number=page_num,
                 bounding_box=None
             )
     
-    def hybrid_ocr(self, image: Image.Image, page_num: int = 1) -> OCRResult:
+    def hybrid_ocr(self, image: Image.Image, page_num: int = 1) -> PageRecord:
         """OCR hybrid kết hợp nhiều engine"""
         try:
-            logger.info(f"Bắt đầu hybrid OCR cho trang {page_num}")
+            logger.debug("Bắt đầu hybrid OCR cho trang %d", page_num)
             
             # Phát hiện vùng chữ viết tay
             regions = self.detect_handwriting_regions(image)
@@ -381,53 +427,58 @@ class OCRServiceAdvanced:
             valid_results = [(name, result) for name, result in results if result.text.strip()]
             
             if not valid_results:
-                logger.warning(f"Không có kết quả OCR hợp lệ cho trang {page_num}")
-                return OCRResult(text="", confidence_score=0.0, page_number=page_num)
-            
-            # Chọn kết quả tốt nhất (ưu tiên confidence cao và text dài)
-            best_name, best_result = max(valid_results, 
-                key=lambda x: x[1].confidence_score * 0.7 + (len(x[1].text) / 1000) * 0.3)
-            
-            logger.info(f"Chọn kết quả từ {best_name} cho trang {page_num}")
-            
-            # Nếu có nhiều kết quả tốt, kết hợp chúng
-            if len(valid_results) > 1:
-                high_confidence_results = [
-                    result for name, result in valid_results 
-                    if result.confidence_score > 0.7
-                ]
+                logger.warning("Không có kết quả OCR hợp lệ cho trang %d", page_num)
+                return PageRecord(text="", confidence_score=0.0, page_number=page_num)
+            
+            with stage_timer("selection"):
+                # Chọn kết quả tốt nhất (ưu tiên confidence cao và text dài)
+                best_name, best_result = max(valid_results, 
+                    key=lambda x: x[1].confidence_score * 0.7 + (len(x[1].text) / 1000) * 0.3)
+            
+                logger.info("Chọn kết quả từ %s cho trang %d", best_name, page_num)
+            
+                # Nếu có nhiều kết quả tốt, kết hợp chúng
+                if len(valid_results) > 1:
+                    high_confidence_results = [
+                        result for name, result in valid_results 
+                        if result.confidence_score > 0.7
+                    ]
                 
-                if len(high_confidence_results) > 1:
-                    # Kết hợp text từ các kết quả tốt
-                    combined_texts = []
-                    total_confidence = 0
+                    if len(high_confidence_results) > 1:
+                        # Kết hợp text từ các kết quả tốt
+                        combined_texts = []
+                        total_confidence = 0
                     
-                    for name, result in valid_results:
-                        if result.confidence_score > 0.5:
-                            combined_texts.append(result.text)
-                            total_confidence += result.confidence_score
+                        for name, result in valid_results:
+                            if result.confidence_score > 0.5:
+                                combined_texts.append(result.text)
+                                total_confidence += result.confidence_score
                     
-                    if combined_texts:
-                        # Loại bỏ duplicate và kết hợp
-                        unique_sentences = list(set(combined_texts))
-                        combined_text = " ".join(unique_sentences)
-                        avg_confidence = total_confidence / len(valid_results)
+                        if combined_texts:
+                            # Loại bỏ duplicate và kết hợp
+                            unique_sentences = list(set(combined_texts))
+                            combined_text = " ".join(unique_sentences)
+                            avg_confidence = total_confidence / len(valid_results)
                         
-                        best_result = OCRResult(
-                            text=combined_text,
-                            confidence_score=avg_confidence,
-                            page_number=page_num,
-                            bounding_box=None
-                        )
+                            best_result = PageRecord(
+                                text=combined_text,
+                                confidence_score=avg_confidence,
+                                page_number=page_num,
+                                bounding_box=None,
+                                geometry=best_result.geometry
+                            )
+                            best_name = "Combined"
             
+            
+            ENGINE_SELECTIONS.inc(engine=best_name.lower())
             return best_result
             
         except Exception as e:
-            logger.error(f"Lỗi hybrid OCR trang {page_num}: {str(e)}")
+            logger.error("Lỗi hybrid OCR trang %d: %s", page_num, e)
             # Fallback về Tesseract
             return self.ocr_with_tesseract(image, page_num)
     
-    def process_pdf_bytes(self, pdf_bytes: bytes) -> List[OCRResult]:
+    def process_pdf_bytes(self, pdf_bytes: bytes) -> List[PageRecord]:
         """Xử lý PDF bytes với OCR nâng cao"""
         try:
             logger.info("Bắt đầu xử lý PDF bytes với OCR nâng cao")
@@ -441,13 +492,36 @@ class OCRServiceAdvanced:
                 result = self.hybrid_ocr(image, i)
                 results.append(result)
             
-            logger.info(f"Hoàn thành OCR nâng cao {len(results)} trang")
+            logger.info("Hoàn thành OCR nâng cao %d trang", len(results))
             return results
             
         except Exception as e:
-            logger.error(f"Lỗi xử lý PDF bytes: {str(e)}")
+            logger.error("Lỗi xử lý PDF bytes: %s", e)
             raise
     
+    def pdf_page_to_image(self, pdf_bytes: bytes, page_num: int) -> Optional[Image.Image]:
+        """Chuyển đổi một trang PDF thành hình ảnh (chỉ rasterize trang cần thiết)"""
+        try:
+            with stage_timer("rasterize"):
+                images = pdf2image.convert_from_bytes(
+                    pdf_bytes,
+                    dpi=self.dpi,
+                    fmt='PNG',
+                    first_page=page_num,
+                    last_page=page_num
+                )
+            return images[0] if images else None
+        except Exception as e:
+            logger.error("Lỗi chuyển đổi trang %d: %s", page_num, e)
+            raise
+    
+    def process_pdf_page(self, pdf_bytes: bytes, page_num: int) -> PageRecord:
+        """Rasterize và OCR một trang PDF (đơn vị công việc của page scheduler)"""
+        image = self.pdf_page_to_image(pdf_bytes, page_num)
+        if image is None:
+            raise ValueError(f"Không rasterize được trang {page_num} của PDF")
+        return self.hybrid_ocr(image, page_num)
+    
     def detect_document_type(self, filename: str) -> DocumentType:
         """Nhận diện loại tài liệu từ tên file"""
         filename_upper = filename.upper()
@@ -459,11 +533,11 @@ class OCRServiceAdvanced:
         else:
             return DocumentType.THONG_TIN_VAN_BAN
     
-    def get_combined_text(self, ocr_results: List[OCRResult]) -> str:
+    def get_combined_text(self, ocr_results: List[PageRecord]) -> str:
         """Kết hợp văn bản từ tất cả các trang"""
         return "\n\n".join([result.text for result in ocr_results if result.text])
     
-    def get_average_confidence(self, ocr_results: List[OCRResult]) -> float:
+    def get_average_confidence(self, ocr_results: List[PageRecord]) -> float:
         """Tính confidence score trung bình"""
         if not ocr_results:
             return 0.0
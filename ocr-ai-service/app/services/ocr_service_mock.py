@@ -3,7 +3,9 @@ import time
 from typing import List, Dict, Optional, Tuple
 from datetime import datetime
 
-from app.models.schemas import OCRResult, DocumentType
+from app.models.schemas import DocumentType
+from app.models.records import PageRecord
+from app.models.geometry import PageGeometry
 from config.settings import settings
 
 logger = logging.getLogger(__name__)
@@ -16,10 +18,18 @@ class OCRServiceMock:
         self.dpi = settings.OCR_DPI
         self.lang = settings.OCR_LANG
         
-    def process_pdf_bytes(self, pdf_bytes: bytes) -> List[OCRResult]:
+    def get_page_count(self, pdf_bytes: bytes) -> int:
+        """Mock đếm số trang (luôn trả về 1 trang)"""
+        return 1
+    
+    def estimate_page_count(self, pdf_bytes: bytes) -> int:
+        """Mock ước lượng số trang (luôn trả về 1 trang)"""
+        return 1
+    
+    def process_pdf_bytes(self, pdf_bytes: bytes) -> List[PageRecord]:
         """Mock xử lý PDF bytes và trả về kết quả OCR giả lập"""
         try:
-            logger.info("Mock OCR: Đang xử lý PDF bytes")
+            logger.debug("Mock OCR: Đang xử lý PDF bytes")
             time.sleep(1)  # Giả lập thời gian xử lý
             
             # Tạo kết quả OCR giả lập
@@ -34,20 +44,38 @@ class OCRServiceMock:
             GHI CHÚ: Hồ sơ đã được số hóa và lưu trữ
             """
             
-            result = OCRResult(
+            # Bố cục giả lập: mỗi dòng cao 40px, mỗi ký tự rộng 12px
+            words = []
+            for line, line_text in enumerate(mock_text.strip().splitlines()):
+                x = 100
+                for word in line_text.split():
+                    words.append((word, (x, 100 + line * 40, x + len(word) * 12, 130 + line * 40), 0.92, line))
+                    x += (len(word) + 1) * 12
+            
+            result = PageRecord(
                 text=mock_text.strip(),
                 confidence_score=0.92,
                 page_number=1,
-                bounding_box=None
+                bounding_box=None,
+                geometry=PageGeometry.from_words(words, width=2480, height=3508)
             )
             
-            logger.info("Mock OCR: Hoàn thành xử lý 1 trang")
+            logger.debug("Mock OCR: Hoàn thành xử lý 1 trang")
             return [result]
             
         except Exception as e:
-            logger.error(f"Mock OCR error: {str(e)}")
+            logger.error("Mock OCR error: %s", e)
             return []
     
+    def process_pdf_page(self, pdf_bytes: bytes, page_num: int) -> PageRecord:
+        """Mock xử lý một trang PDF"""
+        results = self.process_pdf_bytes(pdf_bytes)
+        if not results:
+            return PageRecord(text="", confidence_score=0.0, page_number=page_num)
+        result = results[0]
+        result.page_number = page_num
+        return result
+    
     def detect_document_type(self, filename: str) -> DocumentType:
         """Nhận diện loại tài liệu từ tên file"""
         filename_upper = filename.upper()
@@ -59,11 +87,11 @@ class OCRServiceMock:
         else:
             return DocumentType.THONG_TIN_VAN_BAN
     
-    def get_combined_text(self, ocr_results: List[OCRResult]) -> str:
+    def get_combined_text(self, ocr_results: List[PageRecord]) -> str:
         """Kết hợp văn bản từ tất cả các trang"""
         return "\n\n".join([result.text for result in ocr_results if result.text])
     
-    def get_average_confidence(self, ocr_results: List[OCRResult]) -> float:
+    def get_average_confidence(self, ocr_results: List[PageRecord]) -> float:
         """Tính confidence score trung bình"""
         if not ocr_results:
             return 0.0
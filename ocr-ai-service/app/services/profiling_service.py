@@ -0,0 +1,164 @@
+import cProfile
+import hmac
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter as CounterDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ProfilingDeniedError(Exception):
+    """Token profiling không hợp lệ hoặc profiling chưa được bật"""
+
+
+class StackSampler:
+    """Sampler thống kê: định kỳ lấy stack của các thread mục tiêu qua sys._current_frames()
+
+    Kết quả ở dạng folded stack ("a;b;c số_mẫu"), dùng trực tiếp với
+    flamegraph.pl, speedscope hoặc inferno.
+    """
+
+    def __init__(self, thread_ids: Callable[[], Iterable[int]], interval: float = None):
+        self.thread_ids = thread_ids
+        self.interval = interval or settings.PROFILING_SAMPLE_INTERVAL
+        self.samples: CounterDict = CounterDict()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _frame_label(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    @staticmethod
+    def _is_idle(frame) -> bool:
+        # Worker đang chờ việc (Condition.wait) không phải là thời gian xử lý
+        code = frame.f_code
+        return code.co_name == "wait" and code.co_filename.endswith("threading.py")
+
+    def _sample(self) -> None:
+        frames = sys._current_frames()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id in self.thread_ids():
+            frame = frames.get(thread_id)
+            if frame is None or self._is_idle(frame):
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_label(frame))
+                frame = frame.f_back
+            stack.append(names.get(thread_id, str(thread_id)))
+            self.samples[";".join(reversed(stack))] += 1
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+class RequestProfiler:
+    """Profile theo yêu cầu cho một request xử lý tài liệu
+
+    - Chỉ bật khi có PROFILING_TOKEN và client gửi đúng token; khi không yêu cầu
+      thì không có chi phí nào (không hook, không thread sampler).
+    - Mỗi process chỉ chạy một profile tại một thời điểm và cách nhau tối thiểu
+      PROFILING_MIN_INTERVAL giây.
+    - Thread xử lý request được profile bằng cProfile (.prof, đọc bằng pstats/snakeviz);
+      thread gọi và các worker OCR được lấy mẫu stack (.folded cho flamegraph).
+    """
+
+    def __init__(self, token: str = None, output_dir: str = None, min_interval: float = None):
+        self.token = token if token is not None else settings.PROFILING_TOKEN
+        self.output_dir = Path(output_dir or settings.PROFILING_DIR)
+        self.min_interval = min_interval if min_interval is not None else settings.PROFILING_MIN_INTERVAL
+        self._lock = threading.Lock()
+        self._active = False
+        self._last_started: Optional[float] = None
+        self.profiles_written = 0
+        self.skipped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.token)
+
+    def authorize(self, provided: str) -> None:
+        """Ném ProfilingDeniedError nếu profiling chưa bật hoặc token sai"""
+        if not self.enabled:
+            raise ProfilingDeniedError("Profiling chưa được bật trên server")
+        if not hmac.compare_digest(provided.encode("utf-8"), self.token.encode("utf-8")):
+            raise ProfilingDeniedError("Token profiling không hợp lệ")
+
+    def try_acquire(self) -> bool:
+        """Giữ slot profiling của process (False nếu đang bận hoặc chưa hết khoảng cách tối thiểu)"""
+        now = time.monotonic()
+        with self._lock:
+            if self._active or (self._last_started is not None
+                                and now - self._last_started < self.min_interval):
+                self.skipped += 1
+                return False
+            self._active = True
+            self._last_started = now
+            return True
+
+    def run(self, func: Callable[..., Any], *args: Any,
+            thread_ids: Callable[[], Iterable[int]] = lambda: ()) -> Tuple[Any, str]:
+        """Chạy func dưới profiler (đã try_acquire), trả về (kết quả, profile_id)
+
+        thread_ids trả về các thread khác cần lấy mẫu (vd. worker của scheduler).
+        """
+        profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        current = threading.get_ident()
+        sampler = StackSampler(lambda: (current, *thread_ids()))
+        profiler = cProfile.Profile()
+        try:
+            sampler.start()
+            profiler.enable()
+            try:
+                result = func(*args)
+            finally:
+                profiler.disable()
+                sampler.stop()
+                self._write(profile_id, profiler, sampler)
+        finally:
+            with self._lock:
+                self._active = False
+        return result, profile_id
+
+    def _write(self, profile_id: str, profiler: cProfile.Profile, sampler: StackSampler) -> None:
+        try:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(str(self.output_dir / f"{profile_id}.prof"))
+            (self.output_dir / f"{profile_id}.folded").write_text(sampler.folded(), encoding="utf-8")
+            self.profiles_written += 1
+            logger.info("Đã lưu profile %s (%d mẫu) vào %s",
+                        profile_id, sum(sampler.samples.values()), self.output_dir)
+        except Exception as e:
+            logger.error("Lỗi lưu profile %s: %s", profile_id, e)
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "active": self._active,
+            "profiles_written": self.profiles_written,
+            "skipped": self.skipped,
+            "min_interval": self.min_interval
+        }
@@ -0,0 +1,205 @@
+import heapq
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Khóa file chọn worker chạy retention (không có trên Windows: mọi worker đều xóa)
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+from app.models.schemas import DocumentSummary
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionManager:
+    """Tự động xóa tài liệu hết hạn (TTL) trong background
+
+    Thời điểm hết hạn được giữ trong một heap (expires_at, document_id) nên mỗi lần
+    thêm/lấy ra là O(log n); không cần quét toàn bộ tài liệu. Tài liệu bị xóa trước hạn
+    (forget) chỉ bị bỏ khỏi tập tài liệu đang theo dõi, mục trong heap bị bỏ qua khi đến
+    hạn (xóa lười) và heap được dựng lại khi số mục chết vượt số tài liệu còn sống.
+    Tài liệu do worker khác xóa vẫn được theo dõi tới hạn (expire_callback trả về False).
+
+    Với store dùng chung giữa các worker (sweep_callback), không dựng heap: chỉ worker
+    giữ khóa lock_path định kỳ gọi sweep_callback(cutoff) để xóa theo index created_at;
+    worker khác nhận khóa khi worker đó dừng.
+    """
+
+    def __init__(self, expire_callback: Callable[[str], bool],
+                 ttl_hours: float = None, check_interval: float = None,
+                 sweep_callback: Optional[Callable[[datetime], int]] = None,
+                 lock_path: Optional[Path] = None):
+        self.expire_callback = expire_callback
+        self.sweep_callback = sweep_callback
+        self.lock_path = lock_path
+        self.ttl_seconds = (ttl_hours if ttl_hours is not None else settings.DOCUMENT_TTL_HOURS) * 3600
+        self.check_interval = check_interval or settings.RETENTION_CHECK_INTERVAL
+        self._lock_fd: Optional[int] = None
+
+        self._heap: List[Tuple[float, str]] = []
+        # Tài liệu đang theo dõi -> thời điểm hết hạn (mục heap không khớp là mục chết)
+        self._live: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.expired_count = 0
+        self.last_run: Optional[datetime] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0
+
+    @property
+    def tracking(self) -> bool:
+        """Có theo dõi từng tài liệu bằng heap hay không"""
+        return self.enabled and self.sweep_callback is None
+
+    def track(self, summary: DocumentSummary) -> None:
+        """Đăng ký thời điểm hết hạn cho tài liệu mới"""
+        if not self.tracking:
+            return
+        expires_at = summary.created_at.timestamp() + self.ttl_seconds
+        with self._lock:
+            if self._live.get(summary.document_id) == expires_at:
+                return
+            self._live[summary.document_id] = expires_at
+            heapq.heappush(self._heap, (expires_at, summary.document_id))
+            self._compact()
+
+    def track_all(self, keys: Iterable[Tuple[float, str]]) -> None:
+        """Dựng heap từ khóa (created_at, document_id) của các tài liệu đã có (khi khởi động)"""
+        if not self.tracking:
+            return
+        entries = {document_id: created_at + self.ttl_seconds for created_at, document_id in keys}
+        with self._lock:
+            self._live.update(entries)
+            self._heap = [(expires_at, document_id) for document_id, expires_at in self._live.items()]
+            heapq.heapify(self._heap)
+
+    def forget(self, document_id: str) -> None:
+        """Bỏ theo dõi tài liệu đã bị xóa trước hạn"""
+        with self._lock:
+            if self._live.pop(document_id, None) is not None:
+                self._compact()
+
+    def _compact(self) -> None:
+        """Dựng lại heap chỉ từ tài liệu còn sống khi mục chết chiếm quá nửa (gọi khi giữ lock)"""
+        if len(self._heap) > 2 * len(self._live) + 64:
+            self._heap = [(expires_at, document_id) for document_id, expires_at in self._live.items()]
+            heapq.heapify(self._heap)
+
+    def _next_expiry(self) -> Optional[float]:
+        """Thời điểm hết hạn gần nhất của tài liệu còn sống (bỏ mục chết ở đỉnh heap, gọi khi giữ lock)"""
+        while self._heap and self._live.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def _acquire_leadership(self) -> bool:
+        """Giữ khóa file để chỉ một worker xóa tài liệu của store dùng chung"""
+        if self._lock_fd is not None or not FCNTL_AVAILABLE or self.lock_path is None:
+            return True
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        logger.info("Worker %d phụ trách retention của store dùng chung", os.getpid())
+        return True
+
+    def _release_leadership(self) -> None:
+        """Trả khóa để worker khác nhận việc xóa"""
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def expire_due(self, now: Optional[float] = None) -> int:
+        """Xóa các tài liệu đã đến hạn, trả về số tài liệu bị xóa"""
+        now = now if now is not None else time.time()
+        if self.sweep_callback is not None:
+            if not self._acquire_leadership():
+                return 0
+            try:
+                expired = self.sweep_callback(datetime.fromtimestamp(now - self.ttl_seconds))
+            except Exception as e:
+                logger.error("Lỗi xóa tài liệu hết hạn: %s", e)
+                expired = 0
+            return self._record_run(expired)
+
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                expires_at, document_id = heapq.heappop(self._heap)
+                if self._live.get(document_id) == expires_at:
+                    del self._live[document_id]
+                    due.append(document_id)
+
+        expired = 0
+        for document_id in due:
+            try:
+                if self.expire_callback(document_id):
+                    expired += 1
+            except Exception as e:
+                logger.error("Lỗi xóa tài liệu hết hạn %s: %s", document_id, e)
+
+        return self._record_run(expired)
+
+    def _record_run(self, expired: int) -> int:
+        """Cập nhật thống kê sau một lượt xóa"""
+        self.expired_count += expired
+        self.last_run = datetime.now()
+        if expired:
+            logger.info("Retention: đã xóa %d tài liệu hết hạn", expired)
+        return expired
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.expire_due()
+            with self._lock:
+                next_expiry = self._next_expiry()
+            timeout = self.check_interval
+            if next_expiry is not None:
+                timeout = min(timeout, max(0.0, next_expiry - time.time()))
+            self._stop.wait(timeout)
+
+    def start(self) -> None:
+        """Khởi động thread retention"""
+        if not self.enabled or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="retention-manager", daemon=True)
+        self._thread.start()
+        logger.info("Retention manager khởi động (TTL %g giờ)", self.ttl_seconds / 3600)
+
+    def stop(self) -> None:
+        """Dừng thread retention"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self._release_leadership()
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            tracked = len(self._live)
+            next_expiry = self._next_expiry()
+        return {
+            "enabled": self.enabled,
+            "ttl_hours": self.ttl_seconds / 3600,
+            "mode": "heap" if self.sweep_callback is None else "sweep",
+            "leader": self._lock_fd is not None,
+            "tracked_documents": tracked,
+            "next_expiry": datetime.fromtimestamp(next_expiry).isoformat() if next_expiry else None,
+            "expired_documents": self.expired_count,
+            "last_run": self.last_run.isoformat() if self.last_run else None
+        }
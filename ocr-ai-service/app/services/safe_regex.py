@@ -0,0 +1,164 @@
+import logging
+import re
+import time
+from typing import Any, Optional, Tuple
+
+from app.services.metrics_service import REGEX_BUDGET_EXCEEDED
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Engine regex theo thứ tự ưu tiên: re2 (thời gian tuyến tính), regex (có timeout), re
+try:
+    import re2
+    RE2_AVAILABLE = True
+    _RE2_OPTIONS = re2.Options()
+    _RE2_OPTIONS.log_errors = False
+except ImportError:
+    RE2_AVAILABLE = False
+
+try:
+    import regex
+    REGEX_AVAILABLE = True
+except ImportError:
+    REGEX_AVAILABLE = False
+
+ENGINES = ("re2", "regex", "re")
+
+# Cờ re được hỗ trợ khi viết lại pattern (dạng cờ inline)
+_RE2_INLINE_FLAGS = {re.IGNORECASE: "i", re.DOTALL: "s", re.MULTILINE: "m"}
+
+# Lớp ký tự Unicode của re viết tường minh: \w, \d, \s của re2 chỉ là ASCII,
+# của regex theo thuộc tính Unicode khác re (vd. "①" không phải \w)
+_WORD = r"\p{L}\p{N}_"
+_DIGIT = r"\p{Nd}"
+_SPACE = "\\t\\n\x0b\\f\\r\x1c-\x1f\x85\\p{Z}"
+_CLASS_ESCAPES = {"w": _WORD, "d": _DIGIT, "s": _SPACE}
+
+
+class RegexTimeout(Exception):
+    """Regex vượt quá thời gian cho phép"""
+
+
+def _translate(pattern: str, flags: int) -> Optional[str]:
+    """Viết lại pattern re theo cú pháp re2 (regex cũng hiểu) giữ nguyên ngữ nghĩa Unicode của re
+
+    None nếu pattern dùng cú pháp re2 không có (lookaround, backreference, biên từ).
+    """
+    inline = ""
+    for flag, letter in _RE2_INLINE_FLAGS.items():
+        if flags & flag:
+            inline += letter
+    if flags & ~(re.IGNORECASE | re.DOTALL | re.MULTILINE | re.UNICODE):
+        return None
+    if any(token in pattern for token in ("(?=", "(?!", "(?<=", "(?<!", "(?P=")):
+        return None
+
+    out = []
+    in_class = False
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\" and i + 1 < len(pattern):
+            escape = pattern[i + 1]
+            i += 2
+            if escape in _CLASS_ESCAPES:
+                out.append(_CLASS_ESCAPES[escape] if in_class else f"[{_CLASS_ESCAPES[escape]}]")
+            elif escape in ("W", "D", "S"):
+                if in_class:
+                    return None
+                out.append(f"[^{_CLASS_ESCAPES[escape.lower()]}]")
+            elif escape.isdigit() or escape in ("b", "B", "Z"):
+                # Backreference và biên từ (re2 chỉ hỗ trợ ASCII)
+                return None
+            else:
+                out.append("\\" + escape)
+            continue
+        if char == "[" and not in_class:
+            in_class = True
+        elif char == "]" and in_class:
+            in_class = False
+        out.append(char)
+        i += 1
+    return (f"(?{inline})" if inline else "") + "".join(out)
+
+
+def _compile(pattern: str, flags: int, engine: str) -> Tuple[str, Any]:
+    """(tên engine, pattern đã compile) với engine an toàn nhất dùng được cho pattern"""
+    start = ENGINES.index(engine) if engine in ENGINES else 0
+    source = _translate(pattern, flags)
+    for candidate in ENGINES[start:]:
+        if candidate == "re2" and RE2_AVAILABLE and source is not None:
+            try:
+                return candidate, re2.compile(source, _RE2_OPTIONS)
+            except Exception:
+                pass
+        elif candidate == "regex" and REGEX_AVAILABLE:
+            if source is not None:
+                return candidate, regex.compile(source)
+            return candidate, regex.compile(pattern, flags)
+        elif candidate == "re":
+            return candidate, re.compile(pattern, flags)
+    return "re", re.compile(pattern, flags)
+
+
+class SafePattern:
+    """Pattern compile bằng engine an toàn nhất có sẵn (theo REGEX_ENGINE)
+
+    - re2: thời gian tuyến tính theo độ dài text, không bị backtracking
+    - regex: vẫn backtracking nhưng dừng được theo timeout
+    - re: không giới hạn được một lần search (chỉ kiểm tra ngân sách giữa các lần)
+    Số nhóm và cú pháp được kiểm tra bằng re, kết quả match giống re.
+    """
+
+    __slots__ = ("pattern", "flags", "engine", "groups", "_compiled")
+
+    def __init__(self, pattern: str, flags: int = 0, engine: str = None):
+        self.pattern = pattern
+        self.flags = flags
+        self.groups = re.compile(pattern, flags).groups
+        self.engine, self._compiled = _compile(pattern, flags, engine or settings.REGEX_ENGINE)
+
+    def search(self, text: str, timeout: Optional[float] = None):
+        if timeout is not None and self.engine == "regex":
+            try:
+                return self._compiled.search(text, timeout=timeout)
+            except TimeoutError:
+                raise RegexTimeout(self.pattern)
+        return self._compiled.search(text)
+
+    def __repr__(self) -> str:
+        return f"SafePattern({self.pattern!r}, engine={self.engine})"
+
+
+class RegexBudget:
+    """Ngân sách thời gian cho toàn bộ regex trường của một tài liệu
+
+    Khi hết ngân sách, các lần search còn lại trả về None (trường chuyển sang
+    NER/semantic search) thay vì giữ worker với text bất thường.
+    """
+
+    def __init__(self, seconds: float = None):
+        seconds = settings.REGEX_TIME_BUDGET if seconds is None else seconds
+        self.deadline = time.monotonic() + seconds if seconds > 0 else None
+        self.exceeded = False
+
+    def remaining(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def search(self, pattern: SafePattern, text: str):
+        if self.exceeded:
+            return None
+        remaining = self.remaining()
+        try:
+            if remaining is not None and remaining <= 0:
+                raise RegexTimeout(pattern.pattern)
+            return pattern.search(text, timeout=remaining)
+        except RegexTimeout:
+            self.exceeded = True
+            REGEX_BUDGET_EXCEEDED.inc()
+            logger.warning("Hết ngân sách regex (%s) tại pattern %r, text %d ký tự",
+                           pattern.engine, pattern.pattern, len(text))
+            return None
@@ -0,0 +1,229 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+from app.models.schemas import PriorityClass
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Thứ tự ưu tiên giữa các lớp (lớp đầu tiên được phục vụ trước)
+PRIORITY_ORDER = [PriorityClass.INTERACTIVE, PriorityClass.BULK]
+
+
+class ScheduledJob:
+    """Một tài liệu đã được đưa vào scheduler, gồm nhiều page task"""
+
+    def __init__(self, job_id: int, client_id: str, priority: PriorityClass,
+                 tasks: List[Callable[[], Any]], listener: Any = None):
+        self.job_id = job_id
+        self.client_id = client_id
+        self.priority = priority
+        self.listener = listener
+        self.total_pages = len(tasks)
+        self.submitted_at = time.monotonic()
+
+        self._tasks = deque(enumerate(tasks))
+        self._results: List[Any] = [None] * len(tasks)
+        self._error: Optional[BaseException] = None
+        self._remaining = len(tasks)
+        self._done = threading.Event()
+        if not tasks:
+            self._done.set()
+
+    @property
+    def pending_pages(self) -> int:
+        """Số trang chưa được giao cho worker"""
+        return len(self._tasks)
+
+    def wait(self, timeout: Optional[float] = None) -> List[Any]:
+        """Chờ tất cả các trang hoàn thành và trả về kết quả theo thứ tự trang"""
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"Job {self.job_id} chưa hoàn thành sau {timeout}s")
+        if self._error is not None:
+            raise self._error
+        return self._results
+
+    def _complete_page(self, index: int, result: Any, error: Optional[BaseException]) -> None:
+        if error is not None and self._error is None:
+            self._error = error
+        self._results[index] = result
+        self._remaining -= 1
+        if self._remaining == 0:
+            self._done.set()
+
+
+class PageScheduler:
+    """Scheduler theo trang với lớp ưu tiên, fair share giữa các client và SJF
+
+    Thứ tự chọn page task tiếp theo:
+    1. Lớp ưu tiên: INTERACTIVE trước BULK, nhưng BULK vẫn được phục vụ ít nhất
+       1 trong mỗi (SCHEDULER_INTERACTIVE_WEIGHT + 1) lượt để tránh starvation.
+    2. Trong một lớp: client đã được phục vụ ít trang nhất (fair share); giữa các
+       client được phục vụ như nhau, client có job nhỏ nhất ít trang hơn đi trước (SJF).
+    3. Trong một client: job còn ít trang nhất (shortest-job-first).
+    Fair share được đặt trước SJF giữa các client để một client gửi nhiều tài liệu nhỏ
+    không chặn tài liệu lớn của client khác.
+
+    Khi một trang lỗi, các trang chưa giao của job bị hủy; job kết thúc (wait() ném
+    lỗi) ngay khi các trang đang chạy hoàn thành.
+    """
+
+    def __init__(self, num_workers: int = None):
+        self.num_workers = num_workers or settings.OCR_WORKERS
+        self.interactive_weight = settings.SCHEDULER_INTERACTIVE_WEIGHT
+
+        self._cond = threading.Condition()
+        self._job_ids = itertools.count(1)
+        # priority -> client_id -> heap[(pending_pages, job_id, job)]
+        self._queues: Dict[PriorityClass, Dict[str, list]] = {p: {} for p in PRIORITY_ORDER}
+        # priority -> client_id -> số trang đã phục vụ (virtual time)
+        self._served: Dict[PriorityClass, Dict[str, int]] = {p: {} for p in PRIORITY_ORDER}
+        self._pending_pages: Dict[PriorityClass, int] = {p: 0 for p in PRIORITY_ORDER}
+        self._interactive_streak = 0
+        self.busy_workers = 0
+        self._shutdown = False
+
+        self._workers = []
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"page-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+        logger.info("Page scheduler khởi tạo với %d worker", self.num_workers)
+
+    def submit(self, client_id: str, priority: PriorityClass,
+               tasks: List[Callable[[], Any]], listener: Any = None) -> ScheduledJob:
+        """Đưa các page task của một tài liệu vào hàng đợi
+
+        listener (tùy chọn) nhận callback page_started() và page_finished(elapsed)
+        """
+        with self._cond:
+            job = ScheduledJob(next(self._job_ids), client_id, priority, tasks, listener)
+            if job.total_pages:
+                clients = self._queues[priority]
+                served = self._served[priority]
+                if client_id not in clients:
+                    # Client mới hoạt động bắt đầu từ mức phục vụ thấp nhất hiện tại,
+                    # không được tích lũy "tín dụng" trong thời gian nhàn rỗi
+                    served[client_id] = min(served.values()) if served else 0
+                    clients[client_id] = []
+                heapq.heappush(clients[client_id], (job.pending_pages, job.job_id, job))
+                self._pending_pages[priority] += job.total_pages
+                self._cond.notify(job.total_pages)
+        return job
+
+    def _select_priority(self) -> Optional[PriorityClass]:
+        interactive_waiting = self._pending_pages[PriorityClass.INTERACTIVE] > 0
+        bulk_waiting = self._pending_pages[PriorityClass.BULK] > 0
+        if interactive_waiting and bulk_waiting:
+            if self._interactive_streak >= self.interactive_weight:
+                self._interactive_streak = 0
+                return PriorityClass.BULK
+            self._interactive_streak += 1
+            return PriorityClass.INTERACTIVE
+        self._interactive_streak = 0
+        if interactive_waiting:
+            return PriorityClass.INTERACTIVE
+        if bulk_waiting:
+            return PriorityClass.BULK
+        return None
+
+    def _next_task(self):
+        """Chọn page task tiếp theo (gọi khi đang giữ lock)"""
+        priority = self._select_priority()
+        if priority is None:
+            return None
+
+        clients = self._queues[priority]
+        served = self._served[priority]
+        client_id = min(clients, key=lambda c: (served[c], clients[c][0][0]))
+        heap = clients[client_id]
+
+        _, _, job = heapq.heappop(heap)
+        index, task = job._tasks.popleft()
+        if job.pending_pages:
+            heapq.heappush(heap, (job.pending_pages, job.job_id, job))
+        served[client_id] += 1
+        if not heap:
+            del clients[client_id]
+            del served[client_id]
+
+        self._pending_pages[priority] -= 1
+        return job, index, task
+
+    def _worker_loop(self) -> None:
+        while True:
+            with self._cond:
+                item = self._next_task()
+                while item is None:
+                    if self._shutdown:
+                        return
+                    self._cond.wait()
+                    item = self._next_task()
+                self.busy_workers += 1
+
+            job, index, task = item
+            if job.listener is not None:
+                job.listener.page_started()
+
+            start = time.monotonic()
+            result, error = None, None
+            try:
+                result = task()
+            except Exception as e:
+                logger.error("Lỗi page task %d của job %s: %s", index + 1, job.job_id, e)
+                error = e
+            elapsed = time.monotonic() - start
+
+            if job.listener is not None:
+                job.listener.page_finished(elapsed)
+
+            with self._cond:
+                self.busy_workers -= 1
+                if error is not None:
+                    self._cancel(job)
+                job._complete_page(index, result, error)
+
+    def _cancel(self, job: ScheduledJob) -> None:
+        """Bỏ các trang chưa giao của job khỏi hàng đợi (gọi khi đang giữ lock)"""
+        dropped = job.pending_pages
+        if not dropped:
+            return
+        job._tasks.clear()
+        job._remaining -= dropped
+        self._pending_pages[job.priority] -= dropped
+
+        clients = self._queues[job.priority]
+        heap = clients.get(job.client_id)
+        if heap is not None:
+            heap[:] = [entry for entry in heap if entry[2] is not job]
+            heapq.heapify(heap)
+            if not heap:
+                del clients[job.client_id]
+                del self._served[job.priority][job.client_id]
+        logger.warning("Hủy %d trang còn lại của job %s do trang lỗi", dropped, job.job_id)
+
+    def thread_ids(self) -> List[int]:
+        """Ident của các worker thread (dùng cho sampler khi profiling)"""
+        return [worker.ident for worker in self._workers if worker.ident is not None]
+
+    def shutdown(self) -> None:
+        """Dừng các worker sau khi hết việc đang chờ"""
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+
+    def get_status(self) -> Dict[str, Any]:
+        """Trạng thái hàng đợi và worker"""
+        with self._cond:
+            return {
+                "workers": self.num_workers,
+                "busy_workers": self.busy_workers,
+                "queued_pages": {p.value: self._pending_pages[p] for p in PRIORITY_ORDER},
+                "active_clients": {p.value: len(self._queues[p]) for p in PRIORITY_ORDER}
+            }
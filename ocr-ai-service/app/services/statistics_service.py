@@ -0,0 +1,128 @@
+import bisect
+import threading
+import time
+from typing import Any, Dict, Optional, Sequence
+
+# Bucket mặc định (giây) cho histogram độ trễ
+DEFAULT_LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0
+)
+
+# Cửa sổ thời gian cho throughput (nhãn -> giây)
+THROUGHPUT_WINDOWS = {"1m": 60, "5m": 300, "15m": 900}
+
+
+class LatencyHistogram:
+    """Histogram bucket cố định, percentile tính trong O(số bucket)"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # bucket cuối là +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q: float) -> float:
+        """Ước lượng percentile bằng nội suy tuyến tính trong bucket"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= target and bucket_count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                upper = min(upper, self.max)
+                fraction = (target - cumulative) / bucket_count
+                return lower + (max(upper, lower) - lower) * fraction
+            cumulative += bucket_count
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "p50": self.percentile(0.50),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "max": self.max
+        }
+
+
+class SlidingWindowCounter:
+    """Bộ đếm trong cửa sổ trượt dùng ring buffer các bucket thời gian"""
+
+    def __init__(self, horizon_seconds: int = 900, bucket_seconds: int = 10):
+        self.bucket_seconds = bucket_seconds
+        self.num_buckets = horizon_seconds // bucket_seconds
+        self.values = [0] * self.num_buckets
+        self.epochs = [-1] * self.num_buckets
+
+    def add(self, amount: int = 1, now: Optional[float] = None) -> None:
+        epoch = int((now if now is not None else time.time()) // self.bucket_seconds)
+        index = epoch % self.num_buckets
+        if self.epochs[index] != epoch:
+            self.epochs[index] = epoch
+            self.values[index] = 0
+        self.values[index] += amount
+
+    def total(self, window_seconds: int, now: Optional[float] = None) -> int:
+        """Tổng trong window_seconds gần nhất (số bucket cố định nên O(1))"""
+        current = int((now if now is not None else time.time()) // self.bucket_seconds)
+        oldest = current - window_seconds // self.bucket_seconds + 1
+        return sum(
+            value for value, epoch in zip(self.values, self.epochs)
+            if oldest <= epoch <= current
+        )
+
+
+class StatisticsCollector:
+    """Độ trễ và throughput của worker hiện tại
+
+    Chỉ giữ số liệu theo process (mỗi worker uvicorn một bản, mất khi restart).
+    Thống kê tài liệu (số lượng theo trạng thái/loại, trung bình) được tính từ
+    document store dùng chung, xem DocumentStore.aggregates().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency: Dict[str, LatencyHistogram] = {}
+        self.completed_documents = SlidingWindowCounter()
+        self.completed_pages = SlidingWindowCounter()
+
+    def record_completion(self, pages: int) -> None:
+        """Ghi nhận một tài liệu hoàn thành cho throughput"""
+        with self._lock:
+            self.completed_documents.add(1)
+            self.completed_pages.add(pages)
+
+    def observe_stage(self, stage: str, seconds: float) -> None:
+        """Ghi nhận độ trễ của một stage"""
+        with self._lock:
+            histogram = self.latency.get(stage)
+            if histogram is None:
+                histogram = self.latency[stage] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Độ trễ và throughput của worker hiện tại"""
+        now = time.time()
+        with self._lock:
+            throughput = {}
+            for label, seconds in THROUGHPUT_WINDOWS.items():
+                minutes = seconds / 60
+                throughput[label] = {
+                    "documents_per_minute": self.completed_documents.total(seconds, now) / minutes,
+                    "pages_per_minute": self.completed_pages.total(seconds, now) / minutes
+                }
+            return {
+                "latency": {stage: histogram.summary() for stage, histogram in self.latency.items()},
+                "throughput": throughput
+            }
@@ -0,0 +1,277 @@
+import json
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Mã trạng thái span theo OTLP
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+# SpanKind INTERNAL theo OTLP
+SPAN_KIND_INTERNAL = 1
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()]
+
+
+class Span:
+    """Một span trong trace (thời gian theo nanosecond epoch như OTLP)"""
+
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start_ns", "end_ns",
+                 "attributes", "status", "status_message")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        thread = threading.current_thread()
+        self.attributes = {"thread.id": thread.ident, "thread.name": thread.name, **attributes}
+        self.status = STATUS_UNSET
+        self.status_message = ""
+
+    def set_attributes(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.status = STATUS_ERROR
+            self.status_message = f"{type(error).__name__}: {error}"
+        self.trace._finish(self)
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": SPAN_KIND_INTERNAL,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": _otlp_attributes(self.attributes),
+            "status": {"code": self.status, "message": self.status_message} if self.status else {}
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class Trace:
+    """Tập span của một tài liệu, được export một lần khi span gốc kết thúc"""
+
+    def __init__(self, name: str):
+        self.trace_id = os.urandom(16).hex()
+        self.name = name
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def _finish(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """Định dạng OTLP/JSON (như file exporter của OpenTelemetry Collector)"""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.start_ns)
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": _otlp_attributes({
+                    "service.name": settings.PROJECT_NAME,
+                    "service.version": settings.VERSION
+                })},
+                "scopeSpans": [{
+                    "scope": {"name": __name__},
+                    "spans": [span.to_otlp() for span in spans]
+                }]
+            }]
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            root = next((span for span in self.spans if span.parent_id is None), None)
+            span_count = len(self.spans)
+        if root is None:
+            return {"trace_id": self.trace_id, "name": self.name, "spans": span_count}
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "spans": span_count,
+            "start_time": root.start_ns / 1e9,
+            "duration": (root.end_ns - root.start_ns) / 1e9,
+            "status": root.status,
+            "attributes": {k: v for k, v in root.attributes.items() if not k.startswith("thread.")}
+        }
+
+
+class SpanExporter(ABC):
+    """Interface exporter: nhận trace đã hoàn thành"""
+
+    @abstractmethod
+    def export(self, trace: Trace) -> None:
+        """Xuất một trace khi span gốc kết thúc"""
+
+
+class FileSpanExporter(SpanExporter):
+    """Ghi mỗi trace thành một dòng OTLP/JSON (đọc lại được bằng otlpjsonfile receiver)"""
+
+    def __init__(self, path: str = None):
+        self.path = Path(path or settings.TRACING_FILE)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def export(self, trace: Trace) -> None:
+        line = json.dumps(trace.to_otlp(), ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+class InMemorySpanExporter(SpanExporter):
+    """Giữ các trace gần nhất trong bộ nhớ, xem qua API /traces"""
+
+    def __init__(self, max_traces: int = None):
+        self.max_traces = max_traces or settings.TRACING_MAX_TRACES
+        self._traces: "OrderedDict[str, Trace]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def export(self, trace: Trace) -> None:
+        with self._lock:
+            self._traces[trace.trace_id] = trace
+            while len(self._traces) > self.max_traces:
+                self._traces.popitem(last=False)
+
+    def get(self, trace_id: str) -> Optional[Trace]:
+        with self._lock:
+            return self._traces.get(trace_id)
+
+    def list(self, limit: int = 50) -> List[Trace]:
+        """Các trace mới nhất trước"""
+        with self._lock:
+            return list(reversed(self._traces.values()))[:limit]
+
+
+# Span đang hoạt động trong context hiện tại
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """Tracer tối giản tương thích OTLP, không cần collector bên ngoài
+
+    Khi không có trace đang chạy (hoặc exporter tắt) span() chỉ đọc một ContextVar.
+    """
+
+    def __init__(self, exporter: Optional[SpanExporter] = None):
+        self.exporter = exporter
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    @contextmanager
+    def trace(self, name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+        """Mở một trace mới với span gốc (không làm gì nếu tracing tắt)"""
+        if self.exporter is None:
+            yield None
+            return
+        trace = Trace(name)
+        try:
+            with self._span(trace, name, None, attributes) as span:
+                yield span
+        finally:
+            try:
+                self.exporter.export(trace)
+            except Exception as e:
+                logger.error("Lỗi export trace %s: %s", trace.trace_id, e)
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+        """Span con của span hiện tại (không làm gì nếu không có trace đang chạy)"""
+        parent = _current_span.get()
+        if parent is None:
+            yield None
+            return
+        with self._span(parent.trace, name, parent.span_id, attributes) as span:
+            yield span
+
+    @contextmanager
+    def _span(self, trace: Trace, name: str, parent_id: Optional[str],
+              attributes: Dict[str, Any]) -> Iterator[Span]:
+        span = Span(trace, name, parent_id, attributes)
+        token = _current_span.set(span)
+        error = None
+        try:
+            yield span
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end(error)
+
+    @staticmethod
+    def set_attributes(**attributes: Any) -> None:
+        """Gắn thêm thuộc tính cho span hiện tại"""
+        span = _current_span.get()
+        if span is not None:
+            span.set_attributes(**attributes)
+
+    @staticmethod
+    def current_trace_id() -> Optional[str]:
+        span = _current_span.get()
+        return span.trace.trace_id if span is not None else None
+
+    @staticmethod
+    def wrap(func: Callable[..., Any]) -> Callable[..., Any]:
+        """Gắn span hiện tại vào func để chạy ở thread khác (vd. worker của scheduler)"""
+        parent = _current_span.get()
+        if parent is None:
+            return func
+
+        def run(*args: Any, **kwargs: Any) -> Any:
+            token = _current_span.set(parent)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _current_span.reset(token)
+
+        return run
+
+
+def create_exporter() -> Optional[SpanExporter]:
+    """Tạo exporter theo cấu hình TRACING_EXPORTER"""
+    backend = settings.TRACING_EXPORTER.lower()
+    if backend == "file":
+        return FileSpanExporter()
+    if backend == "memory":
+        return InMemorySpanExporter()
+    if backend not in ("", "none"):
+        logger.warning("TRACING_EXPORTER không hợp lệ: %s, tắt tracing", settings.TRACING_EXPORTER)
+    return None
+
+
+tracer = Tracer(create_exporter())
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Script kiểm tra độ chính xác của backend embedding (ONNX / int8) so với model fp32
+
+So sánh quyết định chọn câu của semantic search cho từng trường trên một mẫu có
+nhãn: tỷ lệ trùng với backend tham chiếu, độ chính xác theo nhãn, cosine giữa
+embedding của hai backend và thời gian encode.
+
+Ví dụ:
+    python check_embedding_backend.py --backend onnx-int8
+    python check_embedding_backend.py --backend torch-int8 --min-agreement 0.95
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from app.models.schemas import DocumentType
+from app.services.ai_service_local import DocumentAnalysis, LocalAIExtractor
+from app.services.embedding_backend import BACKENDS, create_embedding_backend
+from app.services.extraction_plan import KeywordIndex, normalize_rows
+
+# Mẫu có nhãn: trường -> đoạn phải có trong câu được chọn (None = không được chọn câu nào)
+SAMPLES = [
+    {
+        "document_type": DocumentType.THONG_TIN_HO_SO,
+        "text": (
+            "CỘNG HÒA XÃ HỘI CHỦ NGHĨA VIỆT NAM\n"
+            "Độc lập - Tự do - Hạnh phúc\n"
+            "Hồ sơ số 2025/VKTL-001\n"
+            "Tiêu đề hồ sơ Hồ sơ tài liệu điện tử năm 2025\n"
+            "Đơn vị lập hồ sơ Phòng Văn thư - Lưu trữ\n"
+            "Thời hạn bảo quản vĩnh viễn\n"
+            "Ghi chú hồ sơ đã được số hóa"
+        ),
+        "labels": {
+            "so_ho_so": "Hồ sơ số",
+            "tieu_de_ho_so": "Tiêu đề hồ sơ",
+            "don_vi_lap_ho_so": "Đơn vị lập hồ sơ",
+            "thoi_han_bao_quan": "Thời hạn bảo quản",
+            "ghi_chu": "Ghi chú",
+        },
+    },
+    {
+        "document_type": DocumentType.THONG_TIN_HO_SO,
+        "text": (
+            "UBND TỈNH BÌNH DƯƠNG\n"
+            "SỞ NỘI VỤ\n"
+            "Mã hồ sơ 12/HS-SNV\n"
+            "Tên hồ sơ Hồ sơ tuyển dụng viên chức\n"
+            "Cơ quan lập Sở Nội vụ tỉnh Bình Dương\n"
+            "Thời gian bảo quản 20 năm\n"
+            "Tổng số trang 86"
+        ),
+        "labels": {
+            "so_ho_so": "Mã hồ sơ",
+            "tieu_de_ho_so": "Tên hồ sơ",
+            "don_vi_lap_ho_so": "Cơ quan lập",
+            "thoi_han_bao_quan": "bảo quản",
+            "tong_so_trang": "Tổng số trang",
+        },
+    },
+    {
+        "document_type": DocumentType.THONG_TIN_VAN_BAN,
+        "text": (
+            "BỘ TÀI CHÍNH\n"
+            "Văn bản số 215/TB-BTC\n"
+            "Hà Nội, ngày ban hành 15/03/2025\n"
+            "Trích yếu về việc triển khai số hóa tài liệu lưu trữ\n"
+            "Đơn vị ban hành Văn phòng Bộ Tài chính\n"
+            "Người ký Nguyễn Văn An\n"
+            "Loại văn bản thông báo"
+        ),
+        "labels": {
+            "so_van_ban": "Văn bản số",
+            "ngay_ban_hanh": "ngày ban hành",
+            "trich_yeu": "Trích yếu",
+            "don_vi_ban_hanh": "Đơn vị ban hành",
+            "nguoi_ky": "Người ký",
+        },
+    },
+    {
+        "document_type": DocumentType.THONG_TIN_VAN_BAN,
+        "text": (
+            "ỦY BAN NHÂN DÂN QUẬN 1\n"
+            "Số văn bản 88/QĐ-UBND\n"
+            "Tóm tắt nội dung quyết định thành lập tổ công tác chuyển đổi số\n"
+            "Cơ quan ban hành Ủy ban nhân dân Quận 1\n"
+            "Ký tên Trần Thị Bình"
+        ),
+        "labels": {
+            "so_van_ban": "Số văn bản",
+            "trich_yeu": "Tóm tắt nội dung",
+            "don_vi_ban_hanh": "Cơ quan ban hành",
+            "nguoi_ky": "Ký tên",
+        },
+    },
+    {
+        "document_type": DocumentType.MUC_LUC_TAI_LIEU,
+        "text": (
+            "MỤC LỤC VĂN BẢN\n"
+            "Số thứ tự 1\n"
+            "Số ký hiệu 45/BC-VP\n"
+            "Ngày tháng 02/01/2025\n"
+            "Trích yếu nội dung báo cáo tổng kết công tác văn thư năm 2024\n"
+            "Số trang 12\n"
+            "Ghi chú bản chính"
+        ),
+        "labels": {
+            "so_thu_tu": "Số thứ tự",
+            "so_ky_hieu": "Số ký hiệu",
+            "ngay_thang": "Ngày tháng",
+            "trich_yeu_noi_dung": "Trích yếu nội dung",
+            "so_trang": "Số trang",
+            "ghi_chu": "Ghi chú",
+        },
+    },
+]
+
+
+def semantic_decisions(extractor: LocalAIExtractor, encoder, sample) -> dict:
+    """Câu được semantic search chọn cho từng trường có keywords (None nếu dưới ngưỡng)"""
+    plan = extractor.plans.get(sample["document_type"])
+    fields = [field for field in plan.fields if field.keywords]
+    analysis = DocumentAnalysis(sample["text"], extractor.nlp_processor, encoder,
+                                KeywordIndex.build(fields, encoder))
+    decisions = {}
+    for field in fields:
+        _, confidence, sentence = extractor._extract_with_semantic_search(sample["text"], field, analysis)
+        decisions[field.name] = sentence if confidence > 0 else None
+    return decisions
+
+
+def label_matches(expected, sentence) -> bool:
+    if expected is None:
+        return sentence is None
+    return sentence is not None and expected.lower() in sentence.lower()
+
+
+def evaluate(extractor: LocalAIExtractor, backend):
+    """(quyết định theo mẫu, số nhãn đúng, tổng số nhãn)"""
+    extractor.encoder = backend.encode
+    decisions = [semantic_decisions(extractor, backend.encode, sample) for sample in SAMPLES]
+    correct = total = 0
+    for sample, decided in zip(SAMPLES, decisions):
+        for field, expected in sample["labels"].items():
+            if field in decided:
+                total += 1
+                correct += label_matches(expected, decided[field])
+    return decisions, correct, total
+
+
+def encode_time(backend, sentences, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        backend.encode(sentences)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Kiểm tra backend embedding so với model fp32")
+    parser.add_argument("--backend", choices=BACKENDS, default="onnx-int8", help="Backend cần kiểm tra")
+    parser.add_argument("--reference", choices=BACKENDS, default="torch", help="Backend tham chiếu (fp32)")
+    parser.add_argument("--min-agreement", type=float, default=0.95,
+                        help="Tỷ lệ quyết định trùng tối thiểu để đạt")
+    args = parser.parse_args()
+
+    print("🔬 Kiểm tra backend embedding")
+    print("=" * 72)
+    reference = create_embedding_backend(backend=args.reference)
+    candidate = create_embedding_backend(backend=args.backend)
+    if reference is None or candidate is None:
+        print("❌ Không tạo được backend (thiếu sentence-transformers/onnxruntime)")
+        return 2
+    if candidate.name == reference.name:
+        print(f"⚠️  Backend {args.backend} không khả dụng, đang dùng {candidate.name} (giống tham chiếu)")
+
+    extractor = LocalAIExtractor()
+    ref_decisions, ref_correct, total = evaluate(extractor, reference)
+    cand_decisions, cand_correct, _ = evaluate(extractor, candidate)
+
+    agree = compared = 0
+    for sample_index, (ref, cand) in enumerate(zip(ref_decisions, cand_decisions)):
+        for field, sentence in ref.items():
+            compared += 1
+            if cand.get(field) == sentence:
+                agree += 1
+            else:
+                print(f"  ≠ mẫu {sample_index + 1}, {field}: {sentence!r} -> {cand.get(field)!r}")
+    agreement = agree / compared if compared else 1.0
+
+    sentences = [s for sample in SAMPLES for s in DocumentAnalysis(sample["text"], None).sentences]
+    cosines = np.sum(normalize_rows(reference.encode(sentences)) * normalize_rows(candidate.encode(sentences)), axis=1)
+
+    print(f"{'Backend':<12} {'Đúng nhãn':>12} {'Encode (ms)':>14}")
+    print(f"{reference.name:<12} {ref_correct:>6}/{total:<5} {encode_time(reference, sentences):>14.2f}")
+    print(f"{candidate.name:<12} {cand_correct:>6}/{total:<5} {encode_time(candidate, sentences):>14.2f}")
+    print(f"Quyết định trùng với {reference.name}: {agree}/{compared} ({agreement:.1%})")
+    print(f"Cosine embedding {candidate.name} vs {reference.name}: min {cosines.min():.4f}, trung bình {cosines.mean():.4f}")
+
+    if agreement < args.min_agreement:
+        print(f"❌ Không đạt: tỷ lệ trùng dưới {args.min_agreement:.0%}")
+        return 1
+    print("✅ Đạt")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
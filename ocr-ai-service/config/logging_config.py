@@ -0,0 +1,134 @@
+import atexit
+import copy
+import json
+import logging
+import queue
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Optional
+
+from config.settings import settings
+
+# Thuộc tính chuẩn của LogRecord, phần còn lại (extra=...) được đưa vào JSON
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JSONFormatter(logging.Formatter):
+    """Mỗi record một dòng JSON (ts, level, logger, message, thread, extra, exc_info)"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Chỉ giữ 1/N record dưới WARNING của các logger được chỉ định (log theo từng trang)
+
+    WARNING trở lên luôn được giữ. Đếm theo từng logger nên mỗi module được lấy mẫu đều.
+    """
+
+    def __init__(self, loggers: List[str], rate: float):
+        super().__init__()
+        self.prefixes = tuple(loggers)
+        self.every = max(1, round(1 / rate)) if rate > 0 else 0
+        self._counters: Dict[str, int] = {}
+
+    def _sampled(self, name: str) -> bool:
+        return any(name == prefix or name.startswith(prefix + ".") for prefix in self.prefixes)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self._sampled(record.name):
+            return True
+        if self.every == 0:
+            return False
+        # Đếm không cần lock: sai lệch nhỏ khi nhiều worker ghi cùng lúc là chấp nhận được
+        count = self._counters.get(record.name, 0)
+        self._counters[record.name] = count + 1
+        return count % self.every == 0
+
+
+_exception_formatter = logging.Formatter()
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler không format ở thread gọi và không chặn khi hàng đợi đầy
+
+    QueueHandler chuẩn format cả dòng log trong prepare(); ở đây chỉ ghép msg % args
+    (và traceback nếu có) để record không giữ tham chiếu tới args/exc_info mutable,
+    còn format dòng log và ghi I/O diễn ra ở thread của QueueListener.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: Optional[QueueListener] = None
+_lock = threading.Lock()
+
+
+def setup_logging() -> Optional[QueueListener]:
+    """Cấu hình root logger: QueueHandler ở thread gọi, ghi stdout ở thread listener"""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return _listener
+
+        formatter = JSONFormatter() if settings.LOG_JSON else logging.Formatter(settings.LOG_FORMAT)
+        output = logging.StreamHandler()
+        output.setFormatter(formatter)
+
+        log_queue: queue.Queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+        queue_handler = NonBlockingQueueHandler(log_queue)
+        sampled = [name.strip() for name in settings.LOG_SAMPLED_LOGGERS.split(",") if name.strip()]
+        if sampled and settings.LOG_SAMPLE_RATE < 1:
+            queue_handler.addFilter(SamplingFilter(sampled, settings.LOG_SAMPLE_RATE))
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(getattr(logging, settings.LOG_LEVEL))
+
+        _listener = QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+        return _listener
+
+
+def shutdown_logging() -> None:
+    """Dừng listener sau khi ghi hết các record còn trong hàng đợi"""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
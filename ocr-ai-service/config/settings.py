@@ -26,6 +26,24 @@ class Settings(BaseSettings):
     AI_MODEL: str = "gpt-3.5-turbo"  # Model AI sử dụng
     AI_MAX_TOKENS: int = 2000
     AI_TEMPERATURE: float = 0.1
+    SEMANTIC_MODEL: str = "paraphrase-multilingual-MiniLM-L12-v2"  # Model SentenceTransformer cho semantic search
+    EMBEDDING_BACKEND: str = "torch"  # torch | torch-int8 | onnx | onnx-int8
+    EMBEDDING_THREADS: int = 0  # Số thread CPU cho model embedding (0 = mặc định của runtime)
+    EMBEDDING_BATCH_SIZE: int = 32  # Số câu mỗi batch (câu được sắp theo độ dài để giảm padding)
+    EXTRACTION_BATCH_SENTENCES: int = 256  # process_documents: số câu tối đa encode chung một lần cho nhiều tài liệu
+    EXTRACTION_BATCH_DOCUMENTS: int = 64  # process_documents: số tài liệu tối đa giữ trong bộ nhớ mỗi batch
+    EMBEDDING_MAX_SEQ_LENGTH: int = 128  # Số token tối đa mỗi câu
+    EMBEDDING_ONNX_DIR: str = "data/onnx"  # Thư mục model ONNX đã export/lượng tử hóa
+    KEYWORD_PREFILTER: bool = True  # Bỏ qua NER/semantic search cho trường không có keyword trong text
+    KEYWORD_WINDOW_SENTENCES: int = 1  # Số câu trước/sau câu chứa keyword được dùng làm ứng viên semantic search
+    SEMANTIC_SHORTLIST_K: int = 5  # Số câu (lọc bằng TF-IDF n-gram ký tự) mỗi trường được xếp hạng lại bằng embedding (0 = tắt)
+    REGEX_ENGINE: str = "auto"  # auto | re2 | regex | re: engine regex trường (auto = an toàn nhất có sẵn)
+    REGEX_TIME_BUDGET: float = 2.0  # Giây dành cho regex trường của mỗi tài liệu (0 = không giới hạn)
+    
+    # Cache embedding câu (LRU trong bộ nhớ + file memory-mapped trên đĩa)
+    EMBEDDING_CACHE_MEMORY_ENTRIES: int = 10000  # Số embedding giữ trong bộ nhớ (0 = tắt tầng bộ nhớ)
+    EMBEDDING_CACHE_DISK_ENTRIES: int = 20000  # Số slot file cache trên đĩa, mỗi slot 24 + 4*dim bytes (0 = tắt)
+    EMBEDDING_CACHE_DIR: str = "data/embeddings"  # Thư mục file cache embedding
     
     # File settings
     MAX_FILE_SIZE: int = 50 * 1024 * 1024  # 50MB
@@ -43,9 +61,55 @@ class Settings(BaseSettings):
     MIN_CONFIDENCE_SCORE: float = 0.7
     HIGH_CONFIDENCE_SCORE: float = 0.9
     
+    # Admission control (tính theo số trang, không theo số request)
+    ADMISSION_MAX_PAGES: int = 200  # Tổng số trang đang chờ + đang xử lý tối đa
+    ADMISSION_DEFAULT_SECONDS_PER_PAGE: float = 2.0  # Ước lượng ban đầu thời gian xử lý mỗi trang
+    ADMISSION_EWMA_ALPHA: float = 0.2  # Hệ số làm mượt ước lượng thời gian mỗi trang
+    ADMISSION_MAX_RETRY_AFTER: int = 300  # Giá trị Retry-After tối đa (giây)
+    
+    # Scheduler theo trang
+    OCR_WORKERS: int = 2  # Số worker OCR (mỗi worker rasterize + OCR một trang tại một thời điểm)
+    SCHEDULER_INTERACTIVE_WEIGHT: int = 4  # Số lượt INTERACTIVE liên tiếp trước khi nhường 1 lượt cho BULK
+    SCHEDULER_INTERACTIVE_MAX_PAGES: int = 5  # Tài liệu tối đa số trang này mặc định là INTERACTIVE
+    CLIENT_ID_HEADERS: str = "X-API-Key,X-Client-ID"  # Header dùng để xác định client (theo thứ tự)
+    
+    # Document store
+    DOCUMENT_STORE: str = "sqlite"  # sqlite | memory
+    DOCUMENT_STORE_PATH: str = "data/documents.db"  # File SQLite (dùng chung giữa các worker)
+    DOCUMENT_STORE_COMPRESSION_LEVEL: int = 6  # Mức nén zlib cho OCR text
+    DOCUMENT_STORE_BUSY_TIMEOUT: float = 5.0  # Thời gian chờ khóa ghi SQLite (giây)
+    DOCUMENT_STORE_MAX_RESIDENT_MB: int = 256  # Giới hạn payload đầy đủ trong bộ nhớ (store memory)
+    DOCUMENT_SPILL_DIR: str = "data/spill"  # Thư mục spill payload khi vượt giới hạn bộ nhớ
+    
+    # Response
+    RESPONSE_COMPRESSION_MIN_SIZE: int = 1024  # Chỉ nén response lớn hơn ngưỡng này (bytes)
+    RESPONSE_GZIP_LEVEL: int = 6  # Mức nén gzip
+    RESPONSE_BROTLI_QUALITY: int = 4  # Mức nén brotli (nếu có cài brotli)
+    OCR_PAGE_MAX_LIMIT: int = 100  # Số trang OCR tối đa mỗi response khi phân trang
+    WORD_GRID_SIZE: int = 32  # Số ô mỗi chiều của grid index vị trí từ trên trang
+    
+    # Retention
+    DOCUMENT_TTL_HOURS: float = 24  # Thời gian giữ tài liệu (0 = không tự động xóa)
+    RETENTION_CHECK_INTERVAL: float = 60.0  # Chu kỳ kiểm tra tối đa của retention manager (giây)
+    
+    # Profiling theo yêu cầu
+    PROFILING_TOKEN: Optional[str] = None  # Token cho header X-Profile-Token/query profile (để trống = tắt)
+    PROFILING_DIR: str = "profiles"  # Thư mục lưu file .prof và .folded
+    PROFILING_MIN_INTERVAL: float = 60.0  # Khoảng cách tối thiểu giữa hai lần profile trong một process (giây)
+    PROFILING_SAMPLE_INTERVAL: float = 0.005  # Chu kỳ lấy mẫu stack (giây)
+    
+    # Tracing (định dạng OTLP/JSON, không cần collector bên ngoài)
+    TRACING_EXPORTER: str = "none"  # none | file | memory
+    TRACING_FILE: str = "data/traces.jsonl"  # File trace khi TRACING_EXPORTER=file
+    TRACING_MAX_TRACES: int = 200  # Số trace giữ lại khi TRACING_EXPORTER=memory
+    
     # Logging
     LOG_LEVEL: str = "INFO"
     LOG_FORMAT: str = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    LOG_JSON: bool = False  # Ghi log dạng JSON mỗi dòng (thay cho LOG_FORMAT)
+    LOG_QUEUE_SIZE: int = 10000  # Số record tối đa chờ ghi, vượt quá thì bỏ (không chặn worker)
+    LOG_SAMPLED_LOGGERS: str = "app.services.ocr_service,app.services.ocr_service_advanced,app.services.ocr_service_mock"  # Logger log theo từng trang
+    LOG_SAMPLE_RATE: float = 0.1  # Tỷ lệ giữ lại log INFO/DEBUG của các logger trên (WARNING trở lên luôn giữ)
     
     class Config:
         env_file = ".env"
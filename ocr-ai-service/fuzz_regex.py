@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Script fuzz/benchmark regex trích xuất trường với text OCR bất thường
+
+1. Tương đương: mọi pattern trường (local plan + rule-based) cho cùng kết quả
+   (vị trí match và các nhóm) trên mọi engine so với re, với text ngẫu nhiên.
+2. Độ tăng thời gian: một lần search trên text bất thường dài dần theo từng engine
+   (re/regex tăng bậc hai, re2 tuyến tính).
+3. Ngân sách: quét toàn bộ pattern của một tài liệu bất thường với RegexBudget
+   không được vượt quá ngân sách (engine re không dừng được giữa chừng, chỉ báo cáo).
+
+Ví dụ:
+    python fuzz_regex.py
+    python fuzz_regex.py --samples 2000 --sizes 10000 20000 40000 --budget 0.5
+"""
+import argparse
+import random
+import re
+import sys
+import time
+
+from app.models.schemas import DocumentType
+from app.services.ai_service import RULE_PATTERNS
+from app.services.ai_service_local import LocalAIExtractor
+from app.services.safe_regex import ENGINES, RegexBudget, SafePattern
+
+# Mảnh text OCR: keyword, số, ngày, dấu câu, khoảng trắng Unicode, chữ số không phải ASCII
+TOKENS = [
+    "Số", "SỐ", "số", "Hồ sơ số", "Văn bản số", "Ngày", "ngày ban hành", "Trang", "trang",
+    "Tiêu đề", "Nội dung", "Trích yếu", "Đơn vị", "Ban hành", "Người ký", "Ký", "v/v", "về",
+    "thời hạn", "bảo quản", "vĩnh viễn", "năm", "phòng", "sở", "UBND", "Nguyễn Văn An",
+    "12", "2025", "45/BC-VP", "15/03/2025", "1-2-2024", "٣٤", "①", "x_y", "a-b/c",
+    ":", ": ", ".", ",", "/", "-", "\n", "\n\n", " ", "  ", "\t", "\xa0", "　", "\x0b",
+]
+
+NOISE = "aăâbcdđeêghiklmnoôơpqrstuưvxyáàảãạấầẩẫậéèẻẽẹốồổỗộớờởỡợúùủũụứừửữựíìỉĩị "
+
+
+def field_patterns():
+    """(tên, source, flags) của mọi pattern trường"""
+    extractor = LocalAIExtractor()
+    patterns = {}
+    for document_type in DocumentType:
+        for field in extractor.plans.get(document_type).fields:
+            for pattern in field.patterns:
+                patterns[(pattern.pattern, pattern.flags)] = field.name
+    for field_name, compiled in RULE_PATTERNS.items():
+        for pattern in compiled:
+            patterns[(pattern.pattern, pattern.flags)] = field_name
+    return [(name, source, flags) for (source, flags), name in patterns.items()]
+
+
+def random_text(rng: random.Random, length: int) -> str:
+    parts = []
+    for _ in range(length):
+        if rng.random() < 0.2:
+            parts.append("".join(rng.choice(NOISE) for _ in range(rng.randint(1, 8))))
+        else:
+            parts.append(rng.choice(TOKENS))
+        if rng.random() < 0.5:
+            parts.append(" ")
+    return "".join(parts)
+
+
+def adversarial_texts(size: int) -> dict:
+    """Text bất thường dài khoảng size ký tự"""
+    rng = random.Random(size)
+    noise = "".join(rng.choice(NOISE) for _ in range(size))
+    return {
+        "keyword không có số": ("Số hiệu văn bản không rõ " * (size // 25 + 1))[:size],
+        "một dòng không dấu hai chấm": ("Tiêu đề Nội dung Người ký Đơn vị " * (size // 33 + 1))[:size],
+        "tiền tố keyword lặp": ("Ngày Trang Số Hồ sơ số Văn bản số " * (size // 34 + 1))[:size],
+        "nhiễu tiếng Việt": noise,
+    }
+
+
+def match_signature(pattern: SafePattern, match):
+    if match is None:
+        return None
+    return tuple(match.span(group) for group in range(pattern.groups + 1))
+
+
+def check_equivalence(patterns, samples: int, seed: int) -> int:
+    """Số trường hợp engine khác kết quả với re"""
+    rng = random.Random(seed)
+    compiled = []
+    for name, source, flags in patterns:
+        variants = [SafePattern(source, flags, engine=engine) for engine in ENGINES]
+        # Dạng đã hạ chữ thường mà PatternScanner dùng
+        if source == source.lower():
+            folded = [SafePattern(source, flags & ~re.IGNORECASE, engine=engine) for engine in ENGINES]
+            compiled.append((name, variants, folded))
+        else:
+            compiled.append((name, variants, None))
+
+    mismatches = 0
+    for _ in range(samples):
+        text = random_text(rng, rng.randint(1, 60))
+        for name, variants, folded in compiled:
+            for group, target in ((variants, text), (folded, text.lower())):
+                if group is None:
+                    continue
+                reference = group[-1]
+                expected = match_signature(reference, reference.search(target))
+                for pattern in group[:-1]:
+                    got = match_signature(pattern, pattern.search(target))
+                    if got != expected:
+                        mismatches += 1
+                        if mismatches <= 10:
+                            print(f"  ≠ {name} [{pattern.engine}] {pattern.pattern!r} trên {target!r}: "
+                                  f"{got} != {expected}")
+    return mismatches
+
+
+def worst_search(patterns, text: str, engine: str) -> float:
+    """Thời gian (giây) của lần search chậm nhất trong các pattern trên text"""
+    worst = 0.0
+    for _, source, flags in patterns:
+        pattern = SafePattern(source, flags, engine=engine)
+        start = time.perf_counter()
+        pattern.search(text)
+        worst = max(worst, time.perf_counter() - start)
+    return worst
+
+
+def benchmark_growth(patterns, sizes):
+    engines = sorted({SafePattern("a", engine=engine).engine for engine in ENGINES}, key=ENGINES.index)
+    print(f"{'Text':<30} {'Ký tự':>8} " + " ".join(f"{engine + ' (ms)':>12}" for engine in engines))
+    for size in sizes:
+        for name, text in adversarial_texts(size).items():
+            timings = [worst_search(patterns, text, engine) * 1000 for engine in engines]
+            print(f"{name:<30} {size:>8} " + " ".join(f"{timing:>12.1f}" for timing in timings))
+
+
+def check_budget(patterns, size: int, seconds: float) -> bool:
+    """Quét mọi pattern với RegexBudget; engine an toàn phải dừng trong ngân sách"""
+    slack = 0.25
+    ok = True
+    for engine in ENGINES:
+        compiled = [SafePattern(source, flags, engine=engine) for _, source, flags in patterns]
+        actual = compiled[0].engine if compiled else engine
+        if actual != engine:
+            continue
+        for name, text in adversarial_texts(size).items():
+            budget = RegexBudget(seconds)
+            start = time.perf_counter()
+            for pattern in compiled:
+                budget.search(pattern, text)
+            elapsed = time.perf_counter() - start
+            bounded = engine != "re"
+            failed = bounded and elapsed > seconds + slack
+            ok = ok and not failed
+            status = "❌" if failed else ("✅" if bounded else "ℹ️ ")
+            print(f"  {status} {engine:<6} {name:<30} {elapsed:>8.3f}s"
+                  f"{' (hết ngân sách)' if budget.exceeded else ''}")
+    return ok
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Fuzz/benchmark regex trường với text OCR bất thường")
+    parser.add_argument("--samples", type=int, default=500, help="Số text ngẫu nhiên kiểm tra tương đương")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5000, 10000, 20000],
+                        help="Độ dài text bất thường khi đo thời gian")
+    parser.add_argument("--budget", type=float, default=0.5, help="Ngân sách (giây) khi kiểm tra RegexBudget")
+    parser.add_argument("--budget-size", type=int, default=100000, help="Độ dài text khi kiểm tra ngân sách")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print("🧪 Fuzz regex trích xuất trường")
+    print("=" * 72)
+    patterns = field_patterns()
+    engines = {SafePattern(source, flags).engine for _, source, flags in patterns}
+    print(f"{len(patterns)} pattern, engine mặc định: {', '.join(sorted(engines))}")
+
+    print("\n1. Tương đương kết quả với re")
+    mismatches = check_equivalence(patterns, args.samples, args.seed)
+    print(f"  {'✅' if not mismatches else '❌'} {mismatches} khác biệt trên {args.samples} text")
+
+    print("\n2. Thời gian search chậm nhất theo độ dài text")
+    benchmark_growth(patterns, args.sizes)
+
+    print(f"\n3. Ngân sách {args.budget}s, text {args.budget_size} ký tự")
+    budget_ok = check_budget(patterns, args.budget_size, args.budget)
+
+    return 0 if not mismatches and budget_ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,17 +3,18 @@ import time
 import uvicorn
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from contextlib import asynccontextmanager
 
-from app.api.routes import router
+from app.api.routes import router, document_service, admission_controller
+from app.api.middleware import UploadAdmissionMiddleware
+from app.api.responses import FastJSONResponse
+from app.services.metrics_service import registry
 from config.settings import settings
+from config.logging_config import setup_logging
 
-# Cấu hình logging
-logging.basicConfig(
-    level=getattr(logging, settings.LOG_LEVEL),
-    format=settings.LOG_FORMAT
-)
+# Cấu hình logging (ghi log qua hàng đợi, không chặn thread xử lý)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 @asynccontextmanager
@@ -21,14 +22,17 @@ async def lifespan(app: FastAPI):
     """Quản lý lifecycle của ứng dụng"""
     # Startup
     logger.info("Khởi động OCR-AI Service...")
-    logger.info(f"Version: {settings.VERSION}")
-    logger.info(f"Debug mode: {settings.DEBUG}")
-    logger.info(f"OpenAI API: {'Enabled' if settings.OPENAI_API_KEY else 'Disabled'}")
+    logger.info("Version: %s", settings.VERSION)
+    logger.info("Debug mode: %s", settings.DEBUG)
+    logger.info("OpenAI API: %s", 'Enabled' if settings.OPENAI_API_KEY else 'Disabled')
+    document_service.retention.start()
     
     yield
     
     # Shutdown
     logger.info("Tắt OCR-AI Service...")
+    document_service.retention.stop()
+    document_service.scheduler.shutdown()
 
 # Tạo FastAPI app
 app = FastAPI(
@@ -36,10 +40,18 @@ app = FastAPI(
     version=settings.VERSION,
     description=settings.DESCRIPTION,
     lifespan=lifespan,
+    default_response_class=FastJSONResponse,
     docs_url="/docs",
     redoc_url="/redoc"
 )
 
+# Từ chối upload quá lớn hoặc khi quá tải trước khi đọc body (middleware trong cùng)
+app.add_middleware(
+    UploadAdmissionMiddleware,
+    path=f"{settings.API_V1_STR}/documents/process",
+    admission=admission_controller
+)
+
 # Middleware CORS
 app.add_middleware(
     CORSMiddleware,
@@ -52,18 +64,14 @@ app.add_middleware(
 # Middleware để log requests
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    """Log các request"""
-    start_time = time.time()
-    
-    # Log request
-    logger.info(f"Request: {request.method} {request.url}")
+    """Log mỗi request một dòng (chỉ path, không kèm query string)"""
+    start_time = time.perf_counter()
     
     # Xử lý request
     response = await call_next(request)
     
-    # Log response
-    process_time = time.time() - start_time
-    logger.info(f"Response: {response.status_code} - {process_time:.4f}s")
+    process_time = time.perf_counter() - start_time
+    logger.info("%s %s -> %d (%.4fs)", request.method, request.url.path, response.status_code, process_time)
     
     return response
 
@@ -78,14 +86,21 @@ async def root():
         "message": "OCR-AI Service API",
         "version": settings.VERSION,
         "docs": "/docs",
-        "health": f"{settings.API_V1_STR}/health"
+        "health": f"{settings.API_V1_STR}/health",
+        "metrics": "/metrics"
     }
 
+# Prometheus metrics
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Metrics theo định dạng text của Prometheus"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # Global exception handler
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     """Xử lý lỗi toàn cục"""
-    logger.error(f"Unhandled exception: {str(exc)}")
+    logger.error("Unhandled exception: %s", exc)
     return JSONResponse(
         status_code=500,
         content={